@@ -0,0 +1,257 @@
+"""
+Benchmarks of the Board hot path, run under CPython with the emulation layer
+
+For synthetic boards with 1 to 500 interfaces, this measures:
+
+    cycles/s:       full read + publish cycles (Board.once(force=True)) per second
+    allocs/cycle:   blocks allocated by deviceos per cycle, and not freed
+    peak B/cycle:   median peak heap growth during a single cycle
+    discovery ms:   time for a full (forced) discovery burst
+    discovery B:    bytes written to the broker by that discovery
+    wire B/cycle:   bytes written to the broker per cycle
+
+Usage:
+
+    python benchmarks/bench_board.py
+    python benchmarks/bench_board.py --json results.json
+    python benchmarks/bench_board.py --baseline results.json --tolerance 0.2
+
+With --baseline, the exit status is 1 if any result is worse than the baseline
+by more than the tolerance (bytes must match exactly)
+"""
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emulation  # noqa: E402  pylint: disable=wrong-import-position
+
+emulation.install()
+
+# pylint: disable=wrong-import-position
+from deviceos.board import Board  # noqa: E402
+from deviceos.devices.device import Device  # noqa: E402
+from deviceos.devices.io.output import Output  # noqa: E402
+
+
+SIZES = (1, 10, 50, 100, 500)
+# interfaces per synthetic device
+PER_DEVICE = 10
+
+# metric: True if higher is better
+METRICS = {
+    "cycles_per_s": True,
+    "allocs_per_cycle": False,
+    "peak_bytes_per_cycle": False,
+    "discovery_ms": False,
+    "discovery_bytes": False,
+    "wire_bytes_per_cycle": False,
+}
+# metrics which are deterministic, and must match the baseline exactly
+EXACT = ("discovery_bytes", "wire_bytes_per_cycle")
+# absolute changes which are within the noise, whatever the tolerance
+NOISE = {"allocs_per_cycle": 1, "peak_bytes_per_cycle": 1024, "discovery_ms": 1}
+
+
+class Synthetic(Device):
+    """
+    Device with `count` outputs, whose values change on every read
+
+    Values alternate without changing length, so payload sizes are stable
+    """
+
+    def __init__(self, name: str, count: int):
+        super().__init__(name=name, interval=0)
+        self.interfaces = [
+            Output(name=f"{name}_{index}", unit="C", icon="mdi:thermometer")
+            for index in range(count)
+        ]
+        self._names = [interface.name for interface in self.interfaces]
+        self._step = 0
+
+    def read(self):
+        self._step += 1
+        step = self._step
+        return {
+            name: 10 + (step & 1) + index * 0.25
+            for index, name in enumerate(self._names)
+        }
+
+
+def build_board(size: int) -> Board:
+    """Create a connected Board with `size` interfaces over synthetic devices"""
+    emulation.install(emulation.Backend())
+    board = Board(
+        wlan_ssid="ssid",
+        wlan_pass="pass",
+        mqtt_host="broker",
+        mqtt_user="user",
+        mqtt_pass="pass",
+        name=f"bench_{size}",
+        backoff_min_ms=1,
+    )
+    index = 0
+    remaining = size
+    while remaining:
+        count = min(PER_DEVICE, remaining)
+        board.add_device(Synthetic(f"synthetic{index}", count))
+        remaining -= count
+        index += 1
+    return board
+
+
+def bench_size(size: int, duration: float) -> dict:
+    """Run every benchmark on a board with `size` interfaces"""
+    board = build_board(size)
+    broker = emulation.current().broker
+
+    # best of several, as a single burst is short enough to be noisy
+    discovery_ms = None
+    for _ in range(5):
+        broker.reset_stats()
+        start = time.perf_counter()
+        board.discover(force=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if discovery_ms is None or elapsed < discovery_ms:
+            discovery_ms = elapsed
+    discovery_bytes = broker.bytes_in
+
+    # warm up caches (topics, encoder keys, buffer growth)
+    for _ in range(3):
+        board.once(force=True)
+
+    broker.reset_stats()
+    cycles = 0
+    start = time.perf_counter()
+    end = start + duration
+    while time.perf_counter() < end:
+        board.once(force=True)
+        cycles += 1
+    elapsed = time.perf_counter() - start
+    wire_bytes = broker.bytes_in / cycles
+
+    # the broker message log grows with every publish, so is excluded
+    broker.messages = _Discard()
+
+    # blocks still allocated from deviceos code after many cycles, so that
+    # anything accumulating per cycle shows up
+    samples = 50
+    gc.collect()
+    tracemalloc.start()
+    before = _deviceos_blocks(tracemalloc.take_snapshot())
+    for _ in range(samples):
+        board.once(force=True)
+    gc.collect()
+    allocs = (_deviceos_blocks(tracemalloc.take_snapshot()) - before) / samples
+
+    peaks = []
+    for _ in range(samples):
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        board.once(force=True)
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    peak = sorted(peaks)[len(peaks) // 2]
+
+    return {
+        "cycles_per_s": cycles / elapsed,
+        "allocs_per_cycle": allocs,
+        "peak_bytes_per_cycle": peak,
+        "discovery_ms": discovery_ms,
+        "discovery_bytes": discovery_bytes,
+        "wire_bytes_per_cycle": wire_bytes,
+    }
+
+
+def _deviceos_blocks(snapshot: tracemalloc.Snapshot) -> int:
+    """Returns the number of blocks allocated from within deviceos"""
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(True, "*deviceos*")])
+    return sum(stat.count for stat in snapshot.statistics("filename"))
+
+
+class _Discard(list):
+    """List which drops anything appended"""
+
+    def append(self, item) -> None:
+        pass
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of each result worse than `baseline`"""
+    regressions = []
+    for size, result in results.items():
+        if size not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old = baseline[size].get(metric)
+            new = result[metric]
+            if old is None:
+                continue
+            if metric in EXACT:
+                worse = new > old
+            elif higher_is_better:
+                worse = new < old * (1 - tolerance)
+            else:
+                slack = NOISE.get(metric, 0)
+                worse = new > max(old * (1 + tolerance), old + slack)
+            if worse:
+                regressions.append(f"{size} interfaces: {metric} {old:.1f} -> {new:.1f}")
+    return regressions
+
+
+def main(argv: list | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--sizes",
+        type=lambda text: [int(size) for size in text.split(",")],
+        default=SIZES,
+        help="comma separated interface counts",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="seconds to time cycles for"
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against a previous --json file")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed fractional regression"
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.sizes:
+        # the board prints every publish, which would dominate the timings
+        with open(os.devnull, "w", encoding="utf8") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                results[str(size)] = bench_size(size, args.duration)
+
+    columns = list(METRICS)
+    print(f"{'interfaces':>10}  " + "  ".join(f"{name:>20}" for name in columns))
+    for size, result in results.items():
+        print(f"{size:>10}  " + "  ".join(f"{result[name]:>20.1f}" for name in columns))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf8") as o:
+            json.dump(results, o, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf8") as o:
+            baseline = json.load(o)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            return 1
+        print("no regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
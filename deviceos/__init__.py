@@ -1,9 +1,24 @@
-from deviceos.board.board import Board
-from deviceos.devices.device import Device
-from deviceos.devices.io.output import Output
+__all__ = ["AnalogDevice", "Board", "Calibration", "Device", "Output"]
 
 
-__all__ = ["Board", "Device", "Output"]
+__version__ = "0.0.2"
 
 
-__version__ = "0.0.2"
+# name: module, imported on first access so that importing a device module
+# does not also pull in the Board and its networking
+_LAZY = {
+    "AnalogDevice": "deviceos.devices.analog",
+    "Board": "deviceos.board.board",
+    "Calibration": "deviceos.devices.io.calibration",
+    "Device": "deviceos.devices.device",
+    "Output": "deviceos.devices.io.output",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(name)
+    value = getattr(__import__(module, None, None, [name]), name)
+    globals()[name] = value
+    return value
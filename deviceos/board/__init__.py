@@ -1,3 +1,4 @@
+from deviceos.board.backlog import Backlog
 from deviceos.board.board import Board
 
-__all__ = ["Board"]
+__all__ = ["Backlog", "Board"]
@@ -0,0 +1,191 @@
+"""
+Mixin class providing an asyncio runtime for the Board
+"""
+
+import time
+
+# imported by load_asyncio(), so boards using run() never pay for it
+asyncio = None
+
+
+def load_asyncio() -> None:
+    """Import asyncio (or uasyncio on older firmware), on first use"""
+    global asyncio  # pylint: disable=global-statement
+    if asyncio is not None:
+        return
+    try:
+        import asyncio as module  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        import uasyncio as module  # pylint: disable=import-error,import-outside-toplevel
+    asyncio = module
+
+
+class AsyncMixin:
+    """
+    Adds Board.run_async(), an alternative to Board.run()
+
+    Each device is sampled by its own task, so a slow read() (or an
+    `async def read()`) no longer holds up the others. Incoming commands are
+    served by a reader task, and publishes are queued for a writer task.
+    """
+
+    # attributes are declared in the Board __slots__
+    __slots__ = ()
+
+    @property
+    def is_async(self) -> bool:
+        """Returns True if the board is running under run_async()"""
+        return self._publish_queue is not None
+
+    def queue_publish(self, topic: str, message: str, retain: bool = False) -> None:
+        """Queue a message for the writer task"""
+        if isinstance(message, memoryview):
+            # the encoder buffer is reused, so take a copy
+            message = bytes(message)
+        self._publish_queue.append((topic, message, retain))
+        self._publish_event.set()
+
+    def refresh(self) -> None:
+        """Schedule a read and publish of the devices flagged by mark_dirty()"""
+        asyncio.create_task(self._refresh_task())
+
+    def run_async(self) -> None:
+        """Run, forever, under asyncio"""
+        load_asyncio()
+        asyncio.run(self.main_async())
+
+    async def main_async(self) -> None:
+        """Create and run the device, publish and MQTT tasks"""
+        print("running (async)")
+        load_asyncio()
+        self.start_watchdog()
+
+        self._publish_queue = []
+        self._publish_event = asyncio.Event()
+
+        tasks = [self._device_task(sensor) for sensor in self.sensors]
+        tasks.append(self._publish_task())
+        if self.backlog is not None:
+            tasks.append(self._backlog_task())
+        tasks.append(self._mqtt_reader_task())
+        tasks.append(self._mqtt_writer_task())
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self._publish_queue = None
+
+    async def _device_task(self, device: "Device") -> None:
+        """Sample `device` every `device.interval` seconds"""
+        interval_ms = int(device.interval * 1000)
+        while True:
+            start = time.ticks_ms()
+            await device.sample_async()
+
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            await asyncio.sleep(max(0, interval_ms - elapsed) / 1000)
+
+    async def _publish_task(self) -> None:
+        """Publish the merged state every `interval` seconds"""
+        interval_ms = int(self.interval * 1000)
+        # let the device tasks take their first reading
+        await asyncio.sleep(0)
+        while True:
+            start = time.ticks_ms()
+            self.publish_state()
+
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+            await asyncio.sleep(max(0, interval_ms - elapsed) / 1000)
+
+    async def _backlog_task(self) -> None:
+        """Replay stored messages, rate limited"""
+        while True:
+            self.replay_backlog()
+            await asyncio.sleep(1)
+
+    async def _refresh_task(self) -> None:
+        while self._dirty:
+            device = self._dirty.pop(0)
+            await device.sample_async(track=False)
+            self.publish_device(device, force=True)
+
+    async def flush_pipeline_async(self, timeout_ms: int = 10000) -> list:
+        """
+        As MQTTMixin.flush_pipeline(), but yielding to the other tasks while
+        waiting for PUBACKs
+        """
+        pipeline = self.pipeline
+        timeout_ms = self.watchdog_timeout(timeout_ms)
+        start = time.ticks_ms()
+        while pipeline.pending and self.online:
+            self.feed_watchdog()
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                break
+            if pipeline.exhausted:
+                break
+            try:
+                pipeline.pump(self.mqtt)
+                while self.online and self.check_msg() is not None:
+                    pass
+            except OSError as exc:
+                print(f"OSError: {str(exc)}, entering reset state")
+                self.enter_reset()
+                break
+            if pipeline.pending:
+                await asyncio.sleep(0.02)
+
+        failed = pipeline.end_burst()
+        print(f"publish burst: {pipeline.last_burst}")
+        return failed
+
+    async def discover_async(self, force: bool = False) -> None:
+        """As Board.discover(), without blocking the other tasks"""
+        self.start_discovery(force=force)
+        failed = []
+        if self.pipeline is not None:
+            failed = await self.flush_pipeline_async()
+        self.finish_discovery(failed)
+
+    async def _mqtt_reader_task(self) -> None:
+        """
+        Serve incoming messages
+
+        umqtt.simple owns the packet framing on the socket, so rather than
+        wrapping it in a stream this polls the non-blocking check_msg()
+        """
+        while True:
+            self.feed_watchdog()
+            self.settle_contacts()
+            if self.online and not self._discovered:
+                await self.discover_async()
+            if self.connection_step():
+                try:
+                    while self.online and self.check_msg() is not None:
+                        pass
+                except OSError:
+                    self.enter_reset()
+                self.apply_commands()
+                # devices flagged by an irq, commands schedule their own refresh
+                if self._dirty and self.online:
+                    await self._refresh_task()
+                if self._held and self.online:
+                    self.publish_held()
+                self.keep_alive()
+            if self.http is not None:
+                self.http.service()
+                self.http.maintain()
+
+            await asyncio.sleep(self.command_poll_ms / 1000)
+
+    async def _mqtt_writer_task(self) -> None:
+        """Drain the publish queue"""
+        while True:
+            await self._publish_event.wait()
+            self._publish_event.clear()
+
+            while self._publish_queue:
+                topic, message, retain = self._publish_queue.pop(0)
+                if not self.send(topic=topic, message=message, retain=retain):
+                    # a config which did not go out is sent on the next discovery
+                    self.discovery_hashes.pop(topic, None)
+                await asyncio.sleep(0)
@@ -0,0 +1,183 @@
+"""
+Flash-backed store-and-forward queue for state messages that could not be sent
+"""
+
+import os
+import struct
+import time
+
+
+# seq, timestamp, topic length, message length
+_HEADER = "<IIHH"
+_HEADER_SIZE = struct.calcsize(_HEADER)
+
+
+def timestamped(message: bytes, timestamp: int) -> bytes:
+    """Add a "_ts" key holding `timestamp` to the JSON object `message`"""
+    if len(message) <= 2:
+        return message
+    return f'{{"_ts": {timestamp}, '.encode() + message[1:]
+
+
+class Backlog:
+    """
+    Bounded circular log of fixed-size, timestamped records on flash
+
+    The log file is preallocated once, and records are written sequentially
+    into it, each into the slot given by its sequence number. When full, the
+    oldest records are overwritten. Only the sequence number of the last
+    replayed record is persisted separately, and only once a replay is done
+    (or every `commit_every` records), so a normal append costs one write.
+
+    Args:
+        path: path of the log file
+        capacity: number of records to keep (Default 256)
+        record_size: size of each record in bytes, including the header
+            (Default 256). Longer messages are dropped
+        commit_every: persist replay progress every n records (Default 32)
+    """
+
+    __slots__ = [
+        "path",
+        "capacity",
+        "record_size",
+        "commit_every",
+        "dropped",
+        "_file",
+        "_head",
+        "_acked",
+        "_uncommitted",
+        "_buffer",
+    ]
+
+    def __init__(
+        self,
+        path: str = "backlog.bin",
+        capacity: int = 256,
+        record_size: int = 256,
+        commit_every: int = 32,
+    ):
+        self.path = path
+        self.capacity = capacity
+        self.record_size = record_size
+        self.commit_every = commit_every
+
+        # messages which did not fit in a record
+        self.dropped = 0
+
+        self._buffer = bytearray(record_size)
+        self._uncommitted = 0
+
+        self._open()
+
+    def __repr__(self) -> str:
+        return f"Backlog({self.path}, {len(self)}/{self.capacity})"
+
+    def __len__(self) -> int:
+        """Returns the number of records awaiting replay"""
+        return self._head - max(self._acked, self._head - self.capacity)
+
+    @property
+    def _ack_path(self) -> str:
+        return f"{self.path}.ack"
+
+    def _open(self) -> None:
+        """Open the log, preallocating it if needed, and find the head"""
+        size = self.capacity * self.record_size
+        try:
+            existing = os.stat(self.path)[6]
+        except OSError:
+            existing = -1
+
+        if existing != size:
+            print(f"preallocating backlog {self.path} ({size} bytes)")
+            with open(self.path, "wb") as o:
+                block = bytes(self.record_size)
+                for _ in range(self.capacity):
+                    o.write(block)
+            self._write_ack(0)
+
+        self._file = open(self.path, "r+b")
+
+        # each slot holds the seq it was last written with, the head is the max
+        self._head = 0
+        header = bytearray(_HEADER_SIZE)
+        for slot in range(self.capacity):
+            self._file.seek(slot * self.record_size)
+            self._file.readinto(header)
+            seq = struct.unpack_from(_HEADER, header)[0]
+            if seq > self._head:
+                self._head = seq
+
+        try:
+            with open(self._ack_path, "rb") as o:
+                self._acked = struct.unpack("<I", o.read(4))[0]
+        except (OSError, struct.error):
+            self._acked = 0
+        self._acked = min(self._acked, self._head)
+
+    def _write_ack(self, seq: int) -> None:
+        with open(self._ack_path, "wb") as o:
+            o.write(struct.pack("<I", seq))
+
+    def append(self, topic: str, message: str | bytes) -> bool:
+        """Append a message to the log, returns False if it was dropped"""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(message, str):
+            message = message.encode()
+
+        if _HEADER_SIZE + len(topic) + len(message) > self.record_size:
+            self.dropped += 1
+            return False
+
+        seq = self._head + 1
+        buffer = self._buffer
+        struct.pack_into(
+            _HEADER, buffer, 0, seq, int(time.time()), len(topic), len(message)
+        )
+        start = _HEADER_SIZE
+        buffer[start : start + len(topic)] = topic
+        start += len(topic)
+        buffer[start : start + len(message)] = message
+
+        self._file.seek(((seq - 1) % self.capacity) * self.record_size)
+        self._file.write(buffer)
+        self._file.flush()
+
+        self._head = seq
+        return True
+
+    def peek(self) -> tuple | None:
+        """Returns the oldest (timestamp, topic, message) awaiting replay"""
+        if not len(self):
+            return None
+        seq = max(self._acked, self._head - self.capacity) + 1
+
+        self._file.seek(((seq - 1) % self.capacity) * self.record_size)
+        self._file.readinto(self._buffer)
+
+        _, timestamp, topic_len, message_len = struct.unpack_from(
+            _HEADER, self._buffer
+        )
+        start = _HEADER_SIZE
+        topic = bytes(self._buffer[start : start + topic_len])
+        start += topic_len
+        message = bytes(self._buffer[start : start + message_len])
+
+        return timestamp, topic, message
+
+    def pop(self) -> None:
+        """Mark the oldest record as replayed"""
+        if not len(self):
+            return
+        self._acked = max(self._acked, self._head - self.capacity) + 1
+
+        self._uncommitted += 1
+        if not len(self) or self._uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self) -> None:
+        """Persist the replay progress"""
+        self._write_ack(self._acked)
+        self._uncommitted = 0
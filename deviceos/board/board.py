@@ -4,20 +4,32 @@ Contains the Board class, the toplevel class for all devices
 Also handles wifi and mqtt functionality
 """
 
-import json
+import select
 import time
 
 import network  # pylint: disable=import-error
 import ubinascii  # pylint: disable=import-error
-from machine import unique_id  # pylint: disable=import-error
+from machine import WDT, unique_id  # pylint: disable=import-error
 
 import deviceos
+from deviceos.board.asyncmixin import AsyncMixin
+from deviceos.board.backlog import Backlog, timestamped
+from deviceos.board.connectionmixin import WIFI_DOWN, ConnectionMixin
+from deviceos.board.encoder import StateEncoder
+from deviceos.board.httpstatus import DISCOVERY, STATE, StatusServer
+from deviceos.board.lowpowermixin import LowPowerMixin
 from deviceos.board.mqttmixin import MQTTMixin
+from deviceos.board.pipeline import PublishPipeline
+from deviceos.board.ratelimit import RateLimiter
+from deviceos.board.scheduler import Scheduler
+from deviceos.board.tls import TLS
+from deviceos.board.topics import TopicTrie
+from deviceos.board.warmstate import WarmState, clock_set
 from deviceos.board.wifimixin import WiFiMixin
 from deviceos.devices.device import Device
 
 
-class Board(WiFiMixin, MQTTMixin):
+class Board(WiFiMixin, MQTTMixin, ConnectionMixin, AsyncMixin, LowPowerMixin):
     # pylint: disable = too-many-arguments, too-many-instance-attributes
     """
     Baseclass for the board, enabling WiFi and MQTT connectivity
@@ -30,18 +42,115 @@ class Board(WiFiMixin, MQTTMixin):
         mqtt_host: mqtt server hostname
         mqtt_user: mqtt username
         mqtt_pass: mqtt password
-        mqtt_port: mqtt port (optional)
+        mqtt_port: mqtt port (Default 1883, or 8883 with `tls`)
+        mqtt_keepalive: seconds the broker waits for a packet before dropping
+            the board, pings are sent after half of this without any traffic
+            (Default 60)
+        tls: TLS settings, to connect to the broker over TLS (optional)
+
+        interval: seconds between state publishes
+        heartbeat: publish the full state every `heartbeat` intervals, even if
+            nothing has changed (0 to publish every interval)
+
+        backlog: Backlog to store state messages in while offline (optional)
+        backlog_rate: max number of stored messages to replay per second
+
+        backoff_min_ms: delay before the first reconnection retry
+        backoff_max_ms: maximum delay between reconnection retries
+
+        discovery_window: number of QoS 1 discovery configs which can await
+            acknowledgement at once (0 to send discovery at QoS 0)
+        state_buffer: initial size of the buffer state payloads are encoded into
+        watchdog_ms: if set, run() starts a machine.WDT with this timeout, so a
+            hung board reboots (optional)
+
+        persistent_session: keep the MQTT session (and any commands sent to
+            the board) at the broker while disconnected, for use with
+            run_low_power() (Default False)
+        batch_limit: max number of state messages run_low_power() buffers in
+            RAM between uploads (Default 64)
+        connect: connect to WiFi and the broker on creation (Default True)
+
+        warm_state: WarmState to persist discovery, the IP address, sampling
+            phases and the last published state in, so that a restart skips
+            rediscovery (optional)
+        max_publish_rate: max state messages per second, further messages are
+            held back and sent with their latest data once allowed (optional)
+        http: StatusServer to serve the cached state, discovery and
+            diagnostics over HTTP from (optional)
     """
 
     __slots__ = [
         "devices",
-        "name",
-        "area",
+        "_sensors",
+        "_name",
+        "_area",
+        "_uid",
+        "_device_info",
+        "discovery_hashes",
         "discovery_prefix",
         "interval",
         "last_update_time",
+        "heartbeat",
+        "sent_messages",
+        "sent_bytes",
+        "suppressed_messages",
+        "suppressed_bytes",
+        "scheduler",
+        "backlog",
+        "backlog_rate",
+        "pipeline",
+        "encoder",
+        "metrics",
+        "watchdog_ms",
+        "watchdog",
+        "_availability",
         "_discovered",
         "_reset_flag",
+        "_last_published",
+        "_last_payload_size",
+        "_intervals_since_heartbeat",
+        "_dirty",
+        "_commands",
+        "_settling",
+        "_held",
+        "rate_limiter",
+        "irq_latency_ms",
+        "_poller",
+        "_polled_sock",
+        "_polled_generation",
+        "http",
+        "warm_state",
+        # WiFiMixin
+        "_wlan",
+        "_wlan_ssid",
+        "_wlan_pass",
+        "_static_ip",
+        # MQTTMixin
+        "_mqtt",
+        "_mqtt_host",
+        "_mqtt_user",
+        "_mqtt_pass",
+        "_mqtt_port",
+        "_mqtt_keepalive",
+        "tls",
+        "_routes",
+        "_subscriptions",
+        # ConnectionMixin
+        "backoff_min_ms",
+        "backoff_max_ms",
+        "_conn_state",
+        "_retry_at",
+        "_attempts",
+        # AsyncMixin
+        "command_poll_ms",
+        "_publish_queue",
+        "_publish_event",
+        # LowPowerMixin
+        "persistent_session",
+        "batch_limit",
+        "batch_dropped",
+        "_batch",
     ]
 
     def __init__(
@@ -51,33 +160,143 @@ class Board(WiFiMixin, MQTTMixin):
         mqtt_host: str,
         mqtt_user: str,
         mqtt_pass: str,
-        mqtt_port: int = 1883,
+        mqtt_port: int | None = None,
+        mqtt_keepalive: int = 60,
+        tls: TLS | None = None,
         discovery_prefix: str = "homeassistant",
-        interval: int = 15,
+        interval: int | float = 15,
+        heartbeat: int = 20,
         name: str = "DeviceOS_Test",
         area: str | None = None,
+        backlog: Backlog | None = None,
+        backlog_rate: int = 5,
+        backoff_min_ms: int = 500,
+        backoff_max_ms: int = 60000,
+        discovery_window: int = 8,
+        state_buffer: int = 512,
+        watchdog_ms: int | None = None,
+        persistent_session: bool = False,
+        batch_limit: int = 64,
+        connect: bool = True,
+        warm_state: WarmState | None = None,
+        max_publish_rate: float | None = None,
+        http: StatusServer | None = None,
     ):
         network.hostname(name)
-        self.name = name
-        self.area = area
+        self._name = name
+        self._area = area
+
+        self._uid = None
+        self._device_info = None
+        # crc32 of the last retained config published to each discovery topic
+        self.discovery_hashes = {}
+        self.warm_state = warm_state
 
         self.discovery_prefix = discovery_prefix
         self._discovered = False
-        self._reset_flag = False
+        self._reset_flag = True
+
+        self.backoff_min_ms = backoff_min_ms
+        self.backoff_max_ms = backoff_max_ms
+        self._conn_state = WIFI_DOWN
+        self._retry_at = time.ticks_ms()
+        self._attempts = 0
 
         self.interval = interval
-        self.last_update_time = 0
+        # ticks_ms of the last publish, None if never published
+        self.last_update_time = None
+
+        # change-only publishing
+        self.heartbeat = heartbeat
+        self.sent_messages = 0
+        self.sent_bytes = 0
+        self.suppressed_messages = 0
+        self.suppressed_bytes = 0
+        self._last_published = {}
+        self._last_payload_size = {}
+        if warm_state is not None:
+            # configs the broker already retains, and state it already has
+            self.discovery_hashes.update(warm_state.get("discovery", {}))
+            self._last_published.update(warm_state.get("state", {}))
+        self._intervals_since_heartbeat = 0
+
+        # devices awaiting a targeted publish, following a command
+        self._dirty = []
+        # inputs holding a coalesced command, see Input.coalesce_ms
+        self._commands = []
+        # contacts to read again once a debounce window has passed
+        self._settling = []
+        # devices whose publish was held back by the rate limiter
+        self._held = []
+        self.rate_limiter = None
+        if max_publish_rate is not None:
+            self.rate_limiter = RateLimiter(max_publish_rate)
+        # max ms between an irq and its publish, None if nothing needs it
+        self.irq_latency_ms = None
+
+        self.scheduler = None
+
+        self.backlog = backlog
+        self.backlog_rate = backlog_rate
+
+        self.encoder = StateEncoder(state_buffer)
+
+        # set by adding a Metrics device
+        self.metrics = None
+
+        self.watchdog_ms = watchdog_ms
+        self.watchdog = None
+        # device: last availability published
+        self._availability = {}
+
+        self.pipeline = None
+        if discovery_window > 0:
+            self.pipeline = PublishPipeline(window=discovery_window)
+
+        # set by run_async()
+        self.command_poll_ms = 10
+        self._publish_queue = None
+        self._publish_event = None
+
+        self._poller = None
+        self._polled_sock = None
+        self._polled_generation = None
+
+        self.http = http
+        if http is not None:
+            http.attach(self)
+
+        # set by run_low_power()
+        self.persistent_session = persistent_session
+        self.batch_limit = batch_limit
+        self.batch_dropped = 0
+        self._batch = None
 
         self._wlan_ssid = wlan_ssid
         self._wlan_pass = wlan_pass
+        self._static_ip = False
         self._mqtt_host = mqtt_host
         self._mqtt_user = mqtt_user
         self._mqtt_pass = mqtt_pass
+        if mqtt_port is None:
+            mqtt_port = 1883 if tls is None else 8883
         self._mqtt_port = mqtt_port
+        self.tls = tls
+        self._mqtt_keepalive = mqtt_keepalive
+        # incoming topic: callback, and the filters subscribed on each connect
+        self._routes = TopicTrie()
+        self._routes.insert("homeassistant/status", self.status_change)
+        self._subscriptions = [
+            "homeassistant/status",
+            # the command topics of every Input on this board
+            f"{discovery_prefix}/+/{self.uid}/+/set",
+        ]
 
         self.devices = []
+        self._sensors = ()
 
-        self.setup()
+        if connect:
+            self.setup()
 
     def setup(self):
         """Performs any setup steps"""
@@ -89,7 +308,29 @@ class Board(WiFiMixin, MQTTMixin):
     @property
     def uid(self) -> str:
         """Returns the board UID"""
-        return ubinascii.hexlify(unique_id()).decode()
+        if self._uid is None:
+            self._uid = ubinascii.hexlify(unique_id()).decode()
+        return self._uid
+
+    @property
+    def name(self) -> str:
+        """Returns the board name"""
+        return self._name
+
+    @name.setter
+    def name(self, name: str):
+        self._name = name
+        self.invalidate_discovery()
+
+    @property
+    def area(self) -> str | None:
+        """Returns the suggested area"""
+        return self._area
+
+    @area.setter
+    def area(self, area: str | None):
+        self._area = area
+        self.invalidate_discovery()
 
     @property
     def identifiers(self) -> list:
@@ -97,36 +338,239 @@ class Board(WiFiMixin, MQTTMixin):
         return [self.uid]
 
     def connect(self) -> None:
-        """Attempt to connect to wifi and broker"""
-        while not self.connect_to_wifi():
-            pass
-        while not self.connect_to_mqtt():
-            pass
-
-        self._reset_flag = False
+        """Connect to wifi and broker, waiting until online"""
+        while not self.connection_step():
+            self.feed_watchdog()
+            time.sleep_ms(50)
 
     def enter_reset(self):
-        """Enters a "reset" state, attempting a reconnect until available"""
-        print("An error was encountered: Resetting")
-        self._reset_flag = True
+        """
+        Enters a "reset" state
 
-        self.setup()
+        The connection is retried by connection_step(), without blocking
+        """
+        print("An error was encountered: Resetting")
+        if self.metrics is not None:
+            self.metrics.resets += 1
+        self.disconnect_mqtt()
+        self._set_state(WIFI_DOWN)
 
     def add_device(self, device: Device) -> None:
         """Add a preconfigured sensor to the board"""
         for interface in device.interfaces:
             interface.board = self
             interface.parent = device
+            interface.attach()
+        device.state_topic = self.device_state_topic(device)
+        device.availability_topic = self.device_availability_topic(device)
         self.devices.append(device)
+        if isinstance(device, Device):
+            self._sensors = self._sensors + (device,)
+            device.compile()
+
+        device.attach(self)
+        if self.metrics is not None:
+            self.metrics.track(device, self)
+
+        if self.warm_state is not None:
+            self.restore_phase(device)
+        if self.http is not None:
+            self.http.invalidate(DISCOVERY)
+
+    def restore_phase(self, device: Device) -> None:
+        """
+        Set the last read of `device` from its stored phase, so that devices
+        keep their spacing over a restart, rather than all reading at once
+
+        Phases are wall clock times, so this is skipped until the clock is set
+        """
+        if not clock_set():
+            return
+        phase = self.warm_state.get("phases", {}).get(device.name)
+        interval = int(device.interval)
+        if phase is None or interval < 1:
+            return
+        remaining = (phase - int(time.time())) % interval
+        device.last_read_time = time.ticks_add(
+            time.ticks_ms(), (remaining - interval) * 1000
+        )
+
+    def save_warm_state(self, force: bool = False) -> None:
+        """Update the warm state, writing it if anything has changed"""
+        warm_state = self.warm_state
+        if warm_state is None:
+            return
+        warm_state.update("discovery", self.discovery_hashes)
+        if clock_set():
+            # phases measured from an unset clock would be wrong after a restart
+            now = time.ticks_ms()
+            wall = int(time.time())
+            phases = {}
+            for device in self.sensors:
+                interval = int(device.interval)
+                if device.last_read_time is None or interval < 1:
+                    continue
+                elapsed = time.ticks_diff(now, device.last_read_time) // 1000
+                phases[device.name] = (wall - elapsed) % interval
+            warm_state.update("phases", phases)
+        warm_state.update("state", self._last_published)
+        warm_state.save(force=force)
+
+    def mark_dirty(self, device: Device) -> None:
+        """Flag `device` for a targeted read and publish"""
+        if device not in self._dirty:
+            self._dirty.append(device)
+
+    def route(self, topic: str, callback: "Callable") -> None:
+        """
+        Call `callback` with messages on `topic`, which must be covered by an
+        existing subscription, such as the command topic of an Input
+        """
+        self._routes.insert(topic, callback)
+
+    def register_irq(self, interface: "PinOutput") -> None:
+        """
+        Bound the run loop's wait by `interface.latency_ms`, so that changes
+        recorded by its irq are published promptly
+        """
+        latency = interface.latency_ms
+        if self.irq_latency_ms is None or latency < self.irq_latency_ms:
+            self.irq_latency_ms = latency
+
+    def defer_command(self, interface: "Input") -> None:
+        """Hold the pending command of `interface` until it is due"""
+        if interface not in self._commands:
+            self._commands.append(interface)
+
+    def apply_commands(self, flush: bool = False) -> None:
+        """
+        Apply the coalesced commands which are due, or all of them if `flush`
+        """
+        commands = self._commands
+        if not commands:
+            return
+        now = time.ticks_ms()
+        index = 0
+        while index < len(commands):
+            interface = commands[index]
+            if not flush and time.ticks_diff(interface.command_due, now) > 0:
+                index += 1
+                continue
+            commands.pop(index)
+            interface.apply_pending()
+
+    def defer_settle(self, interface: "Contact") -> None:
+        """Read the pin of `interface` again once its settle_due has passed"""
+        if interface not in self._settling:
+            self._settling.append(interface)
+
+    def settle_contacts(self) -> None:
+        """Settle the contacts which are due, see Contact.settle()"""
+        settling = self._settling
+        if not settling:
+            return
+        now = time.ticks_us()
+        index = 0
+        while index < len(settling):
+            interface = settling[index]
+            if time.ticks_diff(interface.settle_due, now) > 0:
+                index += 1
+                continue
+            settling.pop(index)
+            if interface.settle() and interface.immediate:
+                self.mark_dirty(interface.parent)
+
+    def bound_delay(self, delay: int) -> int:
+        """
+        Bound the run loop's wait of `delay` ms (-1 for no limit) by any work
+        which cannot wake the poll: irq processing, debounced contacts,
+        coalesced commands, publishes held by the rate limiter, keepalive
+        pings and idle HTTP connections
+        """
+        latency = self.irq_latency_ms
+        if latency is not None and (delay < 0 or delay > latency):
+            delay = latency
+
+        if self._settling:
+            now = time.ticks_us()
+            for interface in self._settling:
+                due = max(0, time.ticks_diff(interface.settle_due, now)) // 1000 + 1
+                if delay < 0 or due < delay:
+                    delay = due
+
+        if self._commands:
+            now = time.ticks_ms()
+            for interface in self._commands:
+                due = max(0, time.ticks_diff(interface.command_due, now))
+                if delay < 0 or due < delay:
+                    delay = due
+
+        if self._held:
+            due = self.rate_limiter.delay_ms()
+            if delay < 0 or due < delay:
+                delay = due
+
+        if self.online:
+            due = self.mqtt.ping_delay()
+            if due >= 0 and (delay < 0 or due < delay):
+                delay = due
+
+        if self.http is not None:
+            due = self.http.next_delay()
+            if due >= 0 and (delay < 0 or due < delay):
+                delay = due
+        return delay
+
+    def service(self) -> None:
+        """
+        Settle debounced contacts, apply due commands, publish any dirty or
+        held devices, and keep the connection alive
+        """
+        self.settle_contacts()
+        self.apply_commands()
+        if self.http is not None:
+            self.http.maintain()
+        if not self.online:
+            return
+        if self._dirty:
+            self.publish_dirty()
+        if self._held:
+            self.publish_held()
+        self.keep_alive()
+
+    def echo(self, interface: "Input", value: str) -> None:
+        """
+        Publish `value` as the state of `interface` at once, along with the
+        last data of its device, without re-reading the device
+        """
+        device = interface.parent
+        device.internal_data[interface.name] = value
+        if self.online:
+            self.publish_device(device, force=True)
+
+    def publish_held(self) -> None:
+        """Publish the devices held by the rate limiter, as it allows"""
+        while self._held and self.rate_limiter.ready():
+            self.publish_device(self._held.pop(0), force=True)
+
+    def publish_dirty(self) -> None:
+        """Re-read and publish only the devices flagged by mark_dirty()"""
+        while self._dirty:
+            device = self._dirty.pop(0)
+            device.sample(track=False)
+            self.publish_device(device, force=True)
 
     @property
-    def sensors(self) -> list:
-        """Returns a list of devices"""
-        return [item for item in self.devices if isinstance(item, Device)]
+    def sensors(self) -> tuple:
+        """Returns the devices, as a tuple built by add_device()"""
+        return self._sensors
 
     @property
     def device_info(self) -> dict:
         """Device info stub for discovery"""
+        if self._device_info is not None:
+            return self._device_info
+
         payload = {
             "sw_version": deviceos.__version__,
             "identifiers": self.identifiers,
@@ -138,8 +582,18 @@ class Board(WiFiMixin, MQTTMixin):
         if self.area is not None:
             payload["suggested_area"] = self.area
 
+        self._device_info = payload
         return payload
 
+    def invalidate_discovery(self) -> None:
+        """Drop all cached discovery payloads, to be rebuilt on next discovery"""
+        self._device_info = None
+        for device in self.devices:
+            for interface in device.interfaces:
+                interface.invalidate()
+        if self.http is not None:
+            self.http.invalidate(DISCOVERY)
+
     def base_topic(self, component: str = "sensor") -> str:
         """Generate discovery topic for `component`
         See docs here: https://www.home-assistant.io/integrations/mqtt/#discovery-messages
@@ -149,17 +603,72 @@ class Board(WiFiMixin, MQTTMixin):
         """
         return f"{self.discovery_prefix}/{component}/{self.uid}"
 
-    def discover(self) -> None:
-        """Initiate discovery"""
+    def device_state_topic(self, device: Device) -> str:
+        """Topic that the state of `device` is published to"""
+        return f"{self.base_topic('sensor')}/{device.name}/state"
+
+    def device_availability_topic(self, device: Device) -> str:
+        """Topic that the availability of `device` is published to"""
+        return f"{self.base_topic('sensor')}/{device.name}/availability"
+
+    def discover(self, force: bool = False) -> None:
+        """
+        Initiate discovery
+
+        Configs which are unchanged since they were last published (and so are
+        still retained by the broker) are skipped, unless `force` is True
+        """
+        self.start_discovery(force=force)
+        failed = []
+        if self.pipeline is not None:
+            failed = self.flush_pipeline()
+        self.finish_discovery(failed)
+
+    def start_discovery(self, force: bool = False) -> None:
+        """Submit the discovery configs, opening a pipeline burst if enabled"""
         print("Initial discovery")
+        if self.pipeline is not None:
+            self.pipeline.begin_burst()
+
         for device in self.sensors:
             print(
                 f"discovering sensor {device} with {len(device.interfaces)} interfaces"
             )
             for interface in device.interfaces:
-                interface.discover()
+                interface.discover(force=force)
+
+            if device.deadline_ms is not None:
+                self.publish_availability(device)
+
+    def finish_discovery(self, failed: list) -> None:
+        """Mark discovery as done, given the topics of any unacknowledged configs"""
+        # anything unacknowledged should be sent again next time
+        for topic in failed:
+            self.discovery_hashes.pop(topic, None)
 
         self._discovered = True
+        self.save_warm_state(force=True)
+
+    def publish_availability(self, device: Device) -> None:
+        """Publish (retained) whether `device` is available, or quarantined"""
+        available = device.available
+        self._availability[device] = available
+        self.publish(
+            topic=device.availability_topic,
+            message="online" if available else "offline",
+            retain=True,
+        )
+
+    def feed_watchdog(self) -> None:
+        """Feed the watchdog, if there is one"""
+        if self.watchdog is not None:
+            self.watchdog.feed()
+
+    def start_watchdog(self) -> None:
+        """Start the watchdog if watchdog_ms is set. This cannot be stopped"""
+        if self.watchdog_ms is not None and self.watchdog is None:
+            print(f"starting watchdog with a {self.watchdog_ms}ms timeout")
+            self.watchdog = WDT(timeout=self.watchdog_ms)
 
     def read_sensors(self, force: bool = False) -> bool:
         """
@@ -173,43 +682,239 @@ class Board(WiFiMixin, MQTTMixin):
                 update = True
         return update
 
+    def build_schedule(self) -> Scheduler:
+        """Create a Scheduler with a read task per device, and a publish task"""
+        scheduler = Scheduler()
+        scheduler.add(0.5, self.connection_step)
+        now = time.ticks_ms()
+        for sensor in self.sensors:
+            delay = 0
+            if sensor.last_read_time is not None:
+                # carry on from a restored phase
+                elapsed = time.ticks_diff(now, sensor.last_read_time)
+                delay = max(0, int(sensor.interval * 1000) - elapsed)
+            scheduler.add(sensor.interval, sensor.sample, delay=delay)
+        # publish after the initial reads have been taken
+        scheduler.add(self.interval, self.publish_state, delay=1)
+        if self.backlog is not None:
+            scheduler.add(1, self.replay_backlog)
+        return scheduler
+
+    def wait(self, timeout: int) -> None:
+        """
+        Block on the MQTT socket (and any HTTP status sockets) for up to
+        `timeout` ms (-1 for no limit), handling any incoming message
+
+        While offline, this simply sleeps, unless there is an HTTP server. The
+        watchdog is fed first, as this is called by every loop which waits on
+        the broker
+        """
+        self.feed_watchdog()
+        start = time.ticks_ms()
+        http = self.http
+        online = self.online
+        if not online:
+            timeout = timeout if timeout >= 0 else 500
+            if http is None:
+                time.sleep_ms(timeout)
+                if self.scheduler is not None:
+                    self.scheduler.record_wait(time.ticks_diff(time.ticks_ms(), start))
+                return
+
+        sock = self.mqtt.sock if online else None
+        generation = None if http is None else http.generation
+        if (
+            self._poller is None
+            or sock is not self._polled_sock
+            or generation != self._polled_generation
+        ):
+            self._poller = select.poll()
+            if sock is not None:
+                self._poller.register(sock, select.POLLIN)
+            if http is not None:
+                http.register(self._poller)
+            self._polled_sock = sock
+            self._polled_generation = generation
+
+        events = self._poller.poll(timeout)
+        if self.scheduler is not None:
+            self.scheduler.record_wait(time.ticks_diff(time.ticks_ms(), start))
+
+        if not events:
+            return
+        if online:
+            try:
+                # the transport buffers every packet which has arrived, and
+                # raises once the broker has hung up
+                while self.online and self.check_msg() is not None:
+                    pass
+            except OSError:
+                self.enter_reset()
+        if http is not None:
+            http.service()
+
     def run(self) -> None:
         """Run, forever"""
         print("running")
 
+        self.scheduler = self.build_schedule()
+        self.start_watchdog()
+
         while True:
-            self.once()
+            self.feed_watchdog()
+            if self.metrics is None:
+                self.scheduler.run_pending()
+            else:
+                start = time.ticks_us()
+                if self.scheduler.run_pending():
+                    self.metrics.record_loop(time.ticks_diff(time.ticks_us(), start))
 
-            try:
-                self.mqtt.check_msg()
-            except OSError:
-                self.enter_reset()
+            self.wait(self.bound_delay(self.scheduler.next_delay()))
+            self.service()
 
     def once(self, force: bool = False) -> None:
         """
         Attempts to read and submit, once
         """
-        if hasattr(self, "_reset_flag") and self._reset_flag:
-            print("we are in a reset state, attempting a reconnect")
-            self.setup()
-
-        if not self._discovered:
-            self.discover()
+        start = time.ticks_us()
+        self.connection_step()
 
-        topic = f"{self.base_topic("sensor")}/state"
         self.read_sensors(force=force)
 
-        now = int(time.time())
+        now = time.ticks_ms()
+
+        if (
+            force
+            or self.last_update_time is None
+            or time.ticks_diff(now, self.last_update_time) >= self.interval * 1000
+        ):
+            self.publish_state(force=force)
+
+        if self.metrics is not None:
+            self.metrics.record_loop(time.ticks_diff(time.ticks_us(), start))
+
+    def device_changed(self, device: Device) -> bool:
+        """
+        Returns True if any value of `device` has moved past the deadband of
+        its interface since the last publish
+        """
+        data = device.internal_data
+        last = self._last_published
+        for interface in device.interfaces:
+            name = interface.name
+            if name not in data:
+                continue
+            if name not in last:
+                return True
+            if interface.has_changed(last[name], data[name]):
+                return True
+        return False
+
+    def replay_backlog(self) -> None:
+        """
+        Send up to `backlog_rate` stored messages, oldest first
 
-        if not force and self.last_update_time + self.interval > now:
+        Replayed messages have a "_ts" key added with the time of the reading.
+        They go to the live state topics, so once the last has been sent the
+        current state is published again, to replace the stale values
+        """
+        if self.backlog is None or self._reset_flag:
             return
 
-        self.last_update_time = now
+        for _ in range(self.backlog_rate):
+            record = self.backlog.peek()
+            if record is None:
+                return
+            timestamp, topic, message = record
+
+            message = timestamped(message, timestamp)
+            if not self.send(topic=topic, message=message, store=False):
+                return
+            self.backlog.pop()
+            if not len(self.backlog):
+                self.publish_current()
+                return
+
+    def publish_current(self) -> None:
+        """
+        Publish the last data of every device, without reading or collecting
+        them, so aggregates and rates keep their current interval
+        """
+        for sensor in self.sensors:
+            self.publish_device(sensor, force=True)
+
+    @property
+    def publish_stats(self) -> dict:
+        """Counters for sent, suppressed and rate limited state publishes"""
+        limiter = self.rate_limiter
+        return {
+            "sent_messages": self.sent_messages,
+            "sent_bytes": self.sent_bytes,
+            "suppressed_messages": self.suppressed_messages,
+            "suppressed_bytes": self.suppressed_bytes,
+            "rate_limited": 0 if limiter is None else limiter.limited,
+        }
+
+    def publish_state(self, force: bool = False) -> None:
+        """
+        Publish the internal data of all devices, each to its own state topic
+
+        Devices with no changes are skipped, unless `force` is True or a
+        heartbeat is due
+        """
+        self.last_update_time = time.ticks_ms()
+
+        self._intervals_since_heartbeat += 1
+        if self._intervals_since_heartbeat >= self.heartbeat:
+            self._intervals_since_heartbeat = 0
+            force = True
 
-        payload = {}
         for sensor in self.sensors:
-            payload.update(sensor.internal_data)
+            if (
+                sensor.deadline_ms is not None
+                and self._availability.get(sensor) != sensor.available
+            ):
+                self.publish_availability(sensor)
+            sensor.collect()
+            self.publish_device(sensor, force=force)
+
+        self.save_warm_state()
+
+    def publish_device(self, device: Device, force: bool = False) -> None:
+        """
+        Publish the internal data of `device` to its state topic
+
+        Publishing is skipped if no value has changed, unless `force` is True.
+        Data which could not be sent is not recorded as published, so it is
+        sent once the board is back online
+        """
+        topic = device.state_topic
+        data = device.internal_data
+        if not data or not device.available:
+            return
+
+        if not force and not self.device_changed(device):
+            # estimate the saving from the last payload, rather than encoding
+            self.suppressed_messages += 1
+            self.suppressed_bytes += self._last_payload_size.get(topic, 0)
+            return
+
+        if self.rate_limiter is not None and not self.rate_limiter.take():
+            # sent by publish_held(), with whatever data is latest by then
+            if device not in self._held:
+                self._held.append(device)
+            return
+
+        message = self.encoder.encode(device.interfaces, data)
+
+        print(f"{self.last_update_time}: {topic}")
+        print(data)
+        if not self.publish(topic=topic, message=message):
+            return
 
-        print(f"{now}: {topic}")
-        print(payload)
-        self.publish(topic=topic, message=json.dumps(payload))
+        self._last_published.update(data)
+        if self.http is not None:
+            self.http.invalidate(STATE)
+        self._last_payload_size[topic] = len(message)
+        self.sent_messages += 1
+        self.sent_bytes += len(message)
@@ -0,0 +1,118 @@
+"""
+Mixin class providing a non-blocking connection state machine
+"""
+
+import random
+import time
+
+
+WIFI_DOWN = 0
+WIFI_UP = 1
+MQTT_CONNECTING = 2
+ONLINE = 3
+
+STATE_NAMES = ("WIFI_DOWN", "WIFI_UP", "MQTT_CONNECTING", "ONLINE")
+
+
+class ConnectionMixin:
+    """
+    Handles (re)connection as a state machine, advanced by connection_step()
+
+    WIFI_DOWN -> WIFI_UP -> MQTT_CONNECTING -> ONLINE
+
+    Each step does at most one connection attempt, and failed attempts are
+    retried after a jittered exponential backoff, so the rest of the board
+    can keep running while offline. WiFi association does not block, but a
+    broker connection attempt does (see MQTTMixin.try_connect_mqtt).
+
+    expects backoff_min_ms and backoff_max_ms to be set
+    """
+
+    # attributes are declared in the Board __slots__
+    __slots__ = ()
+
+    @property
+    def connection_state(self) -> str:
+        """Returns the name of the current connection state"""
+        return STATE_NAMES[self._conn_state]
+
+    @property
+    def online(self) -> bool:
+        """Returns True if connected to the broker"""
+        return self._conn_state == ONLINE
+
+    def _set_state(self, state: int) -> None:
+        if state != self._conn_state:
+            print(f"connection: {self.connection_state} -> {STATE_NAMES[state]}")
+        self._conn_state = state
+        self._attempts = 0
+        self._retry_at = time.ticks_ms()
+
+        self._reset_flag = state != ONLINE
+        if state == ONLINE:
+            self._discovered = False
+
+    def _backoff(self) -> int:
+        """Schedule the next attempt after a jittered exponential backoff"""
+        delay = min(self.backoff_max_ms, self.backoff_min_ms << self._attempts)
+        # add up to 50% jitter, so a fleet of boards does not retry in step
+        delay += delay * random.getrandbits(8) // 512
+        self._attempts += 1
+
+        self._retry_at = time.ticks_add(time.ticks_ms(), delay)
+        return delay
+
+    def defer_reconnect(self, delay_ms: int) -> None:
+        """Drop the broker connection, and retry after `delay_ms`"""
+        self.disconnect_mqtt()
+        self._set_state(MQTT_CONNECTING if self.has_wifi else WIFI_DOWN)
+        self._retry_at = time.ticks_add(time.ticks_ms(), delay_ms)
+
+    def connection_step(self) -> bool:
+        """
+        Advance the connection state machine by (at most) one step
+
+        Returns True if online
+        """
+        state = self._conn_state
+
+        if state == ONLINE:
+            if not self.has_wifi:
+                self._set_state(WIFI_DOWN)
+                return False
+            if not self._discovered:
+                self.discover()
+            return True
+
+        if time.ticks_diff(time.ticks_ms(), self._retry_at) < 0:
+            return False
+
+        if state == WIFI_DOWN:
+            if self.has_wifi:
+                self._set_state(WIFI_UP)
+            else:
+                print("Connecting to WiFi")
+                self.start_wifi()
+                # time allowed for association before the next attempt
+                self._backoff()
+
+        elif state == WIFI_UP:
+            self._set_state(MQTT_CONNECTING)
+
+        elif state == MQTT_CONNECTING:
+            if not self.has_wifi:
+                self._set_state(WIFI_DOWN)
+            elif self.try_connect_mqtt():
+                # discovery is done on the next step
+                self._set_state(ONLINE)
+                self.remember_ip()
+                return True
+            else:
+                if self._static_ip:
+                    # the reused address may no longer be valid
+                    self.forget_ip()
+                    self._set_state(WIFI_DOWN)
+                delay = self._backoff()
+                print(f"MQTT connection failed, retrying in {delay}ms")
+
+        return False
@@ -0,0 +1,148 @@
+"""
+JSON state encoder, writing into a preallocated buffer
+"""
+
+import json
+
+
+try:
+    # MicroPython str exposes its buffer, so can be copied into a bytearray
+    bytearray(1)[0:1] = "a"
+
+    def _raw(text):
+        return text
+
+except TypeError:
+
+    def _raw(text):
+        return text.encode()
+
+
+_INF = float("inf")
+
+
+def _plain(text: str) -> bool:
+    """True if `text` needs no escaping in JSON"""
+    # min() finds any control character in one pass, without a Python loop
+    return not text or (min(text) >= " " and '"' not in text and "\\" not in text)
+
+
+class StateEncoder:
+    """
+    Encodes device state as JSON directly into a reusable bytearray
+
+    Keys are written in the order of the device interfaces, from key prefixes
+    which are encoded once. Strings, ints, bools and None are copied straight
+    into the buffer, rather than building an intermediate string.
+
+    The returned memoryview is only valid until the next call to encode()
+
+    Args:
+        size: initial buffer size in bytes (Default 512), the buffer grows if
+            a payload does not fit
+    """
+
+    __slots__ = ["buffer", "length", "_keys", "_digits"]
+
+    def __init__(self, size: int = 512):
+        self.buffer = bytearray(size)
+        self.length = 0
+
+        # interface name: encoded '"name": ' prefix
+        self._keys = {}
+        self._digits = bytearray(20)
+
+    def __repr__(self) -> str:
+        return f"StateEncoder({self.length}/{len(self.buffer)})"
+
+    def _reserve(self, size: int) -> None:
+        if self.length + size > len(self.buffer):
+            grown = bytearray(max(2 * len(self.buffer), self.length + size))
+            grown[: self.length] = self.buffer[: self.length]
+            self.buffer = grown
+
+    def _write(self, data) -> None:
+        size = len(data)
+        self._reserve(size)
+        self.buffer[self.length : self.length + size] = data
+        self.length += size
+
+    def _write_int(self, value: int) -> None:
+        if value < 0:
+            self._write(b"-")
+            value = -value
+        if value >= 10 ** len(self._digits):
+            self._write(_raw(str(value)))
+            return
+
+        digits = self._digits
+        index = len(digits)
+        while True:
+            index -= 1
+            digits[index] = 48 + value % 10
+            value //= 10
+            if not value:
+                break
+        self._write(memoryview(digits)[index:])
+
+    def _write_value(self, value) -> None:
+        if value is None:
+            self._write(b"null")
+        elif value is True:
+            self._write(b"true")
+        elif value is False:
+            self._write(b"false")
+        elif isinstance(value, int):
+            self._write_int(value)
+        elif isinstance(value, float):
+            if value != value or value in (_INF, -_INF):
+                self._write(b"null")
+            else:
+                self._write(_raw(repr(value)))
+        elif isinstance(value, str) and _plain(value):
+            self._write(b'"')
+            self._write(_raw(value))
+            self._write(b'"')
+        else:
+            self._write(_raw(json.dumps(value)))
+
+    def _key(self, name: str) -> bytes:
+        key = self._keys.get(name)
+        if key is None:
+            key = f'"{name}": '.encode()
+            self._keys[name] = key
+        return key
+
+    def encode(self, interfaces: list, data: dict) -> memoryview:
+        """
+        Encode `data` as a JSON object, keys ordered by `interfaces`
+
+        Any keys in `data` without an interface are written afterwards
+        """
+        self.length = 0
+        self._write(b"{")
+
+        written = 0
+        for interface in interfaces:
+            name = interface.name
+            if name not in data:
+                continue
+            if written:
+                self._write(b", ")
+            self._write(self._key(name))
+            self._write_value(data[name])
+            written += 1
+
+        if written < len(data):
+            names = [interface.name for interface in interfaces]
+            for name, value in data.items():
+                if name in names:
+                    continue
+                if written:
+                    self._write(b", ")
+                self._write(self._key(name))
+                self._write_value(value)
+                written += 1
+
+        self._write(b"}")
+        return memoryview(self.buffer)[: self.length]
@@ -0,0 +1,550 @@
+"""
+Local HTTP endpoint serving the cached state, discovery and diagnostics of a Board
+"""
+
+import errno
+import gc
+import json
+import select
+import socket
+import time
+
+import deviceos
+
+
+# cached routes
+INDEX = "/"
+STATE = "/state"
+DISCOVERY = "/discovery"
+DIAGNOSTICS = "/diagnostics"
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    503: "Service Unavailable",
+}
+
+# ms between attempts to listen, if the first one failed
+_RETRY_MS = 5000
+
+
+def _key(sock):
+    """Returns what poll() reports `sock` as: its fd under CPython, else itself"""
+    fileno = getattr(sock, "fileno", None)
+    return sock if fileno is None else fileno()
+
+
+def _again(exc: OSError) -> bool:
+    """Returns True if `exc` means a non-blocking socket has nothing to give"""
+    return exc.errno == errno.EAGAIN
+
+
+class _Client:
+    """A connection, and the request buffer it holds"""
+
+    __slots__ = [
+        "sock",
+        "key",
+        "readinto",
+        "buffer",
+        "length",
+        "last_active",
+        "served",
+        "out",
+        "close_after",
+        "mask",
+    ]
+
+    def __init__(self, sock, buffer: bytearray):
+        self.sock = sock
+        self.key = _key(sock)
+        # MicroPython sockets have readinto(), CPython ones recv_into()
+        self.readinto = getattr(sock, "readinto", None) or sock.recv_into
+        self.buffer = buffer
+        self.length = 0
+        self.last_active = time.ticks_ms()
+        self.served = 0
+        # memoryviews still to be sent
+        self.out = []
+        self.close_after = False
+        # what the socket is polled for
+        self.mask = select.POLLIN
+
+    def __repr__(self) -> str:
+        return f"_Client({self.served} served)"
+
+
+class StatusServer:
+    """
+    Non-blocking HTTP server for Board(http=...), answering GET requests with
+    JSON for tools which scrape the board directly, rather than through the
+    broker:
+
+    - /state: the last published state of each device
+    - /discovery: the discovery config of each interface, by topic
+    - /diagnostics: connection, publish, scheduler, TLS and heap counters
+
+    Nothing is read from the devices to answer a request. Bodies are encoded
+    once and kept as bytes, until the next publish (or discovery change)
+    makes them stale. Diagnostics are re-encoded at most every
+    `diagnostics_ms`.
+
+    The sockets are polled along with the MQTT socket by Board.run(), so a
+    request wakes the run loop, and nothing waits on a slow client. Each
+    connection has a fixed request buffer, allocated up front, and idle
+    connections are closed after `keepalive_ms`.
+
+    Args:
+        port: TCP port to listen on (Default 80, 0 for any free port)
+        host: address to listen on (Default all of them)
+        max_clients: connections served at once (Default 2), an idle one is
+            closed to make room for a new one, otherwise the new one is refused
+        keepalive_ms: idle time before a connection is closed (Default 5000)
+        max_requests: requests served over one connection (Default 100)
+        request_size: largest request accepted, in bytes (Default 512)
+        diagnostics_ms: how long diagnostics are cached for (Default 1000)
+
+    Attributes:
+        requests: requests answered
+        rejected: connections refused, as `max_clients` were busy
+        bad_requests: requests answered with an error
+        bytes_sent: bytes of responses sent
+        generation: changes whenever a socket is added, removed or changes
+            what it waits for, so the Board knows to rebuild its poller
+    """
+
+    __slots__ = [
+        "port",
+        "host",
+        "max_clients",
+        "keepalive_ms",
+        "max_requests",
+        "request_size",
+        "diagnostics_ms",
+        "board",
+        "requests",
+        "rejected",
+        "bad_requests",
+        "bytes_sent",
+        "generation",
+        "_listener",
+        "_listener_key",
+        "_retry_at",
+        "_poller",
+        "_clients",
+        "_buffers",
+        "_bodies",
+        "_diagnostics_at",
+    ]
+
+    def __init__(
+        self,
+        port: int = 80,
+        host: str = "0.0.0.0",
+        max_clients: int = 2,
+        keepalive_ms: int = 5000,
+        max_requests: int = 100,
+        request_size: int = 512,
+        diagnostics_ms: int = 1000,
+    ):
+        self.port = port
+        self.host = host
+        self.max_clients = max_clients
+        self.keepalive_ms = keepalive_ms
+        self.max_requests = max_requests
+        self.request_size = request_size
+        self.diagnostics_ms = diagnostics_ms
+        self.board = None
+
+        self.requests = 0
+        self.rejected = 0
+        self.bad_requests = 0
+        self.bytes_sent = 0
+        self.generation = 0
+
+        self._listener = None
+        self._listener_key = None
+        self._retry_at = None
+        self._poller = select.poll()
+        self._clients = []
+        # request buffers, allocated once and handed to each connection
+        self._buffers = [bytearray(request_size) for _ in range(max_clients)]
+        # route: encoded body
+        self._bodies = {}
+        self._diagnostics_at = None
+
+    def __repr__(self) -> str:
+        return f"StatusServer({self.host}:{self.port}, {len(self._clients)} clients)"
+
+    def attach(self, board: "Board") -> None:
+        """Serve the state of `board`"""
+        self.board = board
+
+    @property
+    def listening(self) -> bool:
+        """Returns True if the server is accepting connections"""
+        return self._listener is not None
+
+    def start(self) -> bool:
+        """Start listening, returns False if that failed (it is retried)"""
+        if self._listener is not None:
+            return True
+        now = time.ticks_ms()
+        if self._retry_at is not None and time.ticks_diff(self._retry_at, now) > 0:
+            return False
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(socket.getaddrinfo(self.host, self.port)[0][-1])
+            sock.listen(self.max_clients)
+            sock.setblocking(False)
+        except OSError as exc:
+            print(f"HTTP status: cannot listen on port {self.port}: {exc}")
+            sock.close()
+            self._retry_at = time.ticks_add(now, _RETRY_MS)
+            return False
+
+        if self.port == 0 and hasattr(sock, "getsockname"):
+            self.port = sock.getsockname()[1]
+        print(f"HTTP status: listening on port {self.port}")
+        self._listener = sock
+        self._listener_key = _key(sock)
+        self._poller.register(sock, select.POLLIN)
+        self.generation += 1
+        return True
+
+    def stop(self) -> None:
+        """Close every connection, and stop listening"""
+        while self._clients:
+            self._close(self._clients[0])
+        if self._listener is not None:
+            self._poller.unregister(self._listener)
+            self._listener.close()
+            self._listener = None
+            self.generation += 1
+
+    def register(self, poller) -> None:
+        """Register the listening socket and every connection on `poller`"""
+        if self._listener is None:
+            return
+        poller.register(self._listener, select.POLLIN)
+        for client in self._clients:
+            poller.register(client.sock, client.mask)
+
+    def invalidate(self, route: str) -> None:
+        """Drop the cached body of `route`, to be encoded on the next request"""
+        self._bodies.pop(route, None)
+
+    # serving
+
+    def service(self) -> None:
+        """Accept, read and answer whatever is ready, without blocking"""
+        if not self.start():
+            return
+        for event in self._poller.poll(0):
+            key, flags = event[0], event[1]
+            if key == self._listener_key:
+                self._accept()
+                continue
+            for client in self._clients:
+                if client.key == key:
+                    self._serve(client, flags)
+                    break
+
+    def maintain(self) -> None:
+        """Close idle connections, and retry listening if that failed"""
+        if self._listener is None:
+            self.start()
+            return
+        now = time.ticks_ms()
+        for client in self._clients[:]:
+            if time.ticks_diff(now, client.last_active) >= self.keepalive_ms:
+                self._close(client)
+
+    def next_delay(self) -> int:
+        """Returns the ms until an idle connection is due to close, -1 if none"""
+        if not self._clients:
+            return -1
+        now = time.ticks_ms()
+        delay = self.keepalive_ms
+        for client in self._clients:
+            due = self.keepalive_ms - time.ticks_diff(now, client.last_active)
+            delay = min(delay, max(0, due))
+        return delay
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self._listener.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+
+        if len(self._clients) >= self.max_clients:
+            # make room by closing the connection idle the longest, if any
+            idle = None
+            for client in self._clients:
+                if client.out or client.length:
+                    continue
+                if idle is None:
+                    idle = client
+                elif time.ticks_diff(client.last_active, idle.last_active) < 0:
+                    idle = client
+            if idle is None:
+                self.rejected += 1
+                try:
+                    sock.send(self._head(503, 0, True))
+                except OSError:
+                    pass
+                sock.close()
+                return
+            self._close(idle)
+
+        client = _Client(sock, self._buffers.pop())
+        self._clients.append(client)
+        self._poller.register(sock, select.POLLIN)
+        self.generation += 1
+
+    def _close(self, client: _Client) -> None:
+        self._clients.remove(client)
+        self._buffers.append(client.buffer)
+        self._poller.unregister(client.sock)
+        client.sock.close()
+        self.generation += 1
+
+    def _serve(self, client: _Client, flags: int) -> None:
+        """Continue a response, then read and answer any complete requests"""
+        if client.out and not self._write(client):
+            return
+        readable = flags & (select.POLLIN | select.POLLHUP | select.POLLERR)
+        # a full buffer is answered below, as too large
+        if readable and client.length < len(client.buffer):
+            try:
+                count = client.readinto(memoryview(client.buffer)[client.length :])
+            except OSError as exc:
+                if not _again(exc):
+                    self._close(client)
+                    return
+                count = None
+            if count == 0:
+                self._close(client)
+                return
+            if count:
+                client.length += count
+                client.last_active = time.ticks_ms()
+
+        while client.length and not client.out:
+            if not self._answer(client) or not self._write(client):
+                return
+
+    def _answer(self, client: _Client) -> bool:
+        """
+        Queue the response to the buffered request, returns False if the
+        request is still incomplete
+        """
+        buffer = client.buffer
+        head = bytes(buffer[: client.length])
+        end = head.find(b"\r\n\r\n")
+        if end < 0:
+            if client.length < len(buffer):
+                return False
+            self._respond(client, 431, None, False, True)
+            return True
+
+        rest = client.length - end - 4
+        buffer[:rest] = buffer[end + 4 : client.length]
+        client.length = rest
+
+        try:
+            lines = head[:end].decode().split("\r\n")
+        except UnicodeError:
+            lines = [""]
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            self._respond(client, 400, None, False, True)
+            return True
+        method, path, version = parts
+
+        headers = "\r\n".join(lines[1:]).lower()
+        if version == "HTTP/1.0":
+            close = "connection: keep-alive" not in headers
+        else:
+            close = "connection: close" in headers
+        client.served += 1
+        close = close or client.served >= self.max_requests
+
+        if method not in ("GET", "HEAD"):
+            self._respond(client, 405, None, False, close)
+            return True
+        body = self.body(path.split("?", 1)[0])
+        if body is None:
+            self._respond(client, 404, None, False, close)
+        else:
+            self._respond(client, 200, body, method == "HEAD", close)
+        return True
+
+    def _head(self, status: int, length: int, close: bool) -> bytes:
+        return (
+            f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {length}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        ).encode()
+
+    def _respond(self, client, status: int, body, head_only: bool, close: bool):
+        self.requests += 1
+        if status != 200:
+            self.bad_requests += 1
+            body = json.dumps({"error": _REASONS[status]}).encode()
+            if status != 404:
+                # request bodies are not parsed, so the rest of the buffer
+                # cannot be trusted
+                client.length = 0
+                close = True
+        client.out.append(memoryview(self._head(status, len(body), close)))
+        if not head_only:
+            client.out.append(memoryview(body))
+        client.close_after = close
+
+    def _write(self, client: _Client) -> bool:
+        """
+        Send as much of the queued response as the socket takes, returns
+        True if it has all been sent and the connection is still open
+        """
+        while client.out:
+            view = client.out[0]
+            try:
+                sent = client.sock.send(view)
+            except OSError as exc:
+                if not _again(exc):
+                    self._close(client)
+                    return False
+                sent = 0
+            if not sent:
+                break
+            self.bytes_sent += sent
+            client.last_active = time.ticks_ms()
+            if sent < len(view):
+                client.out[0] = view[sent:]
+                break
+            client.out.pop(0)
+
+        if not client.out and client.close_after:
+            self._close(client)
+            return False
+        mask = select.POLLIN | select.POLLOUT if client.out else select.POLLIN
+        if mask != client.mask:
+            # wait for the socket to drain, or stop waiting
+            client.mask = mask
+            self._poller.modify(client.sock, mask)
+            self.generation += 1
+        return not client.out
+
+    # bodies
+
+    def body(self, route: str) -> bytes | None:
+        """Returns the encoded body of `route`, None if there is no such route"""
+        body = self._bodies.get(route)
+        if route == DIAGNOSTICS and body is not None:
+            age = time.ticks_diff(time.ticks_ms(), self._diagnostics_at)
+            if age >= self.diagnostics_ms:
+                body = None
+        if body is not None:
+            return body
+
+        if route == INDEX:
+            body = json.dumps([STATE, DISCOVERY, DIAGNOSTICS]).encode()
+        elif route == STATE:
+            body = json.dumps(self.state()).encode()
+        elif route == DISCOVERY:
+            body = self.discovery()
+        elif route == DIAGNOSTICS:
+            body = json.dumps(self.diagnostics()).encode()
+            self._diagnostics_at = time.ticks_ms()
+        else:
+            return None
+        self._bodies[route] = body
+        return body
+
+    def state(self) -> dict:
+        """The last published value of each interface, by device"""
+        last = self.board._last_published  # pylint: disable=protected-access
+        state = {}
+        for device in self.board.sensors:
+            values = {}
+            for interface in device.interfaces:
+                name = interface.name
+                if name in last:
+                    values[name] = last[name]
+            state[device.name] = values
+        return state
+
+    def discovery(self) -> bytes:
+        """
+        The discovery configs, as a JSON object of topic: config, joined from
+        the payloads each interface has already encoded
+        """
+        body = bytearray(b"{")
+        for device in self.board.sensors:
+            for interface in device.interfaces:
+                topic, message = interface.discovery_config()
+                if len(body) > 1:
+                    body.extend(b", ")
+                body.extend(json.dumps(topic).encode())
+                body.extend(b": ")
+                body.extend(message)
+        body.extend(b"}")
+        return bytes(body)
+
+    def diagnostics(self) -> dict:
+        """Runtime counters of the board"""
+        board = self.board
+        data = {
+            "name": board.name,
+            "uid": board.uid,
+            "version": deviceos.__version__,
+            "ticks_ms": time.ticks_ms(),
+            "connection_state": board.connection_state,
+            "publish": board.publish_stats,
+            "mem_free": getattr(gc, "mem_free", lambda: None)(),
+            "mem_alloc": getattr(gc, "mem_alloc", lambda: None)(),
+            "http": self.stats,
+        }
+        if board.online:
+            data["mqtt"] = {"pings": board.mqtt.pings, "writes": board.mqtt.writes}
+        if board.tls is not None:
+            data["tls"] = board.tls.stats
+        if board.backlog is not None:
+            data["backlog"] = len(board.backlog)
+        scheduler = board.scheduler
+        if scheduler is not None:
+            data["scheduler"] = {
+                "idle_ms": scheduler.idle_ms,
+                "wakeups": scheduler.wakeups,
+                "max_lateness_ms": scheduler.max_lateness_ms,
+            }
+        if board.metrics is not None:
+            data["metrics"] = board.metrics.internal_data
+        data["devices"] = {
+            device.name: {
+                "available": device.available,
+                "overrun_total": device.overrun_total,
+                "quarantine_count": device.quarantine_count,
+            }
+            for device in board.sensors
+        }
+        return data
+
+    @property
+    def stats(self) -> dict:
+        """Request and connection counters"""
+        return {
+            "clients": len(self._clients),
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "bad_requests": self.bad_requests,
+            "bytes_sent": self.bytes_sent,
+        }
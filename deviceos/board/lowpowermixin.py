@@ -0,0 +1,208 @@
+"""
+Mixin class providing a duty-cycled, low power run mode
+"""
+
+import time
+
+import machine  # pylint: disable=import-error
+
+from deviceos.board.backlog import timestamped
+from deviceos.board.connectionmixin import WIFI_DOWN
+
+
+SLEEP_MODES = (None, "light", "deep")
+
+
+class LowPowerMixin:
+    """
+    Adds Board.run_low_power(), an alternative to Board.run()
+
+    Devices are sampled with the radio off, and their state is buffered.
+    Every `batch` intervals, WiFi and MQTT are brought up, the batch is sent,
+    any commands waiting at the broker are handled, and the radio is
+    powered down again.
+
+    Commands sent while the radio is off are only held by the broker if the
+    Board was created with persistent_session=True
+
+    expects batch_limit and batch_dropped to be set. Once batch_limit messages
+    are buffered, more go to the backlog if there is one, or else replace
+    the oldest
+    """
+
+    # attributes are declared in the Board __slots__
+    __slots__ = ()
+
+    def radio_up(self, timeout_ms: int = 30000) -> bool:
+        """
+        Bring WiFi and MQTT up (and discover, if needed), waiting at most
+        `timeout_ms`. Returns True if online
+        """
+        start = time.ticks_ms()
+        self._retry_at = start
+        while not self.connection_step():
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                print(f"could not connect within {timeout_ms}ms")
+                return False
+            self.feed_watchdog()
+            time.sleep_ms(50)
+        # discovery is done on the step after connecting
+        return self.connection_step()
+
+    def radio_down(self) -> None:
+        """Disconnect from the broker and power the WiFi chip down"""
+        if self.mqtt is not None and self.mqtt.sock is not None:
+            try:
+                self.mqtt.disconnect()
+            except OSError:
+                pass
+        self.disconnect_mqtt()
+        self._set_state(WIFI_DOWN)
+        if self.wlan is not None:
+            self.wifi_off()
+
+    def buffer_device(self, device: "Device") -> None:
+        """Add the current state of `device` to the batch"""
+        device.collect()
+        data = device.internal_data
+        if not data or not device.available:
+            return
+        message = bytes(self.encoder.encode(device.interfaces, data))
+        record = (int(time.time()), device.state_topic, message)
+
+        if self.backlog is not None and (
+            self._batch is None or len(self._batch) >= self.batch_limit
+        ):
+            self.backlog.append(record[1], timestamped(record[2], record[0]))
+            return
+        if len(self._batch) >= self.batch_limit:
+            self._batch.pop(0)
+            self.batch_dropped += 1
+        self._batch.append(record)
+
+    @property
+    def batch_size(self) -> int:
+        """Number of state messages awaiting upload"""
+        size = len(self._batch) if self._batch is not None else 0
+        if self.backlog is not None:
+            size += len(self.backlog)
+        return size
+
+    def upload(self, timeout_ms: int = 30000, drain_ms: int = 1000) -> bool:
+        """
+        Bring the radio up, send the batch and handle any commands for up to
+        `drain_ms`, then power down. Returns True if everything was sent
+
+        Anything not sent is kept for the next upload
+        """
+        if not self.radio_up(timeout_ms):
+            self.radio_down()
+            return False
+
+        sent = True
+        while self._batch:
+            timestamp, topic, message = self._batch[0]
+            if not self.send(topic, timestamped(message, timestamp), store=False):
+                sent = False
+                break
+            self._batch.pop(0)
+
+        if self.backlog is not None:
+            while sent and len(self.backlog):
+                before = len(self.backlog)
+                self.replay_backlog()
+                sent = len(self.backlog) < before
+
+        # commands received while connecting, there is no time to coalesce
+        self.apply_commands(flush=True)
+        self.publish_dirty()
+
+        deadline = time.ticks_add(time.ticks_ms(), drain_ms)
+        while self.online:
+            remaining = time.ticks_diff(deadline, time.ticks_ms())
+            if remaining <= 0:
+                break
+            self.wait(self.bound_delay(remaining))
+            self.service()
+        self.apply_commands(flush=True)
+
+        self.radio_down()
+        return sent
+
+    def sleep(self, ms: int, mode: str | None = None) -> None:
+        """
+        Wait `ms`, using machine.lightsleep or deepsleep if `mode` is set
+
+        The wait is split into chunks within watchdog_timeout(), feeding the
+        watchdog between them. Waking from deep sleep resets the board, so
+        only the last chunk of a deep sleep is one
+        """
+        while ms > 0:
+            chunk = self.watchdog_timeout(ms)
+            ms -= chunk
+            if mode == "deep" and ms <= 0:
+                machine.deepsleep(chunk)
+            elif mode is not None:
+                machine.lightsleep(chunk)
+            else:
+                time.sleep_ms(chunk)
+            self.feed_watchdog()
+
+    def run_low_power(
+        self,
+        batch: int = 4,
+        sleep: str | None = None,
+        timeout_ms: int = 30000,
+        drain_ms: int = 1000,
+    ) -> None:
+        """
+        Run, forever, with the radio on only for every `batch` intervals
+
+        Args:
+            batch: intervals between uploads (Default 4)
+            sleep: None to sleep with time.sleep_ms(), "light" to use
+                machine.lightsleep(), or "deep" to use machine.deepsleep()
+            timeout_ms: time allowed to connect, before giving up until the
+                next upload (Default 30000)
+            drain_ms: time to wait for commands on each upload (Default 1000)
+
+        Deep sleep resets the board on waking, so the batch is kept in the
+        Board backlog (which is required), and this should be the last call
+        in main.py. Create the Board with connect=False, so that it does not
+        connect on every wake.
+        """
+        if sleep not in SLEEP_MODES:
+            raise ValueError(f"sleep must be one of {SLEEP_MODES}, not {sleep}")
+        if sleep == "deep" and self.backlog is None:
+            raise ValueError("deep sleep loses RAM, so needs a Backlog")
+
+        print(f"running (low power, uploading every {batch} intervals)")
+        self.start_watchdog()
+        interval_ms = int(self.interval * 1000)
+
+        if sleep == "deep":
+            # a single wake: sample, upload if the batch is complete, sleep
+            for sensor in self.sensors:
+                sensor.internal_device_read(force=True)
+                self.buffer_device(sensor)
+            if len(self.backlog) >= batch * len(self.sensors):
+                self.upload(timeout_ms=timeout_ms, drain_ms=drain_ms)
+            self.sleep(interval_ms, sleep)
+            return
+
+        self._batch = []
+        self.radio_down()
+        cycles = 0
+        while True:
+            start = time.ticks_ms()
+            self.feed_watchdog()
+            for sensor in self.sensors:
+                if sensor.internal_device_read():
+                    self.buffer_device(sensor)
+
+            cycles += 1
+            if cycles >= batch:
+                cycles = 0
+                self.upload(timeout_ms=timeout_ms, drain_ms=drain_ms)
+
+            self.sleep(interval_ms - time.ticks_diff(time.ticks_ms(), start), sleep)
@@ -4,26 +4,7 @@ Mixin class providing MQTT functionality
 
 import time
 
-try:
-    from umqtt.simple import MQTTClient
-except ImportError:
-    import mip
-
-    try:
-        import secrets as s  # type:  ignore
-
-        import network  # pylint: disable=import-error
-
-        wlan = network.WLAN(network.STA_IF)
-        wlan.connect(s.wifi["ssid"], s.wifi["pass"])
-        while not wlan.isconnected() and wlan.status() >= 0:
-            print("waiting for wifi for mip install")
-    except Exception as ex:
-        print("Failed wifi init when attempting to install umqtt.simple")
-        raise ex
-
-    mip.install("umqtt.simple")
-    from umqtt.simple import MQTTClient
+from deviceos.board.transport import MQTTTransport
 
 
 class MQTTMixin:
@@ -33,74 +14,208 @@ class MQTTMixin:
     expects a host and password at _mqtt_host and _mqtt_pass
     """
 
-    __slots__ = [
-        "_mqtt",
-        "_mqtt_host",
-        "_mqtt_user",
-        "_mqtt_pass",
-        "_mqtt_port",
-        "_subscription_dispatch",
-    ]
+    # attributes are declared in the Board __slots__
+    __slots__ = ()
 
     @property
-    def mqtt(self) -> MQTTClient:
-        """Returns the internal MQTTClient object"""
+    def mqtt(self) -> MQTTTransport:
+        """Returns the internal MQTTTransport object"""
         if not hasattr(self, "_mqtt"):
             return None
         return self._mqtt
 
+    def try_connect_mqtt(self) -> bool:
+        """
+        Make a single attempt to connect to the broker, returns True on success
+
+        The client object is created once, and reused for later reconnects.
+        This blocks for the socket connect, any TLS handshake, the CONNACK and
+        the SUBACKs, so one attempt can hold up the run loop for as long as
+        these take
+        """
+        if self.mqtt is None:
+            self._mqtt = MQTTTransport(
+                # a persistent session is looked up by client id
+                client_id=self.uid if self.persistent_session else "",
+                server=self._mqtt_host,
+                port=self._mqtt_port,
+                user=self._mqtt_user,
+                password=self._mqtt_pass,
+                keepalive=self._mqtt_keepalive,
+                # umqtt.simple calls ssl.wrap_socket(), see TLS
+                ssl=self.tls,
+            )
+            self._mqtt.set_callback(self.callback)
+        else:
+            self.disconnect_mqtt()
+
+        try:
+            self.mqtt.connect(clean_session=not self.persistent_session)
+        except OSError:
+            return False
+        if self.tls is not None:
+            self.tls.save_session()
+
+        # a single wildcard covers every Input, rather than one per Input
+        qos = 1 if self.persistent_session else 0
+        try:
+            for topic in self._subscriptions:
+                print(f"subscribing to topic {topic}")
+                # QoS 1 subscriptions are queued by the broker while disconnected
+                self.mqtt.subscribe(topic, qos=qos)
+        except OSError:
+            return False
+        return True
+
+    def disconnect_mqtt(self) -> None:
+        """Close the socket of any previous connection"""
+        sock = getattr(self.mqtt, "sock", None)
+        if sock is None:
+            return
+        try:
+            sock.close()
+        except OSError:
+            pass
+        self.mqtt.sock = None
+
     def connect_to_mqtt(self) -> bool:
-        """Attempts to connect to the broker"""
-        self._mqtt = MQTTClient(
-            client_id="",
-            server=self._mqtt_host,
-            port=self._mqtt_port,
-            user=self._mqtt_user,
-            password=self._mqtt_pass,
-            keepalive=61,
-            ssl=False,
-        )
-        connected = False
+        """Attempts to connect to the broker, waiting for the connection"""
         n_ellipses = 0
         max_ellipses = 3
-        while not connected:
-            try:
-                n_ellipses += 1
-                if n_ellipses > max_ellipses:
-                    n_ellipses = 1
+        while not self.try_connect_mqtt():
+            n_ellipses += 1
+            if n_ellipses > max_ellipses:
+                n_ellipses = 1
 
-                print(
-                    "Connecting to MQTT Broker" + "." * n_ellipses,
-                    end=" " * max_ellipses + "\r",
-                )
-                self.mqtt.connect()
-                connected = True
-            except OSError:  # pylint: disable=broad-exception-caught
-                time.sleep(0.5)
-
-        print("Connecting to MQTT Broker... Done.")        
+            print(
+                "Connecting to MQTT Broker" + "." * n_ellipses,
+                end=" " * max_ellipses + "\r",
+            )
+            self.feed_watchdog()
+            time.sleep(0.5)
 
-        self.subscribe("homeassistant/status", self.status_change)
+        print("Connecting to MQTT Broker... Done.")
         return True
 
-    def publish(self, topic: str, message: str, retain: bool = False) -> None:
-        """Passthrough for umqtt.simple MQTTClient.publish"""
+    def publish(self, topic: str, message: str, retain: bool = False) -> bool:
+        """
+        Passthrough for MQTTTransport.publish, returns False if it failed
+
+        Messages are queued for the writer task when running under run_async(),
+        or sent through the QoS 1 pipeline during a discovery burst. Those
+        count as sent, and report failure by other means
+        """
+        pipeline = getattr(self, "pipeline", None)
+        if pipeline is not None and pipeline.bursting:
+            pipeline.submit(topic=topic, message=message, retain=retain)
+            return True
+        if self.is_async:
+            self.queue_publish(topic=topic, message=message, retain=retain)
+            return True
+        return self.send(topic=topic, message=message, retain=retain)
+
+    def send(
+        self, topic: str, message: str, retain: bool = False, store: bool = True
+    ) -> bool:
+        """
+        Publish `message` immediately, returns True on success
+
+        State messages that cannot be sent are stored in the Board backlog,
+        if there is one, unless `store` is False
+        """
+        backlog = getattr(self, "backlog", None)
+        if self._reset_flag:
+            if store and backlog is not None and not retain:
+                backlog.append(topic, message)
+            return False
+
+        metrics = getattr(self, "metrics", None)
         try:
-            self.mqtt.publish(topic=topic, msg=message, retain=retain)
+            if metrics is None:
+                self.mqtt.publish(topic=topic, msg=message, retain=retain)
+            else:
+                start = time.ticks_us()
+                self.mqtt.publish(topic=topic, msg=message, retain=retain)
+                metrics.record_publish(
+                    time.ticks_diff(time.ticks_us(), start), len(topic) + len(message)
+                )
         except OSError as exc:
+            if store and backlog is not None and not retain:
+                backlog.append(topic, message)
             # if the connection fails, we probably need to go into a reset state
             print(f"OSError: {str(exc)}, entering reset state")
             self.enter_reset()
+            return False
+        return True
+
+    def watchdog_timeout(self, timeout_ms: int) -> int:
+        """Bound `timeout_ms` to half of the watchdog period, if there is one"""
+        watchdog_ms = getattr(self, "watchdog_ms", None)
+        if watchdog_ms is None:
+            return timeout_ms
+        return min(timeout_ms, watchdog_ms // 2)
+
+    def check_msg(self) -> int | None:
+        """
+        Passthrough for MQTTTransport.check_msg, handling any PUBACK for the
+        publish pipeline
+        """
+        op = self.mqtt.check_msg()
+        if op == 0x40:
+            pipeline = getattr(self, "pipeline", None)
+            if pipeline is not None:
+                pipeline.ack(self.mqtt.acked)
+        return op
+
+    def keep_alive(self) -> None:
+        """Send a PINGREQ if one is due, resetting if the broker is not there"""
+        if not self.online:
+            return
+        try:
+            self.mqtt.keep_alive()
+        except OSError as exc:
+            print(f"OSError: {str(exc)}, entering reset state")
+            self.enter_reset()
+
+    def flush_pipeline(self, timeout_ms: int = 10000) -> list:
+        """
+        Send everything submitted to the pipeline, waiting for the PUBACKs
+
+        Returns the topics of any messages which were not acknowledged
+        """
+        pipeline = self.pipeline
+        timeout_ms = self.watchdog_timeout(timeout_ms)
+        start = time.ticks_ms()
+        while pipeline.pending and self.online:
+            if time.ticks_diff(time.ticks_ms(), start) > timeout_ms:
+                break
+            if pipeline.exhausted:
+                break
+            try:
+                pipeline.pump(self.mqtt)
+            except OSError as exc:
+                print(f"OSError: {str(exc)}, entering reset state")
+                self.enter_reset()
+                break
+            self.wait(20)
+
+        failed = pipeline.end_burst()
+        print(f"publish burst: {pipeline.last_burst}")
+        return failed
 
     def status_change(self, msg: str):
         print(f"received status change: {msg}")
         if msg == "offline":
-            print("Broker offline. Sleeping for 30s and resetting.")
-            time.sleep(30)
-            self.enter_reset()
+            print("Broker offline. Reconnecting in 30s.")
+            self.defer_reconnect(30000)
 
         elif msg == "online":
-            self.discover()
+            if self.is_async:
+                # rediscovered by the reader task, without blocking
+                self._discovered = False
+            else:
+                self.discover()
+            self.publish_state(force=True)
 
     def callback(self, topic: str, msg: str):
         """
@@ -110,26 +225,35 @@ class MQTTMixin:
             topic: topic of received message
             msg: message received from mqtt broker
         """
-        msg = msg.decode()
-        topic = topic.decode()
-        print(f"received message: {msg} on topic {topic}")
+        handler = self._routes.match(topic)
+        if handler is None:
+            # not decoded, as no one is interested in it
+            return
 
-        dispatch = getattr(self, "_subscription_dispatch", {})
-        if topic in dispatch:
-            dispatch[topic](msg)
+        msg = msg.decode()
+        print(f"received message: {msg} on topic {topic.decode()}")
+        handler(msg)
 
-        self.once(force=True)
+        if not self._dirty:
+            # coalesced, or already echoed
+            return
+        if self.is_async:
+            self.refresh()
+        elif self.online:
+            # otherwise, published once the connection is up
+            self.publish_dirty()
 
     def subscribe(self, topic: str, callback: "Callable"):
         """
         Subscribe to topic `topic`, and link it to callback `callback`
-        """
-        print(f"subscribing to topic {topic}")
-        if not hasattr(self, "_subscription_dispatch"):
-            print("creating subscription dispatch table")
-
-            self._subscription_dispatch = {}
 
-        self.mqtt.set_callback(self.callback)
-        self._subscription_dispatch[topic] = callback
-        self.mqtt.subscribe(topic)
+        The subscription is renewed on every reconnect. Input command topics
+        are already covered, and only need Board.route()
+        """
+        self.route(topic, callback)
+        if topic in self._subscriptions:
+            return
+        self._subscriptions.append(topic)
+        if self.online:
+            print(f"subscribing to topic {topic}")
+            self.mqtt.subscribe(topic, qos=1 if self.persistent_session else 0)
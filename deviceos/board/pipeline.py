@@ -0,0 +1,182 @@
+"""
+Windowed QoS 1 publishing, for discovery bursts
+"""
+
+import struct
+import time
+
+
+class PublishPipeline:
+    """
+    Sends QoS 1 publishes with up to `window` messages awaiting PUBACK at once
+
+    umqtt.simple waits for the PUBACK of each QoS 1 message before sending the
+    next. Here, packet IDs are tracked so that several can be in flight, and
+    any message not acknowledged within `timeout_ms` is resent (with the DUP
+    flag), up to `max_retries` times.
+
+    Args:
+        window: max number of unacknowledged messages (Default 8)
+        timeout_ms: time to wait for a PUBACK before resending (Default 2000)
+        max_retries: resends before a message is given up on (Default 3)
+
+    Attributes:
+        bursting: True between begin_burst() and end_burst()
+        last_burst: timing stats of the last completed burst
+    """
+
+    __slots__ = [
+        "window",
+        "timeout_ms",
+        "max_retries",
+        "bursting",
+        "last_burst",
+        "_queue",
+        "_in_flight",
+        "_pid",
+        "_burst_start",
+        "_sent",
+        "_retransmits",
+        "_max_in_flight",
+    ]
+
+    def __init__(
+        self, window: int = 8, timeout_ms: int = 2000, max_retries: int = 3
+    ):
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.max_retries = max_retries
+
+        self.bursting = False
+        self.last_burst = {}
+
+        self._queue = []
+        # pid: [topic, message, retain, sent_at, retries]
+        self._in_flight = {}
+        self._pid = 0
+
+        self._burst_start = 0
+        self._sent = 0
+        self._retransmits = 0
+        self._max_in_flight = 0
+
+    def __repr__(self) -> str:
+        return f"PublishPipeline({len(self._in_flight)}/{self.window} in flight)"
+
+    @property
+    def pending(self) -> int:
+        """Number of messages queued or awaiting a PUBACK"""
+        return len(self._queue) + len(self._in_flight)
+
+    def begin_burst(self) -> None:
+        """Start collecting messages for a burst"""
+        self.bursting = True
+        self._burst_start = time.ticks_ms()
+        self._sent = 0
+        self._retransmits = 0
+        self._max_in_flight = 0
+
+    def end_burst(self) -> list:
+        """
+        Finish the burst, dropping anything still unacknowledged
+
+        Returns the topics of any dropped messages
+        """
+        failed = [item[0] for item in self._queue]
+        failed.extend(item[0] for item in self._in_flight.values())
+        self._queue = []
+        self._in_flight = {}
+
+        self.bursting = False
+        self.last_burst = {
+            "messages": self._sent,
+            "retransmits": self._retransmits,
+            "failed": len(failed),
+            "max_in_flight": self._max_in_flight,
+            "duration_ms": time.ticks_diff(time.ticks_ms(), self._burst_start),
+        }
+        return failed
+
+    def submit(self, topic: str, message: str | bytes, retain: bool = False) -> None:
+        """Queue a message for sending"""
+        if isinstance(message, memoryview):
+            # the encoder buffer is reused before this is sent, or resent
+            message = bytes(message)
+        self._queue.append((topic, message, retain))
+
+    def ack(self, pid: int) -> None:
+        """Handle a PUBACK for packet `pid`"""
+        self._in_flight.pop(pid, None)
+
+    def _next_pid(self) -> int:
+        while True:
+            self._pid = self._pid % 65535 + 1
+            if self._pid not in self._in_flight:
+                return self._pid
+
+    def _write(self, sock, pid: int, item: list, dup: bool = False) -> None:
+        """Encode and write a QoS 1 PUBLISH as a single write"""
+        topic, message, retain = item[0], item[1], item[2]
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(message, str):
+            message = message.encode()
+
+        remaining = 2 + len(topic) + 2 + len(message)
+        header = bytearray(b"\x32")
+        if retain:
+            header[0] |= 0x01
+        if dup:
+            header[0] |= 0x08
+        while True:
+            byte = remaining & 0x7F
+            remaining >>= 7
+            if remaining:
+                header.append(byte | 0x80)
+            else:
+                header.append(byte)
+                break
+
+        packet = header + struct.pack("!H", len(topic)) + topic
+        packet += struct.pack("!H", pid) + message
+        sock.write(packet)
+
+    def pump(self, sock) -> None:
+        """
+        Send queued messages while there is space in the window, and resend
+        any that have timed out. Raises OSError on a socket failure
+        """
+        now = time.ticks_ms()
+        for pid, item in list(self._in_flight.items()):
+            if time.ticks_diff(now, item[3]) < self.timeout_ms:
+                continue
+            if item[4] >= self.max_retries:
+                continue
+            item[3] = now
+            item[4] += 1
+            self._retransmits += 1
+            self._write(sock, pid, item, dup=True)
+
+        while self._queue and len(self._in_flight) < self.window:
+            topic, message, retain = self._queue.pop(0)
+            item = [topic, message, retain, now, 0]
+            pid = self._next_pid()
+            self._in_flight[pid] = item
+            self._write(sock, pid, item)
+            self._sent += 1
+
+        if len(self._in_flight) > self._max_in_flight:
+            self._max_in_flight = len(self._in_flight)
+
+    @property
+    def exhausted(self) -> bool:
+        """True if every remaining message has used all of its retries"""
+        if self._queue:
+            return False
+        now = time.ticks_ms()
+        for item in self._in_flight.values():
+            if item[4] < self.max_retries:
+                return False
+            if time.ticks_diff(now, item[3]) < self.timeout_ms:
+                return False
+        return True
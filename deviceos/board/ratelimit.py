@@ -0,0 +1,68 @@
+"""
+Token bucket, capping the rate of state messages sent by a board
+"""
+
+import time
+
+
+class RateLimiter:
+    """
+    Allows `rate` events per second on average, in bursts of up to `burst`
+
+    Tokens are counted in thousandths, so that refilling over ticks_ms needs
+    only integer math.
+
+    Args:
+        rate: events per second
+        burst: max events allowed at once (Default max(1, rate))
+    """
+
+    __slots__ = ["rate", "burst", "limited", "_tokens", "_capacity", "_last"]
+
+    def __init__(self, rate: float, burst: int | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst is None:
+            burst = max(1, int(rate))
+        self.rate = rate
+        self.burst = burst
+        # events held back
+        self.limited = 0
+
+        self._capacity = burst * 1000
+        self._tokens = self._capacity
+        self._last = time.ticks_ms()
+
+    def __repr__(self) -> str:
+        return f"RateLimiter({self.rate}/s, burst {self.burst})"
+
+    def _refill(self) -> None:
+        now = time.ticks_ms()
+        elapsed = time.ticks_diff(now, self._last)
+        if elapsed <= 0:
+            return
+        self._last = now
+        tokens = self._tokens + int(elapsed * self.rate)
+        self._tokens = tokens if tokens < self._capacity else self._capacity
+
+    def ready(self) -> bool:
+        """Returns True if an event is allowed now, without taking it"""
+        self._refill()
+        return self._tokens >= 1000
+
+    def take(self) -> bool:
+        """Take one event, returns False if it must be held back"""
+        self._refill()
+        if self._tokens < 1000:
+            self.limited += 1
+            return False
+        self._tokens -= 1000
+        return True
+
+    def delay_ms(self) -> int:
+        """Returns the ms until the next event is allowed"""
+        self._refill()
+        missing = 1000 - self._tokens
+        if missing <= 0:
+            return 0
+        return int(missing / self.rate) + 1
@@ -0,0 +1,106 @@
+"""
+Deadline-driven scheduler for the Board run loop
+
+Keeps a min-heap of next-due times, so the board can block until the next
+device read or publish is due instead of spinning on the clock.
+"""
+
+import heapq
+import time
+
+
+class Scheduler:
+    """
+    Min-heap of periodic tasks, keyed on a monotonic millisecond clock
+
+    The clock is accumulated from `time.ticks_diff`, so it does not suffer
+    from the wraparound of the raw `time.ticks_ms` counter.
+
+    Attributes:
+        idle_ms: total time spent blocked waiting for the next deadline
+        wakeups: number of times the loop has woken from a wait
+        max_lateness_ms: largest observed delay between due time and run time
+    """
+
+    __slots__ = [
+        "_heap",
+        "_seq",
+        "_now",
+        "_last_ticks",
+        "idle_ms",
+        "wakeups",
+        "max_lateness_ms",
+    ]
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+
+        self._now = 0
+        self._last_ticks = time.ticks_ms()
+
+        self.idle_ms = 0
+        self.wakeups = 0
+        self.max_lateness_ms = 0
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def now(self) -> int:
+        """Returns the monotonic scheduler time in ms"""
+        ticks = time.ticks_ms()
+        self._now += time.ticks_diff(ticks, self._last_ticks)
+        self._last_ticks = ticks
+        return self._now
+
+    def add(self, interval: int | float, callback: "Callable", delay: int = 0) -> None:
+        """
+        Add a periodic task
+
+        Args:
+            interval: period in seconds, fractions are allowed
+            callback: function to call when due, takes no arguments
+            delay: ms to wait before the first call (Default 0, run immediately)
+        """
+        interval_ms = max(1, int(interval * 1000))
+        self._seq += 1
+        heapq.heappush(
+            self._heap, (self.now() + delay, self._seq, interval_ms, callback)
+        )
+
+    def next_delay(self) -> int:
+        """Returns the ms until the next task is due, -1 if there are no tasks"""
+        if not self._heap:
+            return -1
+        return max(0, self._heap[0][0] - self.now())
+
+    def run_pending(self) -> int:
+        """
+        Run all due tasks, rescheduling each for its next period
+
+        Returns the number of tasks run
+        """
+        count = 0
+        now = self.now()
+        while self._heap and self._heap[0][0] <= now:
+            due, seq, interval_ms, callback = heapq.heappop(self._heap)
+
+            lateness = now - due
+            if lateness > self.max_lateness_ms:
+                self.max_lateness_ms = lateness
+
+            # skip any missed periods rather than firing a burst to catch up
+            due += interval_ms
+            if due <= now:
+                due = now + interval_ms
+            heapq.heappush(self._heap, (due, seq, interval_ms, callback))
+
+            callback()
+            count += 1
+            now = self.now()
+        return count
+
+    def record_wait(self, waited_ms: int) -> None:
+        """Track time spent blocked between deadlines"""
+        self.idle_ms += waited_ms
+        self.wakeups += 1
@@ -0,0 +1,213 @@
+"""
+TLS for the broker connection, with the context and CA certificate loaded once
+"""
+
+import gc
+import ssl
+import time
+
+
+def _mem_free() -> int | None:
+    return getattr(gc, "mem_free", lambda: None)()
+
+
+class TLS:
+    """
+    TLS settings for Board(tls=...), passed to umqtt.simple as its `ssl`
+
+    The SSLContext (and the CA certificate it holds) is built on the first
+    connection, and reused for every reconnect. The TLS session of each
+    connection is kept, and offered on the next handshake, so that a
+    reconnect to the same broker can skip the full handshake. A full
+    handshake takes seconds on an rp2040, a resumed one a fraction of that.
+
+    Resumption needs an ssl module with CPython's `session` API. MicroPython's
+    does not have it, which is detected on the first connection, after which
+    `resume` is False and every handshake is a full one.
+
+    Args:
+        ca: path of the CA certificate (PEM or DER) to verify the broker
+            against. None to skip verification, which is insecure
+        cert: path of a client certificate, for brokers which require one
+        key: path of the private key for `cert`
+        server_hostname: name to verify the broker certificate against
+            (Default the mqtt host)
+        resume: offer the previous session on reconnect, where supported
+            (Default True)
+
+    Attributes:
+        handshakes: handshakes completed
+        resumed: handshakes which resumed the previous session
+        last_handshake_ms: duration of the last handshake
+        max_handshake_ms: longest handshake
+        heap_used: heap taken by the last handshake and kept by the
+            connection, None if gc.mem_free() is unavailable
+        min_mem_free: lowest free heap seen after a handshake
+    """
+
+    __slots__ = [
+        "ca",
+        "cert",
+        "key",
+        "server_hostname",
+        "resume",
+        "handshakes",
+        "resumed",
+        "last_handshake_ms",
+        "max_handshake_ms",
+        "heap_used",
+        "min_mem_free",
+        "_context",
+        "_session",
+        "_sock",
+    ]
+
+    def __init__(
+        self,
+        ca: str | None = None,
+        cert: str | None = None,
+        key: str | None = None,
+        server_hostname: str | None = None,
+        resume: bool = True,
+    ):
+        self.ca = ca
+        self.cert = cert
+        self.key = key
+        self.server_hostname = server_hostname
+        self.resume = resume
+
+        self.handshakes = 0
+        self.resumed = 0
+        self.last_handshake_ms = None
+        self.max_handshake_ms = 0
+        self.heap_used = None
+        self.min_mem_free = None
+
+        self._context = None
+        self._session = None
+        # socket of the last handshake, until its session has been saved
+        self._sock = None
+
+    def __repr__(self) -> str:
+        return f"TLS({self.ca}, {self.resumed}/{self.handshakes} resumed)"
+
+    @property
+    def context(self) -> "ssl.SSLContext":
+        """Returns the SSLContext, building it on first use"""
+        if self._context is None:
+            self._context = self.build_context()
+        return self._context
+
+    def build_context(self) -> "ssl.SSLContext":
+        """Create the SSLContext, loading the certificates from flash"""
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        if self.ca is None:
+            print("TLS: no CA given, the broker will not be verified")
+            if hasattr(context, "check_hostname"):
+                context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            with open(self.ca, "rb") as file:
+                cadata = file.read()
+            if cadata.startswith(b"-----"):
+                # PEM is passed as text, DER as bytes
+                cadata = cadata.decode()
+            context.load_verify_locations(cadata=cadata)
+            context.verify_mode = ssl.CERT_REQUIRED
+
+        if self.cert is not None:
+            context.load_cert_chain(self.cert, self.key)
+        return context
+
+    def wrap_socket(self, sock, server_hostname: str | None = None):
+        """
+        Handshake over the connected `sock`, as umqtt.simple's connect() asks
+        SSLContext to, offering the previous session if there is one
+        """
+        context = self.context
+        if self.server_hostname is not None:
+            server_hostname = self.server_hostname
+
+        gc.collect()
+        before = _mem_free()
+        start = time.ticks_ms()
+
+        session = self._session if self.resume else None
+        try:
+            if session is None:
+                wrapped = context.wrap_socket(sock, server_hostname=server_hostname)
+            else:
+                wrapped = context.wrap_socket(
+                    sock, server_hostname=server_hostname, session=session
+                )
+        except TypeError:
+            # this port's ssl module cannot resume sessions
+            print("TLS: session resumption is not supported")
+            self.resume = False
+            wrapped = context.wrap_socket(sock, server_hostname=server_hostname)
+        except Exception:
+            # the broker may have forgotten the session
+            self._session = None
+            raise
+
+        elapsed = time.ticks_diff(time.ticks_ms(), start)
+        resumed = bool(getattr(wrapped, "session_reused", False))
+        self.record(elapsed, resumed, before)
+        self._sock = wrapped
+        return wrapped
+
+    def record(self, elapsed_ms: int, resumed: bool, mem_free: int | None) -> None:
+        """Update the handshake stats"""
+        self.handshakes += 1
+        if resumed:
+            self.resumed += 1
+        self.last_handshake_ms = elapsed_ms
+        if elapsed_ms > self.max_handshake_ms:
+            self.max_handshake_ms = elapsed_ms
+
+        after = _mem_free()
+        if mem_free is not None and after is not None:
+            self.heap_used = mem_free - after
+            if self.min_mem_free is None or after < self.min_mem_free:
+                self.min_mem_free = after
+
+        kind = "resumed" if resumed else "full"
+        heap = "" if self.heap_used is None else f", heap {self.heap_used} B"
+        print(f"TLS handshake: {elapsed_ms} ms, {kind}{heap}")
+
+    def save_session(self) -> None:
+        """
+        Keep the session of the last handshake, for the next reconnect
+
+        Called once the connection is up, as TLS 1.3 brokers only send the
+        session ticket after the handshake
+        """
+        sock = self._sock
+        self._sock = None
+        if sock is None or not self.resume:
+            return
+        if not hasattr(sock, "session"):
+            # this port's ssl module cannot export sessions
+            print("TLS: session resumption is not supported")
+            self.resume = False
+            return
+        session = sock.session
+        if session is not None:
+            self._session = session
+
+    def forget_session(self) -> None:
+        """Drop the saved session, so the next handshake is a full one"""
+        self._session = None
+
+    @property
+    def stats(self) -> dict:
+        """Handshake counters, timings and heap use"""
+        return {
+            "resumption": self.resume,
+            "handshakes": self.handshakes,
+            "resumed": self.resumed,
+            "last_handshake_ms": self.last_handshake_ms,
+            "max_handshake_ms": self.max_handshake_ms,
+            "heap_used": self.heap_used,
+            "min_mem_free": self.min_mem_free,
+        }
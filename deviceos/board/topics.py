@@ -0,0 +1,83 @@
+"""
+Topic trie, routing incoming MQTT messages to their callbacks
+"""
+
+
+class TopicTrie:
+    """
+    Routes topics to callbacks, level by level
+
+    Topics are matched as bytes, as umqtt.simple delivers them, so a message
+    on an unknown topic is rejected at its first unknown level without ever
+    being decoded. Routes may use the single level wildcard "+", an exact
+    level is preferred over a wildcard.
+    """
+
+    __slots__ = ["_root", "size"]
+
+    def __init__(self):
+        # level: child node. A route ending at a node is stored at key None
+        self._root = {}
+        self.size = 0
+
+    def __repr__(self) -> str:
+        return f"TopicTrie({self.size} routes)"
+
+    def __len__(self) -> int:
+        return self.size
+
+    def insert(self, topic: str | bytes, callback: "Callable") -> None:
+        """Route `topic` to `callback`, replacing any existing route"""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        node = self._root
+        for level in topic.split(b"/"):
+            child = node.get(level)
+            if child is None:
+                child = node[level] = {}
+            node = child
+        if None not in node:
+            self.size += 1
+        node[None] = callback
+
+    def remove(self, topic: str | bytes) -> bool:
+        """Remove the route for `topic`, returns True if there was one"""
+        if isinstance(topic, str):
+            topic = topic.encode()
+        path = [self._root]
+        for level in topic.split(b"/"):
+            node = path[-1].get(level)
+            if node is None:
+                return False
+            path.append(node)
+        if path[-1].pop(None, None) is None:
+            return False
+        self.size -= 1
+
+        # prune the nodes left empty
+        levels = topic.split(b"/")
+        for index in range(len(levels), 0, -1):
+            if path[index]:
+                break
+            del path[index - 1][levels[index - 1]]
+        return True
+
+    def match(self, topic: bytes) -> "Callable | None":
+        """Returns the callback routed from `topic`, None if there is none"""
+        return self._match(self._root, topic, 0)
+
+    def _match(self, node: dict, topic: bytes, start: int) -> "Callable | None":
+        end = topic.find(b"/", start)
+        last = end < 0
+        level = topic[start:] if last else topic[start:end]
+
+        child = node.get(level)
+        if child is not None:
+            callback = child.get(None) if last else self._match(child, topic, end + 1)
+            if callback is not None:
+                return callback
+
+        child = node.get(b"+")
+        if child is None:
+            return None
+        return child.get(None) if last else self._match(child, topic, end + 1)
@@ -0,0 +1,343 @@
+"""
+umqtt.simple client with buffered writes, non-blocking reads and keepalive
+"""
+
+import struct
+import time
+
+from umqtt.simple import MQTTClient, MQTTException  # pylint: disable=import-error
+
+
+_PINGREQ = b"\xc0\x00"
+
+
+class MQTTTransport(MQTTClient):
+    """
+    MQTTClient which owns the framing of the socket in both directions
+
+    umqtt.simple writes each packet in up to five small writes, and reads
+    incoming packets with the socket switched back to blocking part way
+    through, so a packet split over two TCP segments stalls the board. Here:
+
+    - each packet is encoded into a reusable buffer and sent with one write,
+      with any PUBACKs owed sent along with it
+    - check_msg() reads whatever has arrived without blocking, and keeps a
+      partial packet buffered until the rest arrives
+    - PINGREQ is sent whenever nothing has been sent for half of `keepalive`,
+      and a connection which does not answer is reported as failed
+
+    The client is created once by the Board, and reused for every reconnect.
+    Other arguments are as for MQTTClient
+
+    Args:
+        buffer_size: initial size of the read and write buffers (Default 512),
+            they grow if a packet does not fit
+
+    Attributes:
+        acked: packet id of the last PUBACK read
+        pings: PINGREQs sent
+        writes: socket writes made
+    """
+
+    def __init__(self, *args, buffer_size: int = 512, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._out = bytearray(buffer_size)
+        self._out_len = 0
+        self._in = bytearray(buffer_size)
+        self._in_view = memoryview(self._in)
+        self._in_start = 0
+        self._in_end = 0
+        self._in_body = 0
+        self._blocking = None
+
+        self.acked = None
+        self.pings = 0
+        self.writes = 0
+        self._last_tx = time.ticks_ms()
+        self._ping_sent = None
+        self._suback = None
+
+    def __repr__(self) -> str:
+        return f"MQTTTransport({self.server}:{self.port})"
+
+    def connect(self, clean_session: bool = True) -> bool:
+        self._in_start = self._in_end = 0
+        self._out_len = 0
+        self._blocking = None
+        self._ping_sent = None
+        present = super().connect(clean_session)
+        self._last_tx = time.ticks_ms()
+        return present
+
+    # writing
+
+    def _reserve(self, size: int) -> None:
+        if self._out_len + size > len(self._out):
+            grown = bytearray(max(2 * len(self._out), self._out_len + size))
+            grown[: self._out_len] = self._out[: self._out_len]
+            self._out = grown
+
+    def _put(self, data) -> None:
+        size = len(data)
+        self._reserve(size)
+        self._out[self._out_len : self._out_len + size] = data
+        self._out_len += size
+
+    def _put_header(self, header: int, remaining: int) -> None:
+        self._reserve(5)
+        out = self._out
+        out[self._out_len] = header
+        self._out_len += 1
+        while True:
+            byte = remaining & 0x7F
+            remaining >>= 7
+            out[self._out_len] = byte | 0x80 if remaining else byte
+            self._out_len += 1
+            if not remaining:
+                return
+
+    def _put_u16(self, value: int) -> None:
+        self._reserve(2)
+        struct.pack_into("!H", self._out, self._out_len, value)
+        self._out_len += 2
+
+    def _next_pid(self) -> int:
+        """Returns the next packet id, from 1 to 65535"""
+        self.pid = self.pid % 65535 + 1
+        return self.pid
+
+    def flush(self) -> None:
+        """Send everything buffered, in a single write"""
+        if not self._out_len:
+            return
+        self._set_blocking(True)
+        self.sock.write(self._out, self._out_len)
+        self._out_len = 0
+        self.writes += 1
+        self._last_tx = time.ticks_ms()
+
+    def write(self, data, length: int | None = None) -> int:
+        """
+        Send a packet encoded elsewhere (see PublishPipeline), along with
+        anything buffered
+        """
+        if length is None:
+            length = len(data)
+        self._put(memoryview(data)[:length])
+        self.flush()
+        return length
+
+    def publish(self, topic, msg, retain: bool = False, qos: int = 0) -> None:
+        if qos > 1:
+            raise MQTTException("QoS 2 is not supported")
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(msg, str):
+            msg = msg.encode()
+        remaining = 2 + len(topic) + len(msg)
+        self._put_header(0x30 | qos << 1 | retain, remaining + 2 * qos)
+        self._put_u16(len(topic))
+        self._put(topic)
+        if qos:
+            pid = self._next_pid()
+            self._put_u16(pid)
+        self._put(msg)
+        self.flush()
+
+        if qos:
+            # bursts of QoS 1 messages are better sent with PublishPipeline
+            self.acked = None
+            while self.acked != pid:
+                self.wait_msg()
+
+    def subscribe(self, topic, qos: int = 0) -> None:
+        assert self.cb is not None, "Subscribe callback is not set"
+        if isinstance(topic, str):
+            topic = topic.encode()
+        pid = self._next_pid()
+        self._put_header(0x82, 2 + 2 + len(topic) + 1)
+        self._put_u16(pid)
+        self._put_u16(len(topic))
+        self._put(topic)
+        self._put(bytes((qos,)))
+        self.flush()
+
+        self._suback = None
+        while self._suback is None or self._suback[0] != pid:
+            self.wait_msg()
+        if self._suback[1] == 0x80:
+            raise MQTTException(0x80)
+
+    def ping(self) -> None:
+        self._put(_PINGREQ)
+        self.flush()
+        self.pings += 1
+        self._ping_sent = time.ticks_ms()
+
+    def disconnect(self) -> None:
+        self._put(b"\xe0\x00")
+        self.flush()
+        self.sock.close()
+
+    # keepalive
+
+    def ping_delay(self) -> int:
+        """Returns the ms until a PINGREQ is due, -1 if keepalive is off"""
+        if not self.keepalive:
+            return -1
+        idle = time.ticks_diff(time.ticks_ms(), self._last_tx)
+        return max(0, self.keepalive * 500 - idle)
+
+    def keep_alive(self) -> None:
+        """
+        Send a PINGREQ if one is due, raises OSError if the last one went
+        unanswered for `keepalive` seconds
+        """
+        if not self.keepalive:
+            return
+        if self._ping_sent is not None:
+            waited = time.ticks_diff(time.ticks_ms(), self._ping_sent)
+            if waited > self.keepalive * 1000:
+                raise OSError("keepalive timeout")
+        elif self.ping_delay() == 0:
+            self.ping()
+
+    # reading
+
+    def _set_blocking(self, flag: bool) -> None:
+        if self._blocking is not flag:
+            self.sock.setblocking(flag)
+            self._blocking = flag
+
+    def _packet_size(self) -> int:
+        """
+        Returns the size of the buffered packet, 0 if its header is incomplete
+
+        The index its variable header starts at is left in _in_body
+        """
+        buffer = self._in
+        index = self._in_start + 1
+        remaining = 0
+        shift = 0
+        while index < self._in_end:
+            byte = buffer[index]
+            remaining |= (byte & 0x7F) << shift
+            index += 1
+            if not byte & 0x80:
+                self._in_body = index
+                return index - self._in_start + remaining
+            shift += 7
+        return 0
+
+    def _fill(self, blocking: bool) -> bool:
+        """
+        Read from the socket into the input buffer, returns False if nothing
+        was waiting
+
+        Non-blocking reads take whatever has arrived. A blocking read only
+        asks for what the buffered packet is missing, as it waits for all of it
+        """
+        if self.sock is None:
+            # torn down, by a callback of an earlier packet
+            return False
+        if self._in_start == self._in_end:
+            self._in_start = self._in_end = 0
+
+        wanted = len(self._in) - self._in_end
+        if blocking:
+            size = self._packet_size()
+            missing = 1 if size == 0 else size - (self._in_end - self._in_start)
+            wanted = min(wanted, missing)
+        if wanted < 1 or self._in_start and wanted < len(self._in) // 4:
+            self._compact()
+            return self._fill(blocking)
+
+        self._set_blocking(blocking)
+        count = self.sock.readinto(self._in_view[self._in_end : self._in_end + wanted])
+        if count is None:
+            return False
+        if count == 0:
+            raise OSError(-1)
+        self._in_end += count
+        return True
+
+    def _compact(self) -> None:
+        """Move the buffered data to the start, growing for a large packet"""
+        length = self._in_end - self._in_start
+        size = max(self._packet_size(), length + 1)
+        if size > len(self._in):
+            grown = bytearray(max(2 * len(self._in), size))
+            grown[:length] = self._in[self._in_start : self._in_end]
+            self._in = grown
+            self._in_view = memoryview(grown)
+        else:
+            self._in[:length] = self._in[self._in_start : self._in_end]
+        self._in_start = 0
+        self._in_end = length
+
+    def _next_packet(self) -> int | None:
+        """Handle one complete buffered packet, returns its type or None"""
+        if self._in_end - self._in_start < 2:
+            return None
+        size = self._packet_size()
+        if size == 0 or self._in_end - self._in_start < size:
+            return None
+
+        start = self._in_start
+        end = start + size
+        self._in_start = end
+        buffer = self._in
+        op = buffer[start]
+        index = self._in_body
+
+        kind = op & 0xF0
+        if kind == 0x30:
+            topic_len = (buffer[index] << 8) | buffer[index + 1]
+            index += 2
+            topic = bytes(buffer[index : index + topic_len])
+            index += topic_len
+            qos = op & 6
+            if qos:
+                pid = (buffer[index] << 8) | buffer[index + 1]
+                index += 2
+            self.cb(topic, bytes(buffer[index:end]))
+            if qos == 2:
+                self._put_header(0x40, 2)
+                self._put_u16(pid)
+            elif qos == 4:
+                raise MQTTException("QoS 2 is not supported")
+        elif kind == 0x40:
+            self.acked = (buffer[index] << 8) | buffer[index + 1]
+        elif kind == 0x90:
+            self._suback = ((buffer[index] << 8) | buffer[index + 1], buffer[end - 1])
+        elif op == 0xD0:
+            self._ping_sent = None
+        return op
+
+    def wait_msg(self) -> int:
+        """Block until a packet has been handled, returns its type"""
+        while True:
+            op = self._next_packet()
+            if op is not None:
+                self.flush()
+                return op
+            if not self._fill(blocking=True):
+                raise OSError("connection closed")
+
+    def check_msg(self) -> int | None:
+        """
+        Handle one packet if a complete one has arrived, without blocking
+
+        Returns its type, or None if there is none (or the connection has been
+        closed), so that all waiting packets are handled by calling this until
+        it returns None
+        """
+        if self.sock is None:
+            return None
+        op = self._next_packet()
+        if op is None and self._fill(blocking=False):
+            op = self._next_packet()
+        # any PUBACKs owed, unless the callback closed the connection
+        if self.sock is not None:
+            self.flush()
+        return op
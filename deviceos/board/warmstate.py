@@ -0,0 +1,124 @@
+"""
+Small state file, so that a restarting board can carry on where it left off
+"""
+
+import json
+import os
+import time
+
+
+# any earlier time.time() is from a clock which has not been set (a board
+# without NTP or an RTC counts from its firmware's epoch, from boot)
+_MIN_WALL_TIME = 1700000000
+
+
+def clock_set() -> bool:
+    """Returns True if the wall clock has been set, so times survive a restart"""
+    return time.time() >= _MIN_WALL_TIME
+
+
+class WarmState:
+    """
+    Key-value state persisted to flash as JSON
+
+    The file is only rewritten when a value has changed, and is written to a
+    temporary file first then renamed over the old one, so a reset part way
+    through a save cannot leave a truncated file behind.
+
+    Args:
+        path: path of the state file (Default "warm.json")
+        min_interval: min seconds between saves of frequently changing
+            values, to limit flash wear (Default 300)
+        reuse_ip: connect using the last address given by DHCP, skipping the
+            DHCP exchange. The board then holds no lease, so the router may
+            hand the address to another host (Default False)
+    """
+
+    __slots__ = [
+        "path",
+        "min_interval",
+        "reuse_ip",
+        "saves",
+        "_data",
+        "_dirty",
+        "_last_save",
+    ]
+
+    def __init__(
+        self, path: str = "warm.json", min_interval: int = 300, reuse_ip: bool = False
+    ):
+        self.path = path
+        self.min_interval = min_interval
+        self.reuse_ip = reuse_ip
+
+        self.saves = 0
+        self._dirty = False
+        self._last_save = None
+
+        self._data = self._load()
+
+    def __repr__(self) -> str:
+        return f"WarmState({self.path}, {len(self._data)} keys)"
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r") as o:
+                data = json.load(o)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        print(f"loaded warm state from {self.path}")
+        return data
+
+    def get(self, key: str, default=None):
+        """Returns the stored value of `key`"""
+        return self._data.get(key, default)
+
+    def update(self, key: str, value) -> bool:
+        """
+        Store `value` at `key`, returns True if this changed it
+
+        Containers are copied, so later changes to them are picked up by the
+        next update()
+        """
+        if isinstance(value, dict):
+            value = dict(value)
+        elif isinstance(value, tuple):
+            # JSON has no tuples, and a tuple never compares equal to a list
+            value = list(value)
+        elif isinstance(value, list):
+            value = list(value)
+
+        if self._data.get(key) == value:
+            return False
+        self._data[key] = value
+        self._dirty = True
+        return True
+
+    def save(self, force: bool = False) -> bool:
+        """
+        Write the state if anything has changed, returns True if written
+
+        Unless `force` is True, this is skipped within `min_interval` of the
+        last save
+        """
+        if not self._dirty:
+            return False
+        now = time.ticks_ms()
+        if (
+            not force
+            and self._last_save is not None
+            and time.ticks_diff(now, self._last_save) < self.min_interval * 1000
+        ):
+            return False
+
+        temp = f"{self.path}.tmp"
+        with open(temp, "w") as o:
+            json.dump(self._data, o)
+        os.rename(temp, self.path)
+
+        self._dirty = False
+        self._last_save = now
+        self.saves += 1
+        return True
@@ -15,11 +15,8 @@ class WiFiMixin:
     expects an ssid and password at _wlan_ssid and _wlan_pass
     """
 
-    __slots__ = [
-        "_wlan",
-        "_wlan_ssid",
-        "_wlan_pass",
-    ]
+    # attributes are declared in the Board __slots__
+    __slots__ = ()
 
     @property
     def wlan(self) -> network.WLAN:
@@ -28,15 +25,37 @@ class WiFiMixin:
             return None
         return self._wlan
 
-    def connect_to_wifi(self) -> bool:
+    def start_wifi(self) -> None:
         """
-        Create wifi object and attempt to connect
+        Create the wifi object if needed, and start connecting without waiting
+
+        An association which is still in progress is left to finish, rather
+        than restarted
         """
-        self._wlan = network.WLAN(network.STA_IF)
+        if self.wlan is None:
+            self._wlan = network.WLAN(network.STA_IF)
+        elif self.wlan.status() == network.STAT_CONNECTING:
+            return
 
         self.wlan.active(True)
+
+        warm_state = getattr(self, "warm_state", None)
+        ifconfig = None
+        if warm_state is not None and warm_state.reuse_ip:
+            ifconfig = warm_state.get("ifconfig")
+        self._static_ip = ifconfig is not None
+        if ifconfig is not None:
+            # skip DHCP, reusing the last lease
+            self.wlan.ifconfig(tuple(ifconfig))
+
         self.wlan.connect(self._wlan_ssid, self._wlan_pass)
 
+    def connect_to_wifi(self) -> bool:
+        """
+        Create wifi object and attempt to connect, waiting for the connection
+        """
+        self.start_wifi()
+
         led = Pin("LED", Pin.OUT)
 
         led_orig_state = led.value()
@@ -64,6 +83,24 @@ class WiFiMixin:
             led.value(led_orig_state)
         return True
 
+    def remember_ip(self) -> None:
+        """Store the current address in the warm state, for the next start"""
+        warm_state = getattr(self, "warm_state", None)
+        if warm_state is None or not self.has_wifi:
+            return
+        if warm_state.update("ifconfig", self.wlan.ifconfig()):
+            warm_state.save(force=True)
+
+    def forget_ip(self) -> None:
+        """Drop a reused address, so that the next connection uses DHCP"""
+        print("dropping the reused IP address")
+        self._static_ip = False
+        warm_state = getattr(self, "warm_state", None)
+        if warm_state is not None and warm_state.update("ifconfig", None):
+            warm_state.save(force=True)
+        if self.wlan is not None:
+            self.wifi_off()
+
     def wifi_off(self) -> None:
         """Disconnect and disable wifi chip to save power"""
         self.wlan.deinit()
@@ -0,0 +1,162 @@
+"""
+AnalogDevice is the base class for sensors read through the ADC
+"""
+
+from array import array
+
+from machine import ADC  # pylint: disable=import-error
+
+from deviceos.devices.device import Device
+from deviceos.devices.io.output import Output
+
+
+STATS = ("mean", "median", "noise")
+
+
+class AnalogDevice(Device):
+    """
+    Device reading an ADC channel, oversampled to reduce jitter
+
+    Each read takes `samples` readings into a preallocated array("H"). The
+    statistics over them are found with integer math, which stays within
+    small ints, and converted to the output unit as `offset + gain * raw`
+    with a single float multiply of each integer total. Single readings of
+    the rp2040 ADC jitter by several LSBs.
+
+    Args:
+        name: device name
+        channel: ADC channel, or pin id, to read
+        output: name of the first output (Default `name`)
+        unit: output unit
+        icon: output icon
+        gain: output units per raw u16 count
+        offset: output value at a raw count of 0
+        samples: readings per read (Default 16)
+        stats: outputs to report, any of "mean", "median" and "noise" (the
+            mean absolute deviation of the samples). The first is named
+            `output`, the others `output`_stat (Default ("mean",))
+        format_mod: format modifier for the outputs, such as round(2)
+        diagnostic: flag the outputs as diagnostic
+
+    Other arguments are as for Device
+    """
+
+    __slots__ = [
+        "adc",
+        "samples",
+        "buffer",
+        "gain",
+        "offset",
+        "stats",
+        "_scales",
+        "_values",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        channel,
+        output: str | None = None,
+        unit: str | None = None,
+        icon: str = "mdi:sine-wave",
+        gain: float = 1.0,
+        offset: float = 0.0,
+        samples: int = 16,
+        stats: tuple = ("mean",),
+        format_mod: str | None = None,
+        diagnostic: bool = False,
+        **kwargs,
+    ):
+        super().__init__(name=name, **kwargs)
+
+        for stat in stats:
+            if stat not in STATS:
+                raise ValueError(f"stats must be from {STATS}, not {stat}")
+        if samples < 1:
+            raise ValueError("samples must be at least 1")
+
+        # created once, rather than on every read
+        self.adc = ADC(channel)
+        self.samples = samples
+        self.buffer = array("H", [0] * samples)
+
+        self.gain = gain
+        self.offset = offset
+        # gain per raw count of a total of 1, 2 (median) or `samples` readings
+        self._scales = {1: gain, 2: gain / 2, samples: gain / samples}
+
+        if output is None:
+            output = name
+        self.stats = tuple(
+            (stat, output if index == 0 else f"{output}_{stat}")
+            for index, stat in enumerate(stats)
+        )
+        self.interfaces = [
+            Output(
+                name=interface,
+                unit=unit,
+                icon=icon,
+                format_mod=format_mod,
+                diagnostic=diagnostic or stat == "noise",
+            )
+            for stat, interface in self.stats
+        ]
+        # reused by every read
+        self._values = {}
+
+    def sample_adc(self) -> array:
+        """Fill the buffer with `samples` raw readings, and return it"""
+        read = self.adc.read_u16
+        buffer = self.buffer
+        for index in range(self.samples):
+            buffer[index] = read()
+        return buffer
+
+    def convert(self, raw_total: int, count: int = 1) -> float:
+        """Returns the output value for the mean of `count` raw readings"""
+        scale = self._scales.get(count)
+        if scale is None:
+            scale = self.gain / count
+        return self.offset + raw_total * scale
+
+    def median(self) -> tuple:
+        """
+        Sort the buffer in place, returns (total, count) of its middle value(s)
+        """
+        buffer = self.buffer
+        # insertion sort, as array has no sort() and there are few samples
+        for index in range(1, self.samples):
+            value = buffer[index]
+            position = index - 1
+            while position >= 0 and buffer[position] > value:
+                buffer[position + 1] = buffer[position]
+                position -= 1
+            buffer[position + 1] = value
+
+        middle = self.samples // 2
+        if self.samples & 1:
+            return buffer[middle], 1
+        return buffer[middle - 1] + buffer[middle], 2
+
+    def read(self):
+        buffer = self.sample_adc()
+        count = self.samples
+
+        total = 0
+        for value in buffer:
+            total += value
+
+        values = self._values
+        for stat, name in self.stats:
+            if stat == "mean":
+                values[name] = self.convert(total, count)
+            elif stat == "median":
+                values[name] = self.convert(*self.median())
+            else:
+                # deviations are scaled by count, to stay in integers
+                deviation = 0
+                for value in buffer:
+                    difference = value * count - total
+                    deviation += difference if difference >= 0 else -difference
+                values[name] = abs(self.gain) * deviation / (count * count)
+        return values
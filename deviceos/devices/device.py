@@ -4,9 +4,14 @@ SensorDevice is the base class that represents a single sensor breakout
 
 import time
 
+from deviceos.devices.io.calibration import OFFSET, apply, compile_calibration
 from deviceos.devices.io.output import Output
 
 
+# longest time a device can be quarantined for, before its read is retried
+QUARANTINE_MAX_MS = 600000
+
+
 class Device:
     """
     Class to reference a single sensor device,
@@ -21,6 +26,13 @@ class Device:
 
             self.humidity = Subsensor(...)
             ...
+
+    Args:
+        name: device name
+        interval: seconds between reads
+        deadline_ms: time allowed for read(), a device which overruns this
+            `max_overruns` times in a row is quarantined (optional)
+        max_overruns: consecutive overruns before quarantine (Default 3)
     """
 
     __slots__ = [
@@ -30,19 +42,63 @@ class Device:
         "last_read_time",
         "_internal_data",
         "last_print_time",
+        "state_topic",
+        "availability_topic",
+        "metrics",
+        "deadline_ms",
+        "max_overruns",
+        "overruns",
+        "overrun_total",
+        "last_overrun_ms",
+        "quarantined_until",
+        "quarantine_count",
+        "_plan",
+        "_aggregated",
+        "_sources",
+        "_index",
     ]
 
-    def __init__(self, name: str, interval: int = 15):
+    def __init__(
+        self,
+        name: str,
+        interval: int | float = 15,
+        deadline_ms: int | None = None,
+        max_overruns: int = 3,
+    ):
         self._name = name
 
         self.interfaces = []
 
         self._internal_data = {}
 
-        self.last_read_time = 0
+        # ticks_ms of the last read, None if never read
+        self.last_read_time = None
         self.interval = interval
 
-        self.last_print_time = 0
+        self.last_print_time = None
+
+        # set by Board.add_device
+        self.state_topic = None
+        self.availability_topic = None
+        # set when a Metrics device is added to the board
+        self.metrics = None
+
+        self.deadline_ms = deadline_ms
+        self.max_overruns = max_overruns
+        # consecutive overruns
+        self.overruns = 0
+        self.overrun_total = 0
+        # amount the last overrunning read exceeded the deadline by
+        self.last_overrun_ms = 0
+        # ticks_ms that reads resume at, None if not quarantined
+        self.quarantined_until = None
+        self.quarantine_count = 0
+
+        # built by compile(), from the interfaces
+        self._plan = None
+        self._aggregated = None
+        self._sources = None
+        self._index = None
 
         print(f"created sensor {self.name} with interval {self.interval}")
 
@@ -51,10 +107,50 @@ class Device:
 
     def get_interface(self, name: str) -> Output | None:
         """Attempt to get an interface by name"""
+        if self._index is None or len(self._index) != len(self.interfaces):
+            self.compile()
+        return self._index.get(name)
+
+    def compile(self) -> tuple:
+        """
+        Build the read plan from the interfaces, so that store() only visits
+        those which need something done to their value
+
+        Each step of the plan is (name, irq driven interface or None,
+        calibration kind or None, calibration params, aggregate or None).
+        Called by Board.add_device(), and again if the interfaces change
+
+        Returns the plan
+        """
+        plan = []
+        aggregated = []
+        sources = []
+        index = {}
         for interface in self.interfaces:
-            if interface.name == name:
-                return interface
-        return None
+            name = interface.name
+            index[name] = interface
+
+            # irq driven outputs (see gpio.PinOutput) hold their own value
+            source = None
+            if getattr(interface, "edges", None) is not None:
+                source = interface
+            transform = compile_calibration(getattr(interface, "calibration", None))
+            aggregate = getattr(interface, "aggregate", None)
+            if aggregate is not None:
+                aggregated.append((name, aggregate))
+
+            if source is None and transform is None and aggregate is None:
+                continue
+            kind, params = (None, None) if transform is None else transform
+            plan.append((name, source, kind, params, aggregate))
+            if source is not None:
+                sources.append(plan[-1])
+
+        self._plan = tuple(plan)
+        self._aggregated = tuple(aggregated)
+        self._sources = tuple(sources)
+        self._index = index
+        return self._plan
 
     @property
     def name(self) -> str:
@@ -70,26 +166,184 @@ class Device:
     def internal_data(self, data):
         self._internal_data = data
 
+    def attach(self, board: "Board") -> None:
+        """Called once this device has been added to `board`"""
+
+    def is_due(self, now: int | None = None) -> bool:
+        """Returns True if `interval` seconds have passed since the last read"""
+        if self.last_read_time is None:
+            return True
+        if now is None:
+            now = time.ticks_ms()
+        return time.ticks_diff(now, self.last_read_time) >= self.interval * 1000
+
+    @property
+    def available(self) -> bool:
+        """Returns False if the device has been quarantined"""
+        return self.quarantined_until is None
+
+    def quarantined(self) -> bool:
+        """Returns True if reads are suspended, following repeated overruns"""
+        if self.quarantined_until is None:
+            return False
+        return time.ticks_diff(time.ticks_ms(), self.quarantined_until) < 0
+
+    def check_deadline(self, duration_us: int) -> None:
+        """Track overruns of the read deadline, quarantining if needed"""
+        if self.deadline_ms is None:
+            return
+        duration_ms = duration_us // 1000
+
+        if duration_ms <= self.deadline_ms:
+            self.overruns = 0
+            if self.quarantined_until is not None:
+                print(f"{self.name} has recovered")
+                self.quarantined_until = None
+                self.quarantine_count = 0
+            return
+
+        self.overruns += 1
+        self.overrun_total += 1
+        self.last_overrun_ms = duration_ms - self.deadline_ms
+        print(
+            f"{self.name} read overran its {self.deadline_ms}ms deadline "
+            f"by {self.last_overrun_ms}ms"
+        )
+
+        if self.overruns >= self.max_overruns:
+            backoff = min(
+                QUARANTINE_MAX_MS, int(self.interval * 1000) << self.quarantine_count
+            )
+            self.quarantine_count += 1
+            self.quarantined_until = time.ticks_add(time.ticks_ms(), backoff)
+            print(f"{self.name} quarantined for {backoff}ms")
+
+    def _record_read(self, duration_us: int) -> None:
+        if self.metrics is not None:
+            self.metrics.record_read(self, duration_us)
+        self.check_deadline(duration_us)
+
+    def sample(self, track: bool = True) -> None:
+        """
+        Unconditionally read the device, storing the output in internal_data
+
+        Skipped while the device is quarantined
+
+        Args:
+            track: update last_read_time if True (Default True)
+        """
+        if self.quarantined():
+            return
+
+        if self.metrics is None and self.deadline_ms is None:
+            data = self.read()
+        else:
+            start = time.ticks_us()
+            data = self.read()
+            self._record_read(time.ticks_diff(time.ticks_us(), start))
+
+        if hasattr(data, "send"):
+            # async def read(), can only be awaited by Board.run_async()
+            data.close()
+            raise RuntimeError(
+                f"{self.name} has an async read(), use Board.run_async()"
+            )
+        self.store(data, track=track)
+
+    async def sample_async(self, track: bool = True) -> None:
+        """
+        Async version of sample(), awaits read() if it is an `async def`
+
+        Args:
+            track: update last_read_time if True (Default True)
+        """
+        if self.quarantined():
+            return
+
+        start = time.ticks_us()
+        data = self.read()
+        if hasattr(data, "send"):
+            data = await data
+        self._record_read(time.ticks_diff(time.ticks_us(), start))
+        self.store(data, track=track)
+
+    def store(self, data: dict, track: bool = True) -> None:
+        """
+        Store the output of read(), applying any calibration in one pass over
+        the read plan (see compile())
+
+        Values of aggregated outputs are added to their aggregate, and the
+        last reported aggregate is stored in their place. Values of irq driven
+        outputs (see gpio.PinOutput) are added, so read() need not return them
+
+        Args:
+            data: dict of values as returned by read()
+            track: update last_read_time if True (Default True)
+        """
+        self._internal_data = data
+
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        for name, source, kind, params, aggregate in plan:
+            value = data[name] if source is None else source.value
+            if kind == OFFSET:
+                value += params
+            elif kind is not None:
+                value = apply(kind, params, value)
+            if aggregate is not None:
+                aggregate.add(value)
+                value = aggregate.value
+            data[name] = value
+
+        if track:
+            self.last_read_time = time.ticks_ms()
+
+    def collect(self) -> None:
+        """
+        Update aggregated outputs in internal_data with their aggregate over
+        the samples since the last collect(), and close the interval of irq
+        driven outputs (such as the rate of a PulseCounter)
+        """
+        aggregated = self._aggregated
+        if aggregated is None:
+            self.compile()
+            aggregated = self._aggregated
+        for name, aggregate in aggregated:
+            if aggregate.count:
+                self._internal_data[name] = aggregate.collect()
+
+        data = self._internal_data
+        for name, source, kind, params, aggregate in self._sources:
+            source.collect()
+            if aggregate is not None or name not in data:
+                continue
+            value = source.value
+            if kind is not None:
+                value = apply(kind, params, value)
+            data[name] = value
+
     def internal_device_read(self, force: bool = False) -> bool:
         """Internal read, stores the output of the user read() into the data property"""
-        now = int(time.time())
+        now = time.ticks_ms()
 
-        if not force and self.last_read_time + self.interval > now:
+        if not force and not self.is_due(now):
             return False
 
-        if self.last_print_time + 1 <= now:
+        if (
+            self.last_print_time is None
+            or time.ticks_diff(now, self.last_print_time) >= 1000
+        ):
             print(f"updating {self.name}")
             self.last_print_time = now
 
-        self._internal_data = self.read()
-
-        for interface in self.interfaces:
-            if getattr(interface, "calibration", None) is not None:
-                self._internal_data[interface.name] += interface.calibration
-        if not force:
-            self.last_read_time = now
+        self.sample(track=not force)
         return True
 
     def read(self):
-        """Stub read() method, to be replaced by the user"""
+        """
+        Stub read() method, to be replaced by the user
+
+        May also be defined as `async def read()` when using Board.run_async()
+        """
         return NotImplemented
@@ -0,0 +1,19 @@
+__all__ = ["CPU", "Metrics", "Network", "Switch"]
+
+
+# inbuilt devices are only imported when asked for, as each has a RAM cost
+_LAZY = {
+    "CPU": "deviceos.devices.inbuilt.cpu",
+    "Metrics": "deviceos.devices.inbuilt.metrics",
+    "Network": "deviceos.devices.inbuilt.network",
+    "Switch": "deviceos.devices.inbuilt.switch",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(name)
+    value = getattr(__import__(module, None, None, [name]), name)
+    globals()[name] = value
+    return value
@@ -1,31 +1,30 @@
-from deviceos import Output, Device
+from deviceos.devices.analog import AnalogDevice
 
-import machine  # pylint: disable=import-error
 
+# rp2040 datasheet: 0.706V at 27C, falling by 1.721mV per degree, 3.3V reference
+_VOLTS_PER_COUNT = 3.3 / 65536
 
-class CPU(Device):
-    """
-    Basic Sensor for reporting CPU temp
 
-    Functions as an example for simple devices
+class CPU(AnalogDevice):
     """
+    Basic Sensor for reporting CPU temp
 
-    def __init__(self):
-        super().__init__(name="CPU")
-
-        self.interfaces = [
-            Output(
-                name="CPU_Temp",
-                unit="C",
-                icon="mdi:thermometer",
-                format_mod="round(2)",
-                diagnostic=True,
-            )
-        ]
+    Functions as an example for simple analog devices
 
-    def read(self):
-        adc = machine.ADC(4)
-        voltage = adc.read_u16() * (3.3 / 65536)
-        temp_c = 27 - (voltage - 0.706) / 0.001721
+    Args:
+        samples: ADC readings averaged per read (Default 16)
+    """
 
-        return {"CPU_Temp": temp_c}
+    def __init__(self, samples: int = 16):
+        super().__init__(
+            name="CPU",
+            channel=4,
+            output="CPU_Temp",
+            unit="C",
+            icon="mdi:thermometer",
+            gain=-_VOLTS_PER_COUNT / 0.001721,
+            offset=27 + 0.706 / 0.001721,
+            samples=samples,
+            format_mod="round(2)",
+            diagnostic=True,
+        )
@@ -0,0 +1,224 @@
+"""
+Runtime diagnostics: loop latency, heap use, and read/publish timings
+"""
+
+from array import array
+import gc
+import time
+
+from deviceos.devices.device import Device
+from deviceos.devices.io.output import Output
+
+
+# upper bounds of the histogram buckets, in us
+BUCKETS = (100, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000, 500000)
+
+
+class Histogram:
+    """
+    Fixed bucket histogram of durations in us, with an exact maximum
+
+    Percentiles are reported as the upper bound of the bucket they fall in
+    """
+
+    __slots__ = ["counts", "count", "max"]
+
+    def __init__(self):
+        self.counts = array("I", [0] * (len(BUCKETS) + 1))
+        self.count = 0
+        self.max = 0
+
+    def __repr__(self) -> str:
+        return f"Histogram({self.count} samples)"
+
+    def add(self, duration_us: int) -> None:
+        """Add a duration to the histogram"""
+        index = 0
+        for bound in BUCKETS:
+            if duration_us <= bound:
+                break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        if duration_us > self.max:
+            self.max = duration_us
+
+    def percentile(self, fraction: float) -> float | None:
+        """Returns the upper bound of the bucket holding `fraction`, in ms"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        total = 0
+        for index, count in enumerate(self.counts):
+            total += count
+            if total >= target:
+                break
+        if index < len(BUCKETS):
+            return min(BUCKETS[index], self.max) / 1000
+        return self.max / 1000
+
+    def reset(self) -> None:
+        """Clear the histogram"""
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.max = 0
+
+
+def diagnostic(name: str, unit: str, icon: str) -> Output:
+    """Shorthand for a diagnostic Output"""
+    return Output(name=name, unit=unit, icon=icon, diagnostic=True)
+
+
+def largest_free_block(limit: int) -> int:
+    """
+    Estimate the largest allocatable block, by bisecting trial allocations
+    """
+    low, high = 0, limit
+    while high - low > 64:
+        size = (low + high) // 2
+        try:
+            block = bytearray(size)
+            del block
+            low = size
+        except MemoryError:
+            high = size
+    return low
+
+
+class Metrics(Device):
+    """
+    Reports diagnostics on where time and memory are going on the board
+
+    Timings are collected by hooks in Device.sample(), Board.once(),
+    Board.run() and MQTTMixin.send(). These are only active once this device
+    has been added to a board, and otherwise cost a single `is None` check.
+
+    Args:
+        interval: reporting interval in seconds (Default 60)
+        probe_heap: estimate the largest free heap block (Default False).
+            This needs around a dozen trial allocations on each read, which
+            churn the heap being measured
+
+    Devices with a read deadline also report the amount their last
+    overrunning read went over it by
+    """
+
+    def __init__(self, interval: int | float = 60, probe_heap: bool = False):
+        super().__init__(name="Metrics", interval=interval)
+
+        self.probe_heap = probe_heap
+
+        self.loop = Histogram()
+        self.publishes = Histogram()
+        self.publish_bytes = 0
+        self.resets = 0
+        # the board's TLS, if it has one
+        self.tls = None
+
+        # device: Histogram of read() durations
+        self.reads = {}
+
+        self.interfaces = [
+            diagnostic("loop_p50", "ms", "mdi:timer-outline"),
+            diagnostic("loop_p99", "ms", "mdi:timer-outline"),
+            diagnostic("loop_max", "ms", "mdi:timer-outline"),
+            diagnostic("mem_free", "B", "mdi:memory"),
+            diagnostic("mem_alloc", "B", "mdi:memory"),
+            diagnostic("mem_largest_block", "B", "mdi:memory"),
+            diagnostic("publish_p99", "ms", "mdi:upload"),
+            diagnostic("publish_bytes", "B", "mdi:upload"),
+            diagnostic("resets", "", "mdi:restart"),
+        ]
+
+    def attach(self, board: "Board") -> None:
+        """Enable the timing hooks on `board` and its devices"""
+        board.metrics = self
+        for device in board.devices:
+            self.track(device, board)
+
+        self.tls = board.tls
+        if self.tls is not None:
+            for name, unit in (
+                ("tls_handshake_ms", "ms"),
+                ("tls_resumed", ""),
+                ("tls_heap", "B"),
+            ):
+                output = diagnostic(name, unit, "mdi:lock")
+                output.board = board
+                output.parent = self
+                self.interfaces.append(output)
+
+    def _key(self, device: Device) -> str:
+        return device.name.replace(" ", "_")
+
+    def track(self, device: Device, board: "Board") -> None:
+        """Enable read timing for `device`, adding its diagnostic outputs"""
+        device.metrics = self
+        if device is self or device in self.reads:
+            return
+        self.reads[device] = Histogram()
+
+        key = self._key(device)
+        suffixes = ["read_p99", "read_max"]
+        if device.deadline_ms is not None:
+            suffixes.append("overrun")
+        for suffix in suffixes:
+            output = diagnostic(f"{key}_{suffix}", "ms", "mdi:timer-outline")
+            output.board = board
+            output.parent = self
+            self.interfaces.append(output)
+
+    def record_read(self, device: Device, duration_us: int) -> None:
+        """Hook for Device.sample()"""
+        histogram = self.reads.get(device)
+        if histogram is not None:
+            histogram.add(duration_us)
+
+    def record_loop(self, duration_us: int) -> None:
+        """Hook for the Board run loop"""
+        self.loop.add(duration_us)
+
+    def record_publish(self, duration_us: int, size: int) -> None:
+        """Hook for MQTTMixin.send()"""
+        self.publishes.add(duration_us)
+        self.publish_bytes += size
+
+    def read(self):
+        mem_free = getattr(gc, "mem_free", lambda: None)()
+        mem_alloc = getattr(gc, "mem_alloc", lambda: None)()
+
+        largest = None
+        if self.probe_heap and mem_free is not None:
+            largest = largest_free_block(mem_free)
+
+        data = {
+            "loop_p50": self.loop.percentile(0.5),
+            "loop_p99": self.loop.percentile(0.99),
+            "loop_max": self.loop.max / 1000,
+            "mem_free": mem_free,
+            "mem_alloc": mem_alloc,
+            "mem_largest_block": largest,
+            "publish_p99": self.publishes.percentile(0.99),
+            "publish_bytes": self.publish_bytes,
+            "resets": self.resets,
+        }
+        self.loop.reset()
+        self.publishes.reset()
+        self.publish_bytes = 0
+
+        tls = self.tls
+        if tls is not None:
+            data["tls_handshake_ms"] = tls.last_handshake_ms
+            data["tls_resumed"] = tls.resumed
+            data["tls_heap"] = tls.heap_used
+
+        for device, histogram in self.reads.items():
+            key = self._key(device)
+            data[f"{key}_read_p99"] = histogram.percentile(0.99)
+            data[f"{key}_read_max"] = histogram.max / 1000
+            if device.deadline_ms is not None:
+                data[f"{key}_overrun"] = device.last_overrun_ms
+            histogram.reset()
+
+        return data
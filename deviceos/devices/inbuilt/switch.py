@@ -16,7 +16,13 @@ class Switch(Device):
         super().__init__(name=name)
 
         self.interfaces = [
-            Input(name=name, icon="mdi:toggle-switch", callback=self.callback)
+            # read() only reports the commanded value, so echo it directly
+            Input(
+                name=name,
+                icon="mdi:toggle-switch",
+                callback=self.callback,
+                optimistic=True,
+            )
         ]
 
         if pin is None:
@@ -1,5 +1,22 @@
 from deviceos.devices.io.output import Output
 from deviceos.devices.io.input import Input
+from deviceos.devices.io.calibration import Calibration
 
 
-__all__ = ["Output", "Input"]
+__all__ = ["Output", "Input", "Calibration", "Contact", "PulseCounter"]
+
+
+# irq driven outputs, imported on first access as most boards have none
+_LAZY = {
+    "Contact": "deviceos.devices.io.gpio",
+    "PulseCounter": "deviceos.devices.io.gpio",
+}
+
+
+def __getattr__(name: str):
+    module = _LAZY.get(name)
+    if module is None:
+        raise AttributeError(name)
+    value = getattr(__import__(module, None, None, [name]), name)
+    globals()[name] = value
+    return value
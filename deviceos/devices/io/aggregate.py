@@ -0,0 +1,156 @@
+"""
+Streaming aggregation of Output samples
+
+Allows a device to be sampled far faster than the board reports, with the
+aggregate over each reporting interval being published.
+"""
+
+from array import array
+import math
+
+
+AGGREGATES = ("mean", "min", "max", "median", "ewma", "stddev", "count")
+
+# indices into the running statistics array
+_MEAN = 0
+_M2 = 1
+_MIN = 2
+_MAX = 3
+_EWMA = 4
+
+
+class Aggregate:
+    """
+    Running aggregate of samples between reports
+
+    Statistics are updated in O(1) per sample, stored in an `array("f")`.
+    For a median, the samples are kept in a fixed size ring buffer, of which
+    the most recent `window` samples are used.
+
+    Args:
+        kind: one of "mean", "min", "max", "median", "ewma", "stddev", "count"
+        window: ring buffer size for "median" (Default 16)
+        alpha: smoothing factor for "ewma" (Default 0.2)
+    """
+
+    __slots__ = [
+        "kind",
+        "alpha",
+        "value",
+        "count",
+        "_stats",
+        "_buffer",
+        "_index",
+        "_primed",
+    ]
+
+    def __init__(self, kind: str, window: int = 16, alpha: float = 0.2):
+        if kind not in AGGREGATES:
+            raise ValueError(f"aggregate must be one of {AGGREGATES}, not {kind}")
+
+        self.kind = kind
+        self.alpha = alpha
+
+        # last reported value, seeded by the first sample
+        self.value = None
+
+        self.count = 0
+        self._stats = array("f", [0.0] * 5)
+
+        self._buffer = array("f", [0.0] * window) if kind == "median" else None
+        self._index = 0
+
+        self._primed = False
+
+    def __repr__(self) -> str:
+        return f"Aggregate({self.kind})"
+
+    def add(self, value: int | float) -> None:
+        """
+        Add a sample
+
+        The first sample also seeds the reported value, so that it is not None
+        when published before the first collect()
+        """
+        self.count += 1
+        stats = self._stats
+        kind = self.kind
+
+        if self.value is None:
+            if kind == "count":
+                self.value = 1
+            elif kind == "stddev":
+                self.value = 0.0
+            else:
+                self.value = value
+
+        if kind == "median":
+            buffer = self._buffer
+            buffer[self._index] = value
+            self._index += 1
+            if self._index >= len(buffer):
+                self._index = 0
+
+        elif kind == "ewma":
+            if self._primed:
+                stats[_EWMA] += self.alpha * (value - stats[_EWMA])
+            else:
+                stats[_EWMA] = value
+                self._primed = True
+
+        elif kind == "min":
+            if self.count == 1 or value < stats[_MIN]:
+                stats[_MIN] = value
+
+        elif kind == "max":
+            if self.count == 1 or value > stats[_MAX]:
+                stats[_MAX] = value
+
+        elif kind in ("mean", "stddev"):
+            # Welford's algorithm
+            delta = value - stats[_MEAN]
+            stats[_MEAN] += delta / self.count
+            stats[_M2] += delta * (value - stats[_MEAN])
+
+    def collect(self) -> int | float | None:
+        """
+        Returns the aggregate of the samples since the last collect(),
+        and starts a new interval
+
+        If there have been no samples, the last value is returned
+        """
+        count = self.count
+        if count == 0:
+            return self.value
+
+        stats = self._stats
+        kind = self.kind
+
+        if kind == "mean":
+            value = stats[_MEAN]
+        elif kind == "min":
+            value = stats[_MIN]
+        elif kind == "max":
+            value = stats[_MAX]
+        elif kind == "ewma":
+            value = stats[_EWMA]
+        elif kind == "count":
+            value = count
+        elif kind == "stddev":
+            value = math.sqrt(stats[_M2] / (count - 1)) if count > 1 else 0.0
+        else:
+            samples = sorted(self._buffer[: min(count, len(self._buffer))])
+            mid = len(samples) // 2
+            if len(samples) % 2:
+                value = samples[mid]
+            else:
+                value = (samples[mid - 1] + samples[mid]) / 2
+
+        self.value = value
+
+        self.count = 0
+        self._index = 0
+        stats[_MEAN] = 0.0
+        stats[_M2] = 0.0
+
+        return value
@@ -0,0 +1,114 @@
+"""
+Calibration of Output values, compiled into a transform applied on each read
+"""
+
+
+# transform kinds
+OFFSET = 0
+LINEAR = 1
+POLYNOMIAL = 2
+TABLE = 3
+
+
+class Calibration:
+    """
+    Correction applied to the raw value of an Output
+
+    Give one of:
+
+    - `scale` and/or `offset`: value * scale + offset
+    - `polynomial`: coefficients, lowest order first, so (c0, c1, c2) gives
+      c0 + c1 * value + c2 * value ** 2
+    - `table`: (raw, calibrated) points, sorted by raw value. Values between
+      points are interpolated linearly, values outside them are clamped to
+      the first or last point
+
+    A plain number given as an Output calibration is an offset.
+
+    Args:
+        offset: added to the value (Default 0)
+        scale: multiplies the value (Default 1)
+        polynomial: polynomial coefficients, lowest order first
+        table: sequence of (raw, calibrated) points
+    """
+
+    __slots__ = ["kind", "params"]
+
+    def __init__(
+        self,
+        offset: int | float = 0,
+        scale: int | float = 1,
+        polynomial: "tuple | list | None" = None,
+        table: "tuple | list | None" = None,
+    ):
+        if polynomial is not None and table is not None:
+            raise ValueError("give one of polynomial or table, not both")
+
+        if polynomial is not None:
+            if not polynomial:
+                raise ValueError("polynomial needs at least one coefficient")
+            self.kind = POLYNOMIAL
+            # highest order first, for Horner's method
+            self.params = tuple(reversed(polynomial))
+        elif table is not None:
+            if len(table) < 2:
+                raise ValueError("table needs at least two points")
+            raw = [point[0] for point in table]
+            if any(raw[index] >= raw[index + 1] for index in range(len(raw) - 1)):
+                raise ValueError("table points must be sorted by raw value")
+            self.kind = TABLE
+            self.params = (tuple(raw), tuple(point[1] for point in table))
+        elif scale == 1:
+            self.kind = OFFSET
+            self.params = offset
+        else:
+            self.kind = LINEAR
+            self.params = (scale, offset)
+
+    def __repr__(self) -> str:
+        return f"Calibration({('offset', 'linear', 'polynomial', 'table')[self.kind]})"
+
+    def __call__(self, value):
+        return apply(self.kind, self.params, value)
+
+
+def compile_calibration(calibration) -> tuple | None:
+    """
+    Returns the (kind, params) transform of an Output calibration, which may
+    be None, a number (an offset) or a Calibration
+    """
+    if calibration is None:
+        return None
+    if isinstance(calibration, Calibration):
+        return calibration.kind, calibration.params
+    return OFFSET, calibration
+
+
+def apply(kind: int, params, value):
+    """Apply the transform (`kind`, `params`) to `value`"""
+    if kind == OFFSET:
+        return value + params
+    if kind == LINEAR:
+        return value * params[0] + params[1]
+    if kind == POLYNOMIAL:
+        result = 0.0
+        for coefficient in params:
+            result = result * value + coefficient
+        return result
+
+    raw, calibrated = params
+    if value <= raw[0]:
+        return calibrated[0]
+    last = len(raw) - 1
+    if value >= raw[last]:
+        return calibrated[last]
+    # bisect for the segment holding value
+    low, high = 0, last
+    while high - low > 1:
+        middle = (low + high) >> 1
+        if raw[middle] <= value:
+            low = middle
+        else:
+            high = middle
+    fraction = (value - raw[low]) / (raw[high] - raw[low])
+    return calibrated[low] + fraction * (calibrated[high] - calibrated[low])
@@ -0,0 +1,431 @@
+"""
+Interrupt driven GPIO outputs, for contacts, buttons and pulse meters
+
+Edges are recorded by a Pin.irq handler into a preallocated ring buffer
+without allocating, so the handler is safe to run as a hard interrupt. The
+buffer is processed outside of the interrupt, via micropython.schedule, and
+the values are picked up by the parent Device on its next read.
+"""
+
+from array import array
+import time
+
+import micropython  # pylint: disable=import-error
+from machine import Pin  # pylint: disable=import-error
+
+from deviceos.devices.io.output import Output
+
+
+# the irq edge counter wraps at 30 bits, so that it is always a small int
+_COUNT_MASK = 0x3FFFFFFF
+
+
+class EdgeBuffer:
+    """
+    Fixed size ring buffer of (ticks_us, level) edges
+
+    push() is called from the interrupt handler and pop() from the main loop,
+    neither side writes the other's index. When full, new edges are dropped
+    and counted in `dropped`.
+
+    Args:
+        size: number of edges held (Default 32)
+    """
+
+    __slots__ = ["ticks", "levels", "size", "head", "tail", "dropped"]
+
+    def __init__(self, size: int = 32):
+        self.ticks = array("L", [0] * size)
+        self.levels = bytearray(size)
+        self.size = size
+        # next slot to write, written only by push()
+        self.head = 0
+        # next slot to read, written only by pop()
+        self.tail = 0
+        self.dropped = 0
+
+    def __repr__(self) -> str:
+        return f"EdgeBuffer({len(self)}/{self.size - 1})"
+
+    def __len__(self) -> int:
+        return (self.head - self.tail) % self.size
+
+    def push(self, ticks: int, level: int) -> None:
+        """Store an edge, without allocating"""
+        head = self.head
+        following = head + 1
+        if following == self.size:
+            following = 0
+        if following == self.tail:
+            self.dropped += 1
+            return
+        self.ticks[head] = ticks
+        self.levels[head] = level
+        self.head = following
+
+    def pop(self) -> tuple | None:
+        """Returns the oldest (ticks_us, level), None if empty"""
+        tail = self.tail
+        if tail == self.head:
+            return None
+        edge = (self.ticks[tail], self.levels[tail])
+        tail += 1
+        self.tail = 0 if tail == self.size else tail
+        return edge
+
+
+class PinOutput(Output):
+    """
+    Base class of outputs driven by Pin.irq
+
+    Subclasses implement process(), which consumes the edge buffer.
+
+    Args:
+        pin: Pin, or a pin id to create an input Pin from
+        pull: pull resistor for a created Pin, Pin.PULL_UP or Pin.PULL_DOWN
+        trigger: Pin.irq trigger (Default rising and falling edges)
+        hard: register a hard interrupt handler, for the lowest latency
+            (Default True)
+        buffer: number of edges buffered between processing (Default 32)
+        immediate: publish the parent device as soon as an edge has been
+            processed, rather than at its next interval
+        latency_ms: longest time the board may wait before publishing after
+            an edge, when `immediate` (Default 50)
+
+    Other arguments are as for Output
+    """
+
+    __slots__ = [
+        "pin",
+        "edges",
+        "trigger",
+        "hard",
+        "immediate",
+        "latency_ms",
+        "_scheduled",
+        "_process_ref",
+        "_irq_ref",
+        "_irq_count",
+        "_counted",
+        "_edge_total",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        icon: str,
+        pin,
+        pull: int | None = None,
+        trigger: int | None = None,
+        hard: bool = True,
+        buffer: int = 32,
+        immediate: bool = False,
+        latency_ms: int = 50,
+        **kwargs,
+    ):
+        super().__init__(name=name, icon=icon, **kwargs)
+
+        if not isinstance(pin, Pin):
+            pin = Pin(pin, Pin.IN, pull)
+        self.pin = pin
+        self.edges = EdgeBuffer(buffer)
+        # edges seen by the irq, including any dropped from the buffer. The
+        # irq keeps a wrapping count, which count_edges() extends
+        self._irq_count = array("L", [0])
+        self._counted = 0
+        self._edge_total = 0
+        if trigger is None:
+            trigger = Pin.IRQ_RISING | Pin.IRQ_FALLING
+        self.trigger = trigger
+        self.hard = hard
+        self.immediate = immediate
+        self.latency_ms = latency_ms
+
+        # True while a call to _process() is waiting to be run
+        self._scheduled = False
+        # creating a bound method allocates, so this cannot be done in the irq
+        self._process_ref = self._process
+        self._irq_ref = self._irq
+
+    def attach(self) -> None:
+        self.pin.irq(handler=self._irq_ref, trigger=self.trigger, hard=self.hard)
+        if self.immediate:
+            self.board.register_irq(self)
+
+    def detach(self) -> None:
+        """Remove the irq handler"""
+        self.pin.irq(handler=None)
+
+    def _irq(self, pin) -> None:
+        # runs as a hard interrupt, nothing here may allocate
+        count = self._irq_count
+        value = count[0]
+        count[0] = 0 if value == _COUNT_MASK else value + 1
+        self.edges.push(time.ticks_us(), pin.value())
+        if self._scheduled:
+            return
+        self._scheduled = True
+        try:
+            micropython.schedule(self._process_ref, None)
+        except RuntimeError:
+            # the schedule queue is full, retried on the next edge
+            self._scheduled = False
+
+    def _process(self, _) -> None:
+        self._scheduled = False
+        self.count_edges()
+        if self.process() and self.immediate:
+            self.board.mark_dirty(self.parent)
+
+    def count_edges(self) -> int:
+        """Add the edges counted by the irq to the total, and return it"""
+        current = self._irq_count[0]
+        self._edge_total += (current - self._counted) & _COUNT_MASK
+        self._counted = current
+        return self._edge_total
+
+    @property
+    def edge_count(self) -> int:
+        """Every edge seen by the irq, including any dropped from the buffer"""
+        return self.count_edges()
+
+    def process(self) -> bool:
+        """Consume the edge buffer, returns True if the value has changed"""
+        raise NotImplementedError
+
+    def collect(self) -> None:
+        """Close the reporting interval, called by Device.collect()"""
+
+    @property
+    def value(self):
+        """Returns the value to publish"""
+        raise NotImplementedError
+
+
+class Contact(PinOutput):
+    """
+    Binary sensor following the level of a pin, such as a door contact or
+    a button
+
+    Changes are published immediately, by default.
+
+    Args:
+        name: output name
+        pin: Pin, or a pin id to create an input Pin from
+        icon: output icon (Default "mdi:door")
+        pull: pull resistor for a created Pin (Default Pin.PULL_UP)
+        invert: report ON while the pin is low, as for a contact which pulls
+            a pulled up pin to ground (Default False)
+        debounce_ms: edges within this time of the last accepted edge are
+            ignored, and the pin is read again once it has passed (Default 20)
+        device_class: Home Assistant binary_sensor device class, such as
+            "door" (optional)
+        immediate: publish each change immediately (Default True)
+
+    Other arguments are as for PinOutput
+    """
+
+    __slots__ = [
+        "invert",
+        "debounce_ms",
+        "device_class",
+        "level",
+        "settle_due",
+        "_last_edge",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        pin,
+        icon: str = "mdi:door",
+        pull: int | None = Pin.PULL_UP,
+        invert: bool = False,
+        debounce_ms: int = 20,
+        device_class: str | None = None,
+        immediate: bool = True,
+        **kwargs,
+    ):
+        super().__init__(
+            name=name,
+            icon=icon,
+            pin=pin,
+            pull=pull,
+            immediate=immediate,
+            component="binary_sensor",
+            **kwargs,
+        )
+        self.invert = invert
+        self.debounce_ms = debounce_ms
+        self.device_class = device_class
+
+        self.level = self.pin.value()
+        # ticks_us at which the pin is read again, after an ignored edge
+        self.settle_due = None
+        # ticks_us of the last accepted edge, None if there has not been one
+        self._last_edge = None
+
+    def __repr__(self) -> str:
+        return f"Contact({self.name})"
+
+    def process(self) -> bool:
+        level = self.level
+        debounce_us = self.debounce_ms * 1000
+        while True:
+            edge = self.edges.pop()
+            if edge is None:
+                break
+            ticks, new = edge
+            if (
+                self._last_edge is not None
+                and time.ticks_diff(ticks, self._last_edge) < debounce_us
+            ):
+                # a bounce, or a glitch whose final edge is also ignored, so
+                # the level is taken from the pin once the window has passed
+                self.settle_due = time.ticks_add(self._last_edge, debounce_us)
+                continue
+            if new != self.level:
+                self._last_edge = ticks
+                self.level = new
+        if self.settle_due is not None and not self.settle():
+            self.board.defer_settle(self)
+        return self.level != level
+
+    def settle(self) -> bool:
+        """
+        Read the pin if the debounce window of an ignored edge has passed,
+        returns True if the level has changed
+        """
+        due = self.settle_due
+        if due is None:
+            return False
+        now = time.ticks_us()
+        if time.ticks_diff(due, now) > 0:
+            return False
+        self.settle_due = None
+        level = self.pin.value()
+        if level == self.level:
+            return False
+        self._last_edge = now
+        self.level = level
+        return True
+
+    @property
+    def value(self) -> str:
+        return "ON" if self.level ^ self.invert else "OFF"
+
+    @property
+    def discovery_payload(self) -> dict:
+        payload = self.base_discovery_payload
+        payload["value_template"] = f"{{{{ value_json.{self.name} }}}}"
+        payload["payload_on"] = "ON"
+        payload["payload_off"] = "OFF"
+        if self.device_class is not None:
+            payload["device_class"] = self.device_class
+        return payload
+
+
+class PulseCounter(PinOutput):
+    """
+    Counter of pulses on a pin, such as from a water or energy meter
+
+    The count is kept by the interrupt handler itself (as `edge_count`), so
+    no pulse is lost if the edge buffer overflows. The rate is the pulses
+    counted between two calls of Device.collect(), over the time between them.
+
+    Args:
+        name: output name
+        pin: Pin, or a pin id to create an input Pin from
+        icon: output icon (Default "mdi:counter")
+        unit: unit of the scaled total, or of the rate per second
+        scale: multiplier from pulses to `unit`, e.g. 0.5 for 0.5 L/pulse
+            (Default 1)
+        report: "total" to publish the scaled total, or "rate" to publish the
+            scaled pulses per second over the last interval (Default "total")
+        pull: pull resistor for a created Pin (Default Pin.PULL_UP)
+        trigger: edges to count (Default Pin.IRQ_FALLING)
+
+    Other arguments are as for PinOutput
+    """
+
+    __slots__ = [
+        "scale",
+        "report",
+        "rate",
+        "_window_start",
+        "_window_count",
+    ]
+
+    def __init__(
+        self,
+        name: str,
+        pin,
+        icon: str = "mdi:counter",
+        unit: str | None = None,
+        scale: int | float = 1,
+        report: str = "total",
+        pull: int | None = Pin.PULL_UP,
+        trigger: int | None = None,
+        **kwargs,
+    ):
+        if report not in ("total", "rate"):
+            raise ValueError(f"report must be 'total' or 'rate', not {report}")
+        if trigger is None:
+            trigger = Pin.IRQ_FALLING
+        super().__init__(
+            name=name,
+            icon=icon,
+            pin=pin,
+            pull=pull,
+            trigger=trigger,
+            unit=unit,
+            **kwargs,
+        )
+        self.scale = scale
+        self.report = report
+
+        # pulses per second over the last interval
+        self.rate = 0.0
+        # ticks_ms and edge_count at the start of the interval
+        self._window_start = None
+        self._window_count = 0
+
+    def __repr__(self) -> str:
+        return f"PulseCounter({self.name}, {self.edge_count})"
+
+    def attach(self) -> None:
+        super().attach()
+        self._window_start = time.ticks_ms()
+        self._window_count = self.count_edges()
+
+    def process(self) -> bool:
+        # the count is kept by the irq, the edges only show that it changed
+        changed = False
+        while self.edges.pop() is not None:
+            changed = True
+        return changed
+
+    def collect(self) -> None:
+        """Update `rate` from the pulses since the last call"""
+        now = time.ticks_ms()
+        total = self.count_edges()
+        if self._window_start is not None:
+            elapsed = time.ticks_diff(now, self._window_start)
+            if elapsed > 0:
+                self.rate = (total - self._window_count) * 1000 / elapsed
+        self._window_start = now
+        self._window_count = total
+
+    @property
+    def value(self) -> int | float:
+        if self.report == "rate":
+            return self.rate * self.scale
+        return self.count_edges() * self.scale
+
+    @property
+    def discovery_payload(self) -> dict:
+        payload = super().discovery_payload
+        payload["state_class"] = (
+            "total_increasing" if self.report == "total" else "measurement"
+        )
+        return payload
@@ -1,9 +1,36 @@
+import time
+
 from deviceos.devices.io.interface import Interface
 
 
 class Input(Interface):
+    # pylint: disable = too-many-arguments
+    """
+    Interface receiving commands from HA
+
+    Args:
+        name: interface name
+        icon: interface icon
+        component: HA component (Default "switch")
+        diagnostic: flag this interface as "diagnostic"
+        force_update: adds force_update flag to discovery if True
+        callback: called with each command applied
+        coalesce_ms: a command is applied at once, and later ones arriving
+            within this many ms of it are coalesced, with only the latest
+            applied at the end of the window (0 to apply every one)
+        optimistic: publish the command as the new state at once, rather than
+            re-reading the device (Default False)
+    """
 
-    __slots__ = ["callback", "value"]
+    __slots__ = [
+        "callback",
+        "value",
+        "coalesce_ms",
+        "optimistic",
+        "coalesced",
+        "command_due",
+        "_pending",
+    ]
 
     def __init__(
         self,
@@ -12,7 +39,9 @@ class Input(Interface):
         component: str = "switch",
         diagnostic: bool = False,
         force_update: bool = True,
-        callback: "Callable" | None = None,
+        callback: "Callable | None" = None,
+        coalesce_ms: int = 50,
+        optimistic: bool = False,
     ):
         super().__init__(
             name=name,
@@ -25,10 +54,19 @@ class Input(Interface):
         self.callback = callback
         self.value = True
 
+        self.coalesce_ms = coalesce_ms
+        self.optimistic = optimistic
+        # commands dropped in favour of a later one
+        self.coalesced = 0
+        # ticks_ms at which the coalescing window ends, and any pending
+        # command is applied
+        self.command_due = None
+        self._pending = None
+
     @property
     def command_topic(self):
         base_topic = self.board.base_topic(self._component)
-        return f"{base_topic}/set"
+        return f"{base_topic}/{self.name}/set"
 
     @property
     def discovery_payload(self) -> dict:
@@ -38,15 +76,51 @@ class Input(Interface):
         payload["command_topic"] = self.command_topic
         payload["payload_on"] = "ON"
         payload["payload_off"] = "OFF"
+        if self.board.persistent_session:
+            # so that commands are held for the board while it is asleep
+            payload["qos"] = 1
 
         return payload
 
-    def _internal_callback(self, *args, **kwargs):
+    def _internal_callback(self, msg: str) -> None:
         """
         Internal call back handler for inserting functionality between msg recv and call
         """
-        self.callback(*args, **kwargs)
+        if self.coalesce_ms <= 0:
+            self.apply(msg)
+            return
+
+        now = time.ticks_ms()
+        due = self.command_due
+        if self._pending is None:
+            if due is None or not 0 < time.ticks_diff(due, now) <= self.coalesce_ms:
+                # outside a window, so applied without delay; the window opens
+                # here, so a stream of commands cannot hold off the last one
+                self.command_due = time.ticks_add(now, self.coalesce_ms)
+                self.apply(msg)
+                return
+            self.board.defer_command(self)
+        else:
+            self.coalesced += 1
+        self._pending = msg
+
+    def apply_pending(self) -> None:
+        """Apply the pending coalesced command, if any"""
+        msg = self._pending
+        if msg is None:
+            return
+        self._pending = None
+        self.apply(msg)
+
+    def apply(self, msg: str) -> None:
+        """Pass `msg` to the callback, and publish the resulting state"""
+        self.callback(msg)
+        if self.optimistic:
+            self.board.echo(self, msg)
+        else:
+            # only the owning device needs to be re-read and published
+            self.board.mark_dirty(self.parent)
 
-    def discover(self):
-        self.board.subscribe(self.command_topic, self.callback)
-        super().discover()
+    def attach(self) -> None:
+        # the board subscribes to all command topics with a single wildcard
+        self.board.route(self.command_topic, self._internal_callback)
@@ -4,6 +4,8 @@ Interface is the base class for all IO objects
 
 import json
 
+import ubinascii  # pylint: disable=import-error
+
 
 illegal_chars = [" "]
 
@@ -32,6 +34,9 @@ class Interface:
         "_component",
         "_board",  # provides access to Board level functions
         "_parent",  # provides access to parent Device
+        "_discovery_topic",  # cached discovery topic
+        "_discovery_message",  # cached, encoded discovery payload
+        "_discovery_hash",  # crc32 of the cached topic and payload
     ]
 
     def __init__(
@@ -52,6 +57,10 @@ class Interface:
 
         self._force_update = force_update
 
+        self._discovery_topic = None
+        self._discovery_message = None
+        self._discovery_hash = None
+
         for char in illegal_chars:
             if char in name:
                 raise ValueError(
@@ -100,6 +109,7 @@ class Interface:
     @icon.setter
     def icon(self, icon: str):
         self._icon = icon
+        self.invalidate()
         self.discover()
 
     @property
@@ -107,6 +117,13 @@ class Interface:
         """Returns True if this output is flagged as Diagnostic"""
         return self._is_diagnostic
 
+    def attach(self) -> None:
+        """Called by Board.add_device, once the board and parent are set"""
+
+    def has_changed(self, old, new) -> bool:
+        """Returns True if the value has changed enough to be published"""
+        return old != new
+
     @property
     def base_discovery_payload(self) -> dict:
         """Returns the discovery payload"""
@@ -127,25 +144,56 @@ class Interface:
     def discovery_payload(self):
         raise NotImplementedError
 
-    def discover(self) -> None:
-        """
-        Perform discovery for this entity
-        """
+    def invalidate(self) -> None:
+        """Drop the cached discovery payload, to be rebuilt on next discovery"""
+        self._discovery_topic = None
+        self._discovery_message = None
+        self._discovery_hash = None
+
+    def build_discovery(self) -> None:
+        """Build and cache the discovery topic and encoded payload"""
         payload = self.discovery_payload
 
         payload["device"] = self.board.device_info
 
         base_topic = self.board.base_topic(self._component)
 
-        payload["state_topic"] = f"{self.board.base_topic("sensor")}/state"
+        payload["state_topic"] = self.parent.state_topic
+        if getattr(self.parent, "deadline_ms", None) is not None:
+            # quarantined devices are shown as unavailable
+            payload["availability_topic"] = self.parent.availability_topic
         payload["unique_id"] = f"{self.board.uid}_{self.name}"
 
-        discovery_topic = f"{base_topic}/{self.name}/config"
+        self._discovery_topic = f"{base_topic}/{self.name}/config"
+        self._discovery_message = json.dumps(payload).encode()
+        self._discovery_hash = ubinascii.crc32(
+            self._discovery_message, ubinascii.crc32(self._discovery_topic.encode())
+        )
+
+    def discovery_config(self) -> tuple:
+        """Returns the cached discovery (topic, payload), building them if needed"""
+        if self._discovery_message is None:
+            self.build_discovery()
+        return self._discovery_topic, self._discovery_message
+
+    def discover(self, force: bool = False) -> None:
+        """
+        Perform discovery for this entity
+
+        Skipped if the broker already holds this exact config, unless `force`
+        """
+        if self._discovery_message is None:
+            self.build_discovery()
+
+        hashes = self.board.discovery_hashes
+        topic = self._discovery_topic
+        if not force and hashes.get(topic) == self._discovery_hash:
+            return
 
         print(self.name)
-        print(discovery_topic)
-        print(payload)
+        print(topic)
+        print(self._discovery_message)
 
-        self.board.publish(
-            topic=discovery_topic, message=json.dumps(payload), retain=True
-        )
+        message = self._discovery_message
+        if self.board.publish(topic=topic, message=message, retain=True):
+            hashes[topic] = self._discovery_hash
@@ -6,6 +6,7 @@ whereas a combination sensor may have multiple. A particulate sensor may have
 three, for PM10, 2.5 and 1.0.
 """
 
+from deviceos.devices.io.aggregate import Aggregate
 from deviceos.devices.io.interface import Interface
 
 
@@ -26,12 +27,25 @@ class Output(Interface):
         diagnostic: flag this sensor as "diagnostic"
         format_mod: format modifer (eg round(2))
         force_update: adds force_update flag to discovery if True (Default True)
+        calibration: offset added to each value, or a Calibration for a
+            scale, polynomial or lookup table
+        deadband: absolute change required before a new value is published
+        deadband_rel: relative change (fraction of the last published value)
+            required before a new value is published
+        aggregate: report an aggregate of the samples taken between reports,
+            rather than the latest. One of "mean", "min", "max", "median",
+            "ewma", "stddev", "count"
+        window: number of samples kept for a "median" aggregate (Default 16)
+        alpha: smoothing factor for an "ewma" aggregate (Default 0.2)
     """
 
     __slots__ = [
         "_unit",
         "_format",
         "calibration",
+        "deadband",
+        "deadband_rel",
+        "aggregate",
     ]
 
     def __init__(
@@ -43,7 +57,12 @@ class Output(Interface):
         diagnostic: bool = False,
         format_mod: str | None = None,
         force_update: bool = True,
-        calibration: int | float | None = None,
+        calibration: "int | float | Calibration | None" = None,
+        deadband: int | float | None = None,
+        deadband_rel: float | None = None,
+        aggregate: str | None = None,
+        window: int = 16,
+        alpha: float = 0.2,
     ):
         super().__init__(
             name=name,
@@ -57,6 +76,13 @@ class Output(Interface):
         self.calibration = calibration
         self._format = format_mod  # format modifer such as round(2)
 
+        self.deadband = deadband
+        self.deadband_rel = deadband_rel
+
+        self.aggregate = None
+        if aggregate is not None:
+            self.aggregate = Aggregate(aggregate, window=window, alpha=alpha)
+
     def __repr__(self) -> str:
         return f"Output({self.name})"
 
@@ -76,6 +102,24 @@ class Output(Interface):
         """
         return self._unit
 
+    def has_changed(self, old, new) -> bool:
+        """
+        Returns True if `new` has moved past the deadband around `old`
+
+        Non-numeric values, or outputs without a deadband, are compared directly
+        """
+        if self.deadband is None and self.deadband_rel is None:
+            return old != new
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)):
+            return old != new
+
+        delta = abs(new - old)
+        if self.deadband is not None and delta > self.deadband:
+            return True
+        if self.deadband_rel is not None and delta > self.deadband_rel * abs(old):
+            return True
+        return False
+
     @property
     def discovery_payload(self) -> dict:
         """Returns the discovery payload"""
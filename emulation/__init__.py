@@ -0,0 +1,67 @@
+"""
+Host-side emulation of the MicroPython modules used by deviceos
+
+Allows the full Board/Device/Interface stack to run under CPython, for
+development, testing and benchmarking. This package is not installed on
+boards.
+
+Usage:
+
+    import emulation
+    backend = emulation.install()
+
+    from deviceos.board import Board
+    board = Board(...)
+
+    backend.broker.publish(f"{board.base_topic('switch')}/LED/set", "ON")
+"""
+
+import binascii
+import os
+import sys
+
+from emulation.backend import Backend, bind, current, set_current
+from emulation.broker import Broker, EmulatedSocket, topic_matches
+from emulation.tlsbroker import TLSBroker
+from emulation import clock
+
+
+MODULES = os.path.join(os.path.dirname(__file__), "modules")
+
+
+def install(backend: Backend | None = None) -> Backend:
+    """
+    Make the emulated `machine`, `network`, `micropython` and `umqtt.simple`
+    modules importable, and add the MicroPython `time` functions
+
+    Must be called before anything from deviceos is imported. Calling this
+    again swaps in a new backend, without reimporting anything.
+
+    Args:
+        backend: Backend to emulate, a default one is created if not given
+
+    Returns the active Backend
+    """
+    if backend is None:
+        backend = Backend()
+    set_current(backend)
+
+    clock.install()
+
+    if MODULES not in sys.path:
+        sys.path.insert(0, MODULES)
+    sys.modules.setdefault("ubinascii", binascii)
+
+    return backend
+
+
+__all__ = [
+    "Backend",
+    "Broker",
+    "EmulatedSocket",
+    "TLSBroker",
+    "bind",
+    "current",
+    "install",
+    "topic_matches",
+]
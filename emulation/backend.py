@@ -0,0 +1,159 @@
+"""
+Emulated hardware state, shared by the fake MicroPython modules
+"""
+
+import contextvars
+import time
+
+from emulation.broker import Broker
+from emulation.transport import TCPSocket
+
+
+# ADC channel 4 is the rp2040 temperature sensor, this reads as 27C
+DEFAULT_ADC = {4: 14021}
+
+
+class Backend:
+    """
+    State of the emulated board
+
+    The fake `machine`, `network` and `umqtt.simple` modules read and write
+    this, so tests can set sensor values, drop the network, or send commands
+
+    Args:
+        uid: value returned by machine.unique_id()
+        broker: Broker that MQTT clients connect to, a new one if not given
+        tcp: connect MQTT clients over TCP to the host and port they are
+            given, such as a local mosquitto, rather than to `broker`
+        adc: channel: raw u16 value (or a callable returning one)
+        wifi_delay_ms: time between WLAN.connect() and being connected
+        ip: address reported by WLAN.ifconfig()
+
+    Attributes:
+        wifi_available: set False to emulate the access point going away
+        pins: Pin id: last emulated Pin created with that id
+        watchdog_feeds: number of WDT.feed() calls
+        sleeps: list of (kind, ms) for each lightsleep/deepsleep call
+        sockets: MQTT connections opened by this board
+        bytes_sent: bytes written by this board's MQTT clients
+        bytes_received: bytes read by this board's MQTT clients
+    """
+
+    def __init__(
+        self,
+        uid: bytes = b"\xe6\x61\x41\x04\x03\x4d\x2b\x2e",
+        broker: Broker | None = None,
+        tcp: bool = False,
+        adc: dict | None = None,
+        wifi_delay_ms: int = 0,
+        ip: str = "10.0.0.2",
+    ):
+        self.uid = uid
+        self.broker = broker if broker is not None else Broker()
+        self.tcp = tcp
+
+        self.adc = dict(DEFAULT_ADC)
+        if adc is not None:
+            self.adc.update(adc)
+
+        self.wifi_available = True
+        self.wifi_delay_ms = wifi_delay_ms
+        self.ip = ip
+        self.hostname = "PicoW"
+        # time.monotonic() of the last WLAN.connect(), None if disconnected
+        self.wifi_connected_at = None
+
+        self.pins = {}
+        self.watchdog_timeout = None
+        self.watchdog_feeds = 0
+        self.sleeps = []
+
+        self.sockets = []
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def __repr__(self) -> str:
+        return f"Backend({self.uid.hex()})"
+
+    def read_adc(self, channel) -> int:
+        """Returns the raw u16 value of ADC `channel`"""
+        value = self.adc.get(channel, 0)
+        if callable(value):
+            value = value()
+        return int(value) & 0xFFFF
+
+    @property
+    def wifi_connected(self) -> bool:
+        """True if an emulated WLAN has associated with the access point"""
+        if not self.wifi_available or self.wifi_connected_at is None:
+            return False
+        elapsed = (time.monotonic() - self.wifi_connected_at) * 1000
+        return elapsed >= self.wifi_delay_ms
+
+    def connect_mqtt(self, host: str, port: int):
+        """Returns a socket connected to the broker at `host`:`port`"""
+        if not self.wifi_connected:
+            raise OSError("no network")
+        if self.tcp:
+            sock = TCPSocket(host, port, backend=self)
+        else:
+            sock = self.broker.connect(host, port)
+            sock.backend = self
+        self.sockets = [s for s in self.sockets if not s.closed]
+        self.sockets.append(sock)
+        return sock
+
+    def drop_wifi(self) -> None:
+        """Emulate losing the access point, closing any broker connections"""
+        self.wifi_available = False
+        self.wifi_connected_at = None
+        self.drop_connections()
+
+    def drop_connections(self) -> None:
+        """Close this board's MQTT connections from the far end"""
+        for sock in self.sockets:
+            sock.hangup()
+        self.sockets = []
+
+    def restore_wifi(self) -> None:
+        """Make the access point available again"""
+        self.wifi_available = True
+
+    def set_pin(self, pin_id, value: int) -> None:
+        """Drive the input `pin_id`, firing any irq handler on an edge"""
+        pin = self.pins.get(pin_id)
+        if pin is None:
+            raise KeyError(f"no emulated Pin {pin_id}")
+        pin.drive(value)
+
+
+_current = None
+# overrides _current within a context, such as one asyncio task per board
+_bound = contextvars.ContextVar("emulation_backend", default=None)
+
+
+def current() -> Backend:
+    """Returns the active Backend, creating a default one if needed"""
+    global _current  # pylint: disable=global-statement
+    backend = _bound.get()
+    if backend is not None:
+        return backend
+    if _current is None:
+        _current = Backend()
+    return _current
+
+
+def set_current(backend: Backend) -> None:
+    """Make `backend` the active Backend"""
+    global _current  # pylint: disable=global-statement
+    _current = backend
+
+
+def bind(backend: Backend) -> None:
+    """
+    Make `backend` the active Backend for the current context only
+
+    Each asyncio task runs in a copy of the context it was created in, so
+    calling this at the start of a task gives that task its own board
+    """
+    _bound.set(backend)
@@ -0,0 +1,414 @@
+"""
+In-process stand-in for an MQTT broker
+"""
+
+import socket
+import struct
+import time
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """Returns True if `topic` matches the subscription `pattern`"""
+    if pattern == topic:
+        return True
+    if "+" not in pattern and "#" not in pattern:
+        return False
+    pattern_levels = pattern.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(pattern_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(pattern_levels) == len(topic_levels)
+
+
+def _encode_length(length: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        if length:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _publish_packet(
+    topic: str, payload: bytes, retain: bool, qos: int = 0, pid: int = 0
+) -> bytes:
+    topic = topic.encode()
+    body = struct.pack("!H", len(topic)) + topic
+    if qos:
+        body += struct.pack("!H", pid)
+    body += payload
+    header = 0x30 | retain | qos << 1
+    return bytes([header]) + _encode_length(len(body)) + body
+
+
+class EmulatedSocket:
+    """
+    Client end of a connection to the Broker
+
+    Behaves as a MicroPython stream socket: read(n) and readinto() block for
+    n bytes unless non-blocking, in which case they return what has arrived,
+    or None if nothing is waiting. Writes are handled by the broker
+    immediately, and any response is readable from (and pollable on) fileno()
+    straight away.
+    """
+
+    def __init__(self, broker: "Broker"):
+        self.broker = broker
+        # Backend to count the bytes sent and received against
+        self.backend = None
+        self.client_id = None
+        self.subscriptions = {}
+        self.closed = False
+        # keepalive from CONNECT, in seconds, and time.monotonic() of the
+        # last packet written
+        self.keepalive = 0
+        self.last_seen = time.monotonic()
+
+        # bytes written by the client, and not yet parsed by the broker
+        self._pending = bytearray()
+        self._client, self._server = socket.socketpair()
+
+    def __repr__(self) -> str:
+        return f"EmulatedSocket({self.client_id!r})"
+
+    def fileno(self) -> int:
+        return self._client.fileno()
+
+    def setblocking(self, flag: bool) -> None:
+        self._client.setblocking(flag)
+
+    def settimeout(self, timeout: float | None) -> None:
+        self._client.settimeout(timeout)
+
+    def read(self, size: int) -> bytes | None:
+        try:
+            data = self._client.recv(size)
+        except BlockingIOError:
+            return None
+        except OSError as exc:
+            raise OSError(str(exc)) from exc
+
+        # a blocking read waits for all of it, a non-blocking one returns
+        # whatever has arrived, as a MicroPython stream does
+        while data and len(data) < size and self._client.getblocking():
+            chunk = self._client.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+
+        if data and self.backend is not None:
+            self.backend.bytes_received += len(data)
+        return data
+
+    def readinto(self, buffer) -> int | None:
+        data = self.read(len(buffer))
+        if data is None:
+            return None
+        buffer[: len(data)] = data
+        return len(data)
+
+    def write(self, data, length: int | None = None) -> int:
+        if self.closed:
+            raise OSError("socket closed")
+        if isinstance(data, str):
+            data = data.encode()
+        if length is not None:
+            data = data[:length]
+        data = bytes(data)
+        self.broker.bytes_in += len(data)
+        if self.backend is not None:
+            self.backend.bytes_sent += len(data)
+        self._pending.extend(data)
+        self.broker.handle(self)
+        return len(data)
+
+    def send(self, data) -> int:
+        return self.write(data)
+
+    def start_tls(self, context, server_hostname: str | None = None) -> None:
+        raise OSError(
+            "the in-process broker has no TLS, use Backend(tcp=True) with a "
+            "TLSBroker"
+        )
+
+    def deliver(self, packet: bytes) -> None:
+        """Send `packet` from the broker to this client"""
+        if self.closed:
+            return
+        self.broker.bytes_out += len(packet)
+        self._server.sendall(packet)
+
+    def close(self) -> None:
+        self._client.close()
+        if self.closed:
+            return
+        self.closed = True
+        self._server.close()
+        self.broker.remove(self)
+
+    def hangup(self) -> None:
+        """Close the broker end, so the client sees the connection drop"""
+        if self.closed:
+            return
+        self.closed = True
+        self._server.close()
+        self.broker.remove(self)
+
+
+class Broker:
+    """
+    Minimal MQTT 3.1.1 broker, running in-process
+
+    Handles CONNECT, PUBLISH (QoS 0 and 1), SUBSCRIBE, PINGREQ and DISCONNECT,
+    routes messages to subscribers and keeps retained messages. Everything
+    published is logged in `messages`, for inspection.
+
+    Clients connecting with clean_session=False keep their subscriptions,
+    and QoS 1 messages for them are queued while they are disconnected.
+
+    Attributes:
+        accept: set False to refuse new connections
+        ack: set False to stop sending PUBACKs, to emulate a lossy link
+        retained: topic: payload of retained messages
+        log: set False to stop logging to `messages`, for long runs
+        messages: list of (client_id, topic, payload, retain, qos) received
+        published_count: number of messages received
+        bytes_in: bytes written by clients
+        bytes_out: bytes sent to clients
+        connects: number of accepted connections
+        keepalive_drops: connections dropped for exceeding 1.5x their
+            keepalive without sending anything, as a real broker would
+        sessions: client_id: [subscriptions, queued packets] of persistent
+            sessions
+    """
+
+    def __init__(self):
+        self.accept = True
+        self.ack = True
+        self.clients = []
+        self.retained = {}
+        self.sessions = {}
+        self._pid = 0
+        self.log = True
+        self.messages = []
+        self.published_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.connects = 0
+        self.keepalive_drops = 0
+        self._reaped_at = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f"Broker({len(self.clients)} clients, {len(self.retained)} retained)"
+
+    def reset_stats(self) -> None:
+        """Clear the message log and byte counters"""
+        self.messages = []
+        self.published_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def connect(self, host: str, port: int) -> EmulatedSocket:
+        """Open a new client connection, raises OSError if refused"""
+        if not self.accept:
+            raise OSError(f"connection to {host}:{port} refused")
+        sock = EmulatedSocket(self)
+        self.clients.append(sock)
+        return sock
+
+    def remove(self, sock: EmulatedSocket) -> None:
+        if sock in self.clients:
+            self.clients.remove(sock)
+
+    def drop_clients(self) -> None:
+        """Close every connection from the broker side"""
+        for sock in list(self.clients):
+            sock.hangup()
+
+    def publish(
+        self, topic: str, payload: str | bytes, retain: bool = False, qos: int = 0
+    ) -> None:
+        """
+        Publish a message from outside of any client, such as a command from
+        Home Assistant
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.reap()
+        self._route(None, topic, payload, retain, qos)
+
+    def reap(self, force: bool = False) -> None:
+        """
+        Hang up clients which have been silent for 1.5x their keepalive
+
+        Checked at most once a second, unless `force`
+        """
+        now = time.monotonic()
+        if not force and now - self._reaped_at < 1:
+            return
+        self._reaped_at = now
+        for client in list(self.clients):
+            if client.keepalive and now - client.last_seen > 1.5 * client.keepalive:
+                self.keepalive_drops += 1
+                client.hangup()
+
+    def published(self, pattern: str = "#") -> list:
+        """Returns (topic, payload) of logged messages matching `pattern`"""
+        return [
+            (topic, payload)
+            for _, topic, payload, _, _ in self.messages
+            if topic_matches(pattern, topic)
+        ]
+
+    def _route(self, sender, topic: str, payload: bytes, retain: bool, qos: int):
+        self.published_count += 1
+        if self.log:
+            client_id = None if sender is None else sender.client_id
+            self.messages.append((client_id, topic, payload, retain, qos))
+
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+
+        connected = set()
+        for client in list(self.clients):
+            connected.add(client.client_id)
+            granted = self._granted(client.subscriptions, topic)
+            if granted is not None:
+                client.deliver(self._packet_for(topic, payload, min(qos, granted)))
+
+        # persistent sessions of disconnected clients hold QoS 1 messages
+        for client_id, session in self.sessions.items():
+            if client_id in connected:
+                continue
+            granted = self._granted(session[0], topic)
+            if granted is not None and min(qos, granted):
+                session[1].append(self._packet_for(topic, payload, 1))
+
+    def _granted(self, subscriptions: dict, topic: str) -> int | None:
+        """Returns the max QoS of the subscriptions matching `topic`"""
+        granted = None
+        for pattern, qos in subscriptions.items():
+            if topic_matches(pattern, topic) and (granted is None or qos > granted):
+                granted = qos
+        return granted
+
+    def _packet_for(self, topic: str, payload: bytes, qos: int) -> bytes:
+        if not qos:
+            return _publish_packet(topic, payload, False)
+        self._pid = self._pid % 65535 + 1
+        return _publish_packet(topic, payload, False, 1, self._pid)
+
+    def handle(self, sock: EmulatedSocket) -> None:
+        """Parse and act on any complete packets written by `sock`"""
+        self.reap()
+        sock.last_seen = time.monotonic()
+        buffer = sock._pending  # pylint: disable=protected-access
+        while len(buffer) >= 2:
+            length = 0
+            shift = 0
+            index = 1
+            while True:
+                if index >= len(buffer):
+                    return
+                byte = buffer[index]
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                index += 1
+                if not byte & 0x80:
+                    break
+            if len(buffer) < index + length:
+                return
+
+            header = buffer[0]
+            body = bytes(buffer[index : index + length])
+            del buffer[: index + length]
+            self._packet(sock, header, body)
+            if sock.closed:
+                return
+
+    def _packet(self, sock: EmulatedSocket, header: int, body: bytes) -> None:
+        kind = header >> 4
+
+        if kind == 1:  # CONNECT
+            protocol_len = struct.unpack_from("!H", body, 0)[0]
+            start = 2 + protocol_len + 4
+            clean = body[2 + protocol_len + 1] & 0x02
+            sock.keepalive = struct.unpack_from("!H", body, 2 + protocol_len + 2)[0]
+            id_len = struct.unpack_from("!H", body, start)[0]
+            sock.client_id = body[start + 2 : start + 2 + id_len].decode()
+            self.connects += 1
+
+            session = self.sessions.get(sock.client_id)
+            if clean or session is None:
+                session = [sock.subscriptions, []]
+            if clean:
+                self.sessions.pop(sock.client_id, None)
+            else:
+                self.sessions[sock.client_id] = session
+            sock.subscriptions = session[0]
+
+            present = 0 if clean else 1
+            sock.deliver(bytes([0x20, 0x02, present, 0x00]))
+            for packet in session[1]:
+                sock.deliver(packet)
+            session[1].clear()
+
+        elif kind == 3:  # PUBLISH
+            qos = (header >> 1) & 0x03
+            topic_len = struct.unpack_from("!H", body, 0)[0]
+            topic = body[2 : 2 + topic_len].decode()
+            start = 2 + topic_len
+            if qos:
+                pid = body[start : start + 2]
+                start += 2
+            self._route(sock, topic, body[start:], bool(header & 0x01), qos)
+            if qos == 1 and self.ack:
+                sock.deliver(b"\x40\x02" + pid)
+
+        elif kind == 4:  # PUBACK, messages are not redelivered
+            pass
+
+        elif kind == 8:  # SUBSCRIBE
+            pid = body[:2]
+            start = 2
+            granted = bytearray()
+            patterns = []
+            while start < len(body):
+                topic_len = struct.unpack_from("!H", body, start)[0]
+                pattern = body[start + 2 : start + 2 + topic_len].decode()
+                qos = min(body[start + 2 + topic_len], 1)
+                start += 2 + topic_len + 1
+                sock.subscriptions[pattern] = qos
+                patterns.append(pattern)
+                granted.append(qos)
+            sock.deliver(bytes([0x90, 2 + len(granted)]) + pid + bytes(granted))
+            for topic, payload in list(self.retained.items()):
+                if any(topic_matches(pattern, topic) for pattern in patterns):
+                    sock.deliver(_publish_packet(topic, payload, True))
+
+        elif kind == 10:  # UNSUBSCRIBE
+            pid = body[:2]
+            start = 2
+            while start < len(body):
+                topic_len = struct.unpack_from("!H", body, start)[0]
+                pattern = body[start + 2 : start + 2 + topic_len].decode()
+                sock.subscriptions.pop(pattern, None)
+                start += 2 + topic_len
+            sock.deliver(b"\xb0\x02" + pid)
+
+        elif kind == 12:  # PINGREQ
+            sock.deliver(b"\xd0\x00")
+
+        elif kind == 14:  # DISCONNECT
+            sock.hangup()
@@ -0,0 +1,63 @@
+"""
+MicroPython `time` functions, for CPython
+
+Ticks wrap at 2**30, as they do on the rp2040, so that wraparound bugs
+show up off-device too
+"""
+
+import time
+
+
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALF = TICKS_PERIOD // 2
+
+_start = time.monotonic_ns()
+
+
+def ticks_ms() -> int:
+    return ((time.monotonic_ns() - _start) // 1000000) & _TICKS_MAX
+
+
+def ticks_us() -> int:
+    return ((time.monotonic_ns() - _start) // 1000) & _TICKS_MAX
+
+
+def ticks_cpu() -> int:
+    return ticks_us()
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(end: int, start: int) -> int:
+    diff = (end - start) & _TICKS_MAX
+    if diff >= _TICKS_HALF:
+        diff -= TICKS_PERIOD
+    return diff
+
+
+def sleep_ms(ms: int) -> None:
+    if ms > 0:
+        time.sleep(ms / 1000)
+
+
+def sleep_us(us: int) -> None:
+    if us > 0:
+        time.sleep(us / 1000000)
+
+
+def install() -> None:
+    """Add any missing MicroPython functions to the `time` module"""
+    for function in (
+        ticks_ms,
+        ticks_us,
+        ticks_cpu,
+        ticks_add,
+        ticks_diff,
+        sleep_ms,
+        sleep_us,
+    ):
+        if not hasattr(time, function.__name__):
+            setattr(time, function.__name__, function)
@@ -0,0 +1,357 @@
+"""
+Virtual fleet of emulated boards, for load testing a broker and Home Assistant
+
+Each board is a real deviceos Board running main_async(), with its own
+emulated hardware, all sharing one asyncio event loop. Boards connect to the
+in-process Broker, or over TCP to a real broker such as a local mosquitto.
+
+Usage:
+
+    import emulation
+    emulation.install()
+
+    from emulation.fleet import Fleet
+    fleet = Fleet(size=500, host="localhost")
+    report = asyncio.run(fleet.run(duration=60, storms=[20], online_events=[40]))
+"""
+
+import asyncio
+import random
+import struct
+import time
+
+from emulation.backend import Backend, bind
+from emulation.broker import Broker
+
+# pylint: disable=wrong-import-position
+# deviceos must be imported after emulation.install()
+from deviceos.board import Board  # noqa: E402
+from deviceos.devices.device import Device  # noqa: E402
+from deviceos.devices.io.output import Output  # noqa: E402
+
+
+class Synthetic(Device):
+    """
+    Device with `count` outputs, each a random walk
+
+    Args:
+        name: device name, also the prefix of the output names
+        count: number of outputs
+        interval: seconds between reads
+        change: probability of each output changing on a read
+    """
+
+    def __init__(self, name: str, count: int, interval: float, change: float = 0.5):
+        super().__init__(name=name, interval=interval)
+        self.interfaces = [
+            Output(name=f"{name}_{index}", unit="C", icon="mdi:thermometer")
+            for index in range(count)
+        ]
+        self.change = change
+        self._values = {interface.name: 20.0 for interface in self.interfaces}
+
+    def read(self):
+        values = self._values
+        for name, value in values.items():
+            if random.random() < self.change:
+                values[name] = round(value + random.uniform(-0.5, 0.5), 1)
+        return dict(values)
+
+
+class SimBoard(Board):
+    """
+    Board recording how long discovery takes to complete after an event
+
+    Attributes:
+        backend: emulated hardware of this board
+        published: messages passed to publish()
+        received: messages received from the broker
+        discoveries: list of (event, ms) for each completed discovery
+    """
+
+    __slots__ = ["backend", "published", "received", "discoveries", "_event"]
+
+    def __init__(self, backend: Backend, *args, **kwargs):
+        self.backend = backend
+        self.published = 0
+        self.received = 0
+        self.discoveries = []
+        # (name, time.monotonic()) of the event awaiting discovery, or None
+        self._event = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def awaiting_discovery(self) -> bool:
+        """Returns True if discovery has not completed since the last mark()"""
+        return self._event is not None
+
+    def mark(self, event: str) -> None:
+        """Start timing the discovery following `event`"""
+        self._event = (event, time.monotonic())
+
+    def finish_discovery(self, failed: list) -> None:
+        super().finish_discovery(failed)
+        if self._event is not None:
+            event, start = self._event
+            self.discoveries.append((event, (time.monotonic() - start) * 1000))
+            self._event = None
+
+    def publish(self, topic: str, message: str, retain: bool = False) -> bool:
+        self.published += 1
+        return super().publish(topic=topic, message=message, retain=retain)
+
+    def callback(self, topic: str, msg: str):
+        self.received += 1
+        super().callback(topic, msg)
+
+
+def percentiles(values: list) -> dict:
+    """Returns the count, p50, p90, p99 and max of `values`"""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {
+        "count": len(ordered),
+        "p50": round(ordered[last * 50 // 100], 1),
+        "p90": round(ordered[last * 90 // 100], 1),
+        "p99": round(ordered[last * 99 // 100], 1),
+        "max": round(ordered[last], 1),
+    }
+
+
+class Fleet:
+    """
+    Many emulated boards, run concurrently under asyncio
+
+    Args:
+        size: number of boards
+        interfaces: interfaces per board
+        per_device: interfaces per Synthetic device
+        interval: seconds between reads of each device, and between publishes
+        host: broker to connect to over TCP, or None for an in-process Broker
+        port: broker port
+        user: broker user name, if it needs one
+        password: broker password
+        discovery_prefix: Home Assistant discovery prefix
+        command_poll_ms: how often each board checks for incoming messages
+        ramp: seconds over which the boards are started, 0 to start together
+        change: probability of each interface changing on a read
+        board_kwargs: any other Board arguments, such as persistent_session
+    """
+
+    def __init__(
+        self,
+        size: int = 100,
+        interfaces: int = 10,
+        per_device: int = 10,
+        interval: float = 15,
+        host: str | None = None,
+        port: int = 1883,
+        user: str = "",
+        password: str = "",
+        discovery_prefix: str = "homeassistant",
+        command_poll_ms: int = 100,
+        ramp: float = 0,
+        change: float = 0.5,
+        board_kwargs: dict | None = None,
+    ):
+        self.size = size
+        self.interfaces = interfaces
+        self.per_device = per_device
+        self.interval = interval
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.discovery_prefix = discovery_prefix
+        self.command_poll_ms = command_poll_ms
+        self.ramp = ramp
+        self.change = change
+        self.board_kwargs = board_kwargs or {}
+
+        self.broker = None
+        if host is None:
+            self.broker = Broker()
+            # a long run would otherwise keep every message
+            self.broker.log = False
+
+        self.boards = []
+        # (seconds, messages published) sampled each second
+        self._samples = []
+
+    def __repr__(self) -> str:
+        return f"Fleet({self.size} boards, {self.host or 'in-process'})"
+
+    def _backend(self, index: int) -> Backend:
+        return Backend(
+            uid=struct.pack(">Q", 0xF1EE7000000000 + index),
+            broker=self.broker,
+            tcp=self.host is not None,
+            ip=f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+        )
+
+    def _build(self, backend: Backend, index: int) -> SimBoard:
+        board = SimBoard(
+            backend,
+            "fleet",
+            "fleet",
+            self.host or "broker",
+            self.user,
+            self.password,
+            mqtt_port=self.port,
+            discovery_prefix=self.discovery_prefix,
+            interval=self.interval,
+            name=f"sim{index}",
+            # connected by the reader task, rather than blocking the loop
+            connect=False,
+            **self.board_kwargs,
+        )
+        board.command_poll_ms = self.command_poll_ms
+
+        remaining = self.interfaces
+        device = 0
+        while remaining > 0:
+            count = min(self.per_device, remaining)
+            board.add_device(
+                Synthetic(f"syn{device}", count, self.interval, self.change)
+            )
+            remaining -= count
+            device += 1
+        return board
+
+    async def _run_board(self, index: int) -> None:
+        if self.ramp:
+            await asyncio.sleep(self.ramp * index / self.size)
+        backend = self._backend(index)
+        # the emulated modules find this board's hardware through the context
+        bind(backend)
+        board = self._build(backend, index)
+        board.mark("boot")
+        self.boards.append(board)
+        await board.main_async()
+
+    def storm(self) -> None:
+        """Drop every board's connection at once, as a broker restart would"""
+        print(f"reconnect storm: dropping {len(self.boards)} boards")
+        for board in self.boards:
+            board.mark("storm")
+            board.backend.drop_connections()
+
+    def online(self) -> None:
+        """Publish Home Assistant's `online` status, as it does on a restart"""
+        print("home assistant online")
+        for board in self.boards:
+            board.mark("online")
+        topic = f"{self.discovery_prefix}/status"
+        if self.broker is not None:
+            self.broker.publish(topic, "online")
+            return
+
+        # pylint: disable=import-error,import-outside-toplevel
+        from umqtt.simple import MQTTClient
+
+        controller = Backend(uid=b"homeassistant", tcp=True)
+        controller.wifi_connected_at = 0
+        bind(controller)
+        client = MQTTClient(
+            "fleet-controller", self.host, self.port, self.user, self.password
+        )
+        client.connect()
+        client.publish(topic, "online")
+        client.disconnect()
+
+    async def _events(self, storms: list, online_events: list) -> None:
+        start = time.monotonic()
+        events = sorted(
+            [(at, self.storm) for at in storms]
+            + [(at, self.online) for at in online_events],
+            key=lambda event: event[0],
+        )
+        for at, action in events:
+            await asyncio.sleep(max(0, start + at - time.monotonic()))
+            action()
+
+    async def _sample(self) -> None:
+        start = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            published = sum(board.published for board in self.boards)
+            self._samples.append((time.monotonic() - start, published))
+
+    async def run(
+        self, duration: float, storms: list = (), online_events: list = ()
+    ) -> dict:
+        """
+        Run the fleet for `duration` seconds, returning report()
+
+        Args:
+            duration: seconds to run for
+            storms: seconds after the start of each reconnect storm
+            online_events: seconds after the start of each Home Assistant
+                `online` status message
+        """
+        tasks = [asyncio.create_task(self._run_board(i)) for i in range(self.size)]
+        tasks.append(asyncio.create_task(self._events(storms, online_events)))
+        tasks.append(asyncio.create_task(self._sample()))
+
+        start = time.monotonic()
+        await asyncio.sleep(duration)
+        elapsed = time.monotonic() - start
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        """
+        Returns message rates, bytes and discovery completion time percentiles
+
+        Discovery times are in ms from each event (boot, storm or online) to
+        that board's discovery completing, boards which never completed it are
+        counted in `pending`
+        """
+        boards = self.boards
+        published = sum(board.published for board in boards)
+        received = sum(board.received for board in boards)
+
+        # busiest one second interval
+        peak = 0
+        last = (0, 0)
+        for sample in self._samples:
+            peak = max(peak, (sample[1] - last[1]) / max(sample[0] - last[0], 1e-9))
+            last = sample
+
+        discovery = {}
+        for event in ("boot", "storm", "online"):
+            times = [
+                ms
+                for board in boards
+                for name, ms in board.discoveries
+                if name == event
+            ]
+            if times:
+                discovery[event] = percentiles(times)
+        pending = sum(1 for board in boards if board.awaiting_discovery)
+
+        report = {
+            "boards": len(boards),
+            "interfaces": self.interfaces,
+            "seconds": round(elapsed, 1),
+            "online": sum(1 for board in boards if board.online),
+            "published": published,
+            "published_per_s": round(published / elapsed, 1),
+            "peak_published_per_s": round(peak, 1),
+            "received": received,
+            "bytes_sent": sum(board.backend.bytes_sent for board in boards),
+            "bytes_received": sum(board.backend.bytes_received for board in boards),
+            "socket_writes": sum(board.mqtt.writes for board in boards if board.mqtt),
+            "discovery_ms": discovery,
+            "discovery_pending": pending,
+        }
+        if self.broker is not None:
+            report["broker_messages"] = self.broker.published_count
+            report["broker_connects"] = self.broker.connects
+            report["keepalive_drops"] = self.broker.keepalive_drops
+        return report
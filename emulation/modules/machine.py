@@ -0,0 +1,128 @@
+"""
+Emulated `machine` module, backed by emulation.backend
+"""
+
+import time
+
+from emulation.backend import current
+
+
+class Pin:
+    """Emulated GPIO pin, registered with the backend by id"""
+
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int | None = None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        self._value = 1 if pull == self.PULL_UP else 0
+        if value is not None:
+            self._value = int(bool(value))
+        self._handler = None
+        self._trigger = 0
+        current().pins[id] = self
+
+    def __repr__(self) -> str:
+        return f"Pin({self.id!r})"
+
+    def __call__(self, value: int | None = None):
+        return self.value(value)
+
+    def value(self, value: int | None = None):
+        if value is None:
+            return self._value
+        self._value = int(bool(value))
+        return None
+
+    def on(self) -> None:
+        self._value = 1
+
+    def off(self) -> None:
+        self._value = 0
+
+    def toggle(self) -> None:
+        self._value ^= 1
+
+    def irq(self, handler=None, trigger: int = IRQ_FALLING | IRQ_RISING, hard=False):
+        self._handler = handler
+        self._trigger = trigger
+
+    def drive(self, value: int) -> None:
+        """Set the level from outside, as an external signal would"""
+        value = int(bool(value))
+        if value == self._value:
+            return
+        self._value = value
+        edge = self.IRQ_RISING if value else self.IRQ_FALLING
+        if self._handler is not None and self._trigger & edge:
+            self._handler(self)
+
+
+class ADC:
+    """Emulated ADC, reading the channel value set on the backend"""
+
+    CORE_TEMP = 4
+
+    def __init__(self, channel):
+        if isinstance(channel, Pin):
+            channel = channel.id
+        # GPIO26-29 are ADC channels 0-3
+        if isinstance(channel, int) and channel >= 26:
+            channel -= 26
+        self.channel = channel
+
+    def __repr__(self) -> str:
+        return f"ADC({self.channel})"
+
+    def read_u16(self) -> int:
+        return current().read_adc(self.channel)
+
+
+class WDT:
+    """Emulated watchdog, counting feeds on the backend"""
+
+    def __init__(self, id: int = 0, timeout: int = 5000):
+        current().watchdog_timeout = timeout
+
+    def feed(self) -> None:
+        current().watchdog_feeds += 1
+
+
+def unique_id() -> bytes:
+    return current().uid
+
+
+def freq(hz: int | None = None) -> int | None:
+    if hz is None:
+        return 125000000
+    return None
+
+
+def lightsleep(ms: int | None = None) -> None:
+    current().sleeps.append(("lightsleep", ms))
+    if ms:
+        time.sleep(ms / 1000)
+
+
+def deepsleep(ms: int | None = None) -> None:
+    current().sleeps.append(("deepsleep", ms))
+    raise SystemExit(f"deepsleep({ms})")
+
+
+def reset() -> None:
+    raise SystemExit("machine.reset()")
+
+
+def disable_irq() -> int:
+    return 0
+
+
+def enable_irq(state: int = 0) -> None:
+    pass
@@ -0,0 +1,34 @@
+"""
+Emulated `micropython` module
+"""
+
+
+def const(value):
+    return value
+
+
+def schedule(function, argument) -> None:
+    """Scheduled callbacks are run immediately, there are no hard interrupts"""
+    function(argument)
+
+
+def alloc_emergency_exception_buf(size: int) -> None:
+    pass
+
+
+def mem_info(verbose: int = 0) -> None:
+    pass
+
+
+def opt_level(level: int | None = None) -> int | None:
+    if level is None:
+        return 0
+    return None
+
+
+def native(function):
+    return function
+
+
+def viper(function):
+    return function
@@ -0,0 +1,83 @@
+"""
+Emulated `network` module, backed by emulation.backend
+"""
+
+import time
+
+from emulation.backend import current
+
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+
+def hostname(name: str | None = None) -> str | None:
+    if name is None:
+        return current().hostname
+    current().hostname = name
+    return None
+
+
+class WLAN:
+    """Emulated WLAN interface, connecting after the backend wifi_delay_ms"""
+
+    def __init__(self, interface: int = STA_IF):
+        self.interface = interface
+        self._active = False
+
+    def __repr__(self) -> str:
+        return f"WLAN({self.interface})"
+
+    def active(self, active: bool | None = None) -> bool | None:
+        if active is None:
+            return self._active
+        self._active = bool(active)
+        if not active:
+            current().wifi_connected_at = None
+        return None
+
+    def connect(self, ssid: str | None = None, key: str | None = None) -> None:
+        backend = current()
+        if backend.wifi_available and backend.wifi_connected_at is None:
+            backend.wifi_connected_at = time.monotonic()
+
+    def disconnect(self) -> None:
+        current().wifi_connected_at = None
+
+    def deinit(self) -> None:
+        self.active(False)
+
+    def isconnected(self) -> bool:
+        return self._active and current().wifi_connected
+
+    def status(self, param: str | None = None):
+        if param == "rssi":
+            return -60
+        backend = current()
+        if self.isconnected():
+            return STAT_GOT_IP
+        if not backend.wifi_available:
+            return STAT_NO_AP_FOUND if backend.wifi_connected_at else STAT_IDLE
+        if backend.wifi_connected_at is not None:
+            return STAT_CONNECTING
+        return STAT_IDLE
+
+    def ifconfig(self, config: tuple | None = None) -> tuple | None:
+        if config is not None:
+            current().ip = config[0]
+            return None
+        ip = current().ip
+        gateway = ".".join(ip.split(".")[:3] + ["1"])
+        return (ip, "255.255.255.0", gateway, gateway)
+
+    def config(self, *args, **kwargs):
+        if args == ("mac",):
+            return current().uid[:6]
+        return None
@@ -0,0 +1,163 @@
+"""
+TLS front end for the in-process Broker, for testing TLS connections
+"""
+
+import os
+import select
+import socket
+import ssl
+import subprocess
+import tempfile
+import threading
+
+from emulation.broker import Broker
+
+
+def make_certificates(directory: str, hostname: str = "localhost") -> tuple:
+    """
+    Create a throwaway CA, and a server certificate for `hostname` (and
+    127.0.0.1) signed by it, with the openssl command line tool
+
+    Returns the paths of (ca certificate, server certificate, server key)
+    """
+    ca_key = os.path.join(directory, "ca.key")
+    ca_cert = os.path.join(directory, "ca.pem")
+    key = os.path.join(directory, "server.key")
+    request = os.path.join(directory, "server.csr")
+    cert = os.path.join(directory, "server.pem")
+    extensions = os.path.join(directory, "server.ext")
+    with open(extensions, "w", encoding="utf-8") as file:
+        file.write(f"subjectAltName=DNS:{hostname},IP:127.0.0.1\n")
+
+    def openssl(*args):
+        subprocess.run(("openssl",) + args, check=True, capture_output=True)
+
+    openssl(
+        "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256",
+        "-nodes", "-keyout", ca_key, "-out", ca_cert, "-days", "2",
+        "-subj", "/CN=deviceos test CA",
+    )
+    openssl(
+        "req", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:P-256", "-nodes",
+        "-keyout", key, "-out", request, "-subj", f"/CN={hostname}",
+    )
+    openssl(
+        "x509", "-req", "-in", request, "-CA", ca_cert, "-CAkey", ca_key,
+        "-CAcreateserial", "-out", cert, "-days", "2", "-extfile", extensions,
+    )
+    return ca_cert, cert, key
+
+
+class TLSBroker:
+    """
+    Accepts TLS connections on localhost, and relays them to a Broker
+
+    Boards connect to it with Backend(tcp=True), as they would to a real
+    broker. The Broker is not thread safe, so anything else using it while
+    this is running should hold `lock`, or use publish().
+
+    Args:
+        broker: Broker to relay to, a new one if not given
+        port: port to listen on (Default 0, any free port)
+        directory: where to create the certificates (Default a new temporary
+            directory)
+        max_version: highest TLS version to accept, such as
+            ssl.TLSVersion.TLSv1_2 (Default no limit)
+
+    Attributes:
+        ca_path: path of the CA certificate, to pass to TLS(ca=...)
+        handshakes: handshakes completed
+        resumed: handshakes which resumed a session
+    """
+
+    def __init__(
+        self,
+        broker: Broker | None = None,
+        port: int = 0,
+        directory: str | None = None,
+        max_version: "ssl.TLSVersion | None" = None,
+    ):
+        self.broker = broker if broker is not None else Broker()
+        self.lock = threading.Lock()
+        self.handshakes = 0
+        self.resumed = 0
+
+        if directory is None:
+            self._tempdir = tempfile.TemporaryDirectory()
+            directory = self._tempdir.name
+        self.ca_path, cert, key = make_certificates(directory)
+
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert, key)
+        if max_version is not None:
+            self.context.maximum_version = max_version
+
+        self._server = socket.create_server(("127.0.0.1", port))
+        self.port = self._server.getsockname()[1]
+        self._running = False
+
+    def __repr__(self) -> str:
+        return f"TLSBroker(127.0.0.1:{self.port}, {self.broker})"
+
+    def start(self) -> "TLSBroker":
+        """Start accepting connections, in a background thread"""
+        self._running = True
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop accepting connections"""
+        self._running = False
+        self._server.close()
+
+    def publish(self, topic: str, payload: str | bytes, **kwargs) -> None:
+        """Broker.publish(), holding the lock"""
+        with self.lock:
+            self.broker.publish(topic, payload, **kwargs)
+
+    def _accept(self) -> None:
+        while self._running:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: socket.socket) -> None:
+        try:
+            conn = self.context.wrap_socket(conn, server_side=True)
+        except (ssl.SSLError, OSError):
+            conn.close()
+            return
+        self.handshakes += 1
+        if conn.session_reused:
+            self.resumed += 1
+
+        with self.lock:
+            client = self.broker.connect("127.0.0.1", self.port)
+        # pylint: disable-next=protected-access
+        inner = client._client
+
+        try:
+            while not client.closed:
+                if conn.pending():
+                    readable = [conn]
+                else:
+                    readable, _, _ = select.select([conn, inner], [], [], 1)
+                if conn in readable:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    with self.lock:
+                        client.write(data)
+                if inner in readable:
+                    data = inner.recv(65536)
+                    if not data:
+                        break
+                    conn.sendall(data)
+        except OSError:
+            pass
+        finally:
+            with self.lock:
+                client.hangup()
+            conn.close()
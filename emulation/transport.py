@@ -0,0 +1,109 @@
+"""
+MicroPython style stream socket over real TCP, for connecting emulated
+boards to an external broker
+"""
+
+import socket
+import ssl
+
+
+class TCPSocket:
+    """
+    TCP connection with the read/write interface of a MicroPython socket
+
+    read(n) and readinto() block for n bytes unless non-blocking, in which
+    case they return what has arrived, or None if nothing is waiting, as
+    EmulatedSocket does
+
+    Args:
+        host: broker host name or address
+        port: broker port
+        backend: Backend to count the bytes sent and received against
+    """
+
+    def __init__(self, host: str, port: int, backend=None):
+        self.backend = backend
+        self.closed = False
+        self._sock = socket.create_connection((host, port), timeout=10)
+        self._sock.settimeout(None)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def __repr__(self) -> str:
+        return f"TCPSocket({self._sock.getpeername() if not self.closed else 'closed'})"
+
+    def fileno(self) -> int:
+        return self._sock.fileno()
+
+    def setblocking(self, flag: bool) -> None:
+        self._sock.setblocking(flag)
+
+    def settimeout(self, timeout: float | None) -> None:
+        self._sock.settimeout(timeout)
+
+    def read(self, size: int) -> bytes | None:
+        try:
+            data = self._sock.recv(size)
+        except (BlockingIOError, ssl.SSLWantReadError):
+            return None
+        except OSError as exc:
+            raise OSError(str(exc)) from exc
+
+        # a blocking read waits for all of it, a non-blocking one returns
+        # whatever has arrived, as a MicroPython stream does
+        while data and len(data) < size and self._sock.getblocking():
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+
+        if data and self.backend is not None:
+            self.backend.bytes_received += len(data)
+        return data
+
+    def readinto(self, buffer) -> int | None:
+        data = self.read(len(buffer))
+        if data is None:
+            return None
+        buffer[: len(data)] = data
+        return len(data)
+
+    def write(self, data, length: int | None = None) -> int:
+        if self.closed:
+            raise OSError("socket closed")
+        if isinstance(data, str):
+            data = data.encode()
+        if length is not None:
+            data = data[:length]
+        blocking = self._sock.getblocking()
+        self._sock.setblocking(True)
+        try:
+            self._sock.sendall(data)
+        finally:
+            self._sock.setblocking(blocking)
+
+        if self.backend is not None:
+            self.backend.bytes_sent += len(data)
+        return len(data)
+
+    def send(self, data) -> int:
+        return self.write(data)
+
+    def start_tls(self, context, server_hostname: str | None = None) -> None:
+        """
+        Run a TLS handshake over the connection with `context`, which is
+        anything with an SSLContext style wrap_socket(), such as deviceos TLS
+        """
+        self._sock = context.wrap_socket(self._sock, server_hostname=server_hostname)
+
+    def close(self) -> None:
+        self.closed = True
+        self._sock.close()
+
+    def hangup(self) -> None:
+        """Shut the connection down, so the client sees it drop"""
+        if self.closed:
+            return
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
@@ -0,0 +1,12 @@
+# Freezes DeviceOS into a MicroPython firmware build, so that nothing needs to
+# be compiled (or even loaded into RAM) at boot. From the micropython repo:
+#
+#   make -C ports/rp2 BOARD=RPI_PICO_W FROZEN_MANIFEST=/path/to/DeviceOS/manifest.py
+#
+# The board manifest is included, to keep the modules the firmware ships with
+
+include("$(BOARD_DIR)/manifest.py")
+
+require("umqtt.simple")
+
+package("deviceos")
@@ -1,11 +1,29 @@
+"""
+Generates the mip package files
+
+    python setup.py          package.json, installing the .py sources
+    python setup.py --mpy    also compiles to .mpy with mpy-cross, and writes
+                             package-mpy.json, installing the bytecode
+
+Boards compile any .py module on import, which is slow and needs a lot of RAM
+at boot. The .mpy variant skips this, but must be built with an mpy-cross
+matching the bytecode version of the firmware. For the fastest boot, freeze
+the package into the firmware instead, using manifest.py
+"""
+
 from setuptools import find_packages  # or find_namespace_packages
 
 import os
 import re
 import json
+import shutil
+import subprocess
+import sys
 
 
 source_root = "deviceos"
+mpy_root = "mpy"
+repo = "github:ljbeal/DeviceOS"
 
 version_pattern = r"__version__\s*=\s*['\"](.*)['\"]"  # chatGPT, modifed
 
@@ -21,11 +39,12 @@ output = {
     "urls": [],
     "deps": [["umqtt.simple", "latest"]],
 }
-for package in packages:
+sources = []
+for package in sorted(packages):
 
     path = os.path.join(source_root, package.replace(".", "/"))
 
-    files = os.listdir(path)
+    files = sorted(os.listdir(path))
 
     for file in files:
         if file == "__pycache__":
@@ -36,9 +55,10 @@ for package in packages:
 
         source_path = f"{path}/{file}".replace("\\", "/")
         source_path = source_path.replace("//", "/")
-        url = f"github:ljbeal/DeviceOS/{source_path}"
+        url = f"{repo}/{source_path}"
 
         output["urls"].append([source_path, url])
+        sources.append(source_path)
 
         if file == "__init__.py":
             with open(source_path, encoding="utf8") as o:
@@ -55,3 +75,43 @@ if "version" not in output:
 
 with open("package.json", "w+", encoding="utf8") as o:
     json.dump(output, o, indent=2)
+
+
+def mpy_cross_command() -> list:
+    """Returns the command to run mpy-cross, from PATH or the pip package"""
+    binary = shutil.which("mpy-cross")
+    if binary is not None:
+        return [binary]
+    try:
+        import mpy_cross  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError as ex:
+        raise RuntimeError(
+            "mpy-cross not found, install it with `pip install mpy-cross`"
+        ) from ex
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+if "--mpy" in sys.argv:
+    command = mpy_cross_command()
+
+    output_mpy = {
+        "urls": [],
+        "deps": output["deps"],
+        "version": output["version"],
+    }
+    for source_path in sources:
+        target_path = source_path[:-3] + ".mpy"
+        compiled_path = f"{mpy_root}/{target_path}"
+        os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+
+        # -s keeps tracebacks pointing at the package path, not the build path
+        subprocess.run(
+            command + ["-s", source_path, "-o", compiled_path, source_path],
+            check=True,
+        )
+        print(f"compiled {source_path} -> {compiled_path}")
+
+        output_mpy["urls"].append([target_path, f"{repo}/{compiled_path}"])
+
+    with open("package-mpy.json", "w+", encoding="utf8") as o:
+        json.dump(output_mpy, o, indent=2)
@@ -0,0 +1,125 @@
+"""
+Boot-time profile of the DeviceOS imports
+
+Imports each module in turn, reporting the time and heap taken by it (and
+any of its dependencies which were not already imported). Run on a board
+with:
+
+    mpremote run tools/boot_profile.py
+
+Modules installed as .py are compiled on import, so compare against the .mpy
+or frozen builds to see the saving. If a secrets.py is present, the time
+from boot to the first state publish is reported too.
+
+This can also be run under CPython (using the emulation package), where
+only the relative import times are meaningful.
+"""
+
+import gc
+import sys
+import time
+
+try:
+    import machine  # pylint: disable=import-error,unused-import
+except ImportError:
+    sys.path.insert(0, ".")
+    import emulation
+
+    emulation.install()
+
+
+# in dependency order. Importing a package imports everything its __init__
+# does, so deviceos.board covers the Board and all of its mixins
+MODULES = (
+    "umqtt.simple",
+    "deviceos",
+    "deviceos.devices.io",
+    "deviceos.devices.device",
+    "deviceos.board",
+    "deviceos.devices.inbuilt.cpu",
+    "deviceos.devices.inbuilt.network",
+    "deviceos.devices.inbuilt.switch",
+    "deviceos.devices.inbuilt.metrics",
+)
+
+
+def mem_alloc() -> int | None:
+    """Returns the allocated heap, None if this cannot be measured"""
+    if hasattr(gc, "mem_alloc"):
+        gc.collect()
+        return gc.mem_alloc()
+    return None
+
+
+def profile_imports(modules: tuple = MODULES) -> list:
+    """
+    Import each of `modules` in order
+
+    Returns a list of (module, time in ms, heap growth in bytes)
+    """
+    results = []
+    for name in modules:
+        if name in sys.modules:
+            results.append((name, 0, 0))
+            continue
+        before = mem_alloc()
+        start = time.ticks_us()
+        __import__(name)
+        elapsed = time.ticks_diff(time.ticks_us(), start)
+        after = mem_alloc()
+        heap = None if before is None else after - before
+        results.append((name, elapsed / 1000, heap))
+    return results
+
+
+def time_to_first_publish(boot_us: int) -> float | None:
+    """
+    Create a Board from secrets.py, returning the ms from `boot_us` to the
+    first state publish
+    """
+    try:
+        import secrets as s  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    if not hasattr(s, "wifi"):
+        # CPython has its own secrets module
+        return None
+
+    # pylint: disable=import-outside-toplevel
+    from deviceos import Board
+    from deviceos.devices.inbuilt import CPU
+
+    board = Board(
+        wlan_ssid=s.wifi["ssid"],
+        wlan_pass=s.wifi["pass"],
+        mqtt_host=s.mqtt["host"],
+        mqtt_user=s.mqtt["user"],
+        mqtt_pass=s.mqtt["pass"],
+        name="DeviceOS_Profile",
+    )
+    board.add_device(CPU())
+    board.discover()
+    board.once(force=True)
+    return time.ticks_diff(time.ticks_us(), boot_us) / 1000
+
+
+def main() -> None:
+    boot = time.ticks_us()
+    results = profile_imports()
+
+    total_ms = 0
+    total_heap = None
+    print(f"{'module':<36} {'ms':>8} {'heap B':>8}")
+    for name, elapsed, heap in results:
+        total_ms += elapsed
+        if heap is not None:
+            total_heap = (total_heap or 0) + heap
+        print(f"{name:<36} {elapsed:>8.1f} {'-' if heap is None else heap:>8}")
+    print(f"{'total':<36} {total_ms:>8.1f} {'-' if total_heap is None else total_heap:>8}")
+
+    first_publish = time_to_first_publish(boot)
+    if first_publish is not None:
+        print(f"boot to first publish: {first_publish:.0f}ms")
+
+
+main()
@@ -0,0 +1,123 @@
+"""
+Load test a broker and Home Assistant with a fleet of emulated boards
+
+Runs `--boards` real deviceos Boards under CPython, concurrently on one
+asyncio loop, then reports message rates, bytes on the wire and how long
+each board took to complete discovery after booting, a reconnect storm, or
+Home Assistant coming online.
+
+Usage:
+
+    python tools/fleet_sim.py --boards 200 --duration 30
+    python tools/fleet_sim.py --host localhost --boards 2000 --interfaces 20 \\
+        --ramp 10 --storm 60 --online 90 --duration 120 --json fleet.json
+
+Without --host, the boards connect to the in-process broker, which is only
+suitable for small fleets. umqtt.simple waits for CONNACK and SUBACK with
+blocking reads, so against a remote broker each (re)connect stalls the loop
+for a round trip, a local broker is recommended.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emulation  # noqa: E402  pylint: disable=wrong-import-position
+
+emulation.install()
+
+from emulation.fleet import Fleet  # noqa: E402  pylint: disable=wrong-import-position
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"{report['boards']} boards x {report['interfaces']} interfaces, "
+        f"{report['online']} online after {report['seconds']}s"
+    )
+    print(
+        f"published: {report['published']} "
+        f"({report['published_per_s']}/s, peak {report['peak_published_per_s']}/s)"
+    )
+    print(f"received:  {report['received']}")
+    print(
+        f"bytes:     {report['bytes_sent']} sent, "
+        f"{report['bytes_received']} received, "
+        f"in {report['socket_writes']} writes"
+    )
+    if "keepalive_drops" in report:
+        print(f"keepalive drops: {report['keepalive_drops']}")
+    print("discovery completion (ms):")
+    for event, stats in report["discovery_ms"].items():
+        print(
+            f"  {event:<7} n={stats['count']:<6} p50={stats['p50']:<8} "
+            f"p90={stats['p90']:<8} p99={stats['p99']:<8} max={stats['max']}"
+        )
+    print(f"  pending {report['discovery_pending']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--boards", type=int, default=100)
+    parser.add_argument("--interfaces", type=int, default=10)
+    parser.add_argument("--per-device", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=15, help="seconds")
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--host", help="broker host, in-process broker if not given")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--user", default="")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--discovery-prefix", default="homeassistant")
+    parser.add_argument("--poll-ms", type=int, default=100, help="command poll")
+    parser.add_argument("--ramp", type=float, default=0, help="seconds to boot all")
+    parser.add_argument("--change", type=float, default=0.5)
+    parser.add_argument(
+        "--storm", type=float, action="append", default=[], help="seconds, repeatable"
+    )
+    parser.add_argument(
+        "--online", type=float, action="append", default=[], help="seconds, repeatable"
+    )
+    parser.add_argument("--persistent", action="store_true")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="show board output")
+    args = parser.parse_args()
+
+    fleet = Fleet(
+        size=args.boards,
+        interfaces=args.interfaces,
+        per_device=args.per_device,
+        interval=args.interval,
+        host=args.host,
+        port=args.port,
+        user=args.user,
+        password=args.password,
+        discovery_prefix=args.discovery_prefix,
+        command_poll_ms=args.poll_ms,
+        ramp=args.ramp,
+        change=args.change,
+        board_kwargs={"persistent_session": args.persistent},
+    )
+    print(f"running {fleet} for {args.duration}s")
+
+    with open(os.devnull, "w") as devnull:
+        # every board logs to stdout
+        quiet = contextlib.redirect_stdout(devnull)
+        if args.verbose:
+            quiet = contextlib.nullcontext()
+        with quiet:
+            report = asyncio.run(
+                fleet.run(args.duration, storms=args.storm, online_events=args.online)
+            )
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as o:
+            json.dump(report, o, indent=2)
+
+
+if __name__ == "__main__":
+    main()